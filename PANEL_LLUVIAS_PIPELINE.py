@@ -8,12 +8,26 @@ SCRIPTS = BASE / "scripts"
 PY = sys.executable
 
 PIPELINE = [
+    (SCRIPTS / "aemet_diarios.py", [], None),
+    (SCRIPTS / "normales.py", [], None),
+    (SCRIPTS / "percentiles.py", [], None),
     (SCRIPTS / "lluvias.py", [], None),
+    (SCRIPTS / "spi.py", [], None),
     (SCRIPTS / "temperaturas.py", [], None),
+    (SCRIPTS / "olas_calor.py", [], None),
+    (SCRIPTS / "interpolacion.py", [], None),
     (SCRIPTS / "avisos_aemet.py", [], None),
     (SCRIPTS / "estadisticas.py", [], None),
+    (SCRIPTS / "cubo.py", [], None),
     (SCRIPTS / "mar_temperatura_actual.py", [], None),
-    (SCRIPTS / "mar_comparacion.py", [], None)
+    (SCRIPTS / "mar_comparacion.py", [], None),
+    (SCRIPTS / "mar_olas_calor.py", [], None)
+]
+
+# python PANEL_LLUVIAS_PIPELINE.py --horario → solo mapas de lluvia y temperatura de las últimas 24 h
+PIPELINE_HORARIO = [
+    (SCRIPTS / "lluvias.py", ["--horario"], None),
+    (SCRIPTS / "temperaturas.py", ["--horario"], None),
 ]
 
 def run_step(script: Path, args: list[str], timeout: int | None):
@@ -25,7 +39,8 @@ def run_step(script: Path, args: list[str], timeout: int | None):
     subprocess.run(cmd, check=True, timeout=timeout, cwd=script.parent)
 
 def main():
-    for script, args, to in PIPELINE:
+    pasos = PIPELINE_HORARIO if "--horario" in sys.argv[1:] else PIPELINE
+    for script, args, to in pasos:
         run_step(script, args, to)
     print("\n✅ TODO HA SALIDO A PEDIR DE MILHOUSE.")
 
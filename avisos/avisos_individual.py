@@ -1,38 +1,13 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import pandas as pd
-import geopandas as gpd
-from shapely.ops import transform
-
-URL = "https://www.aemet.es/es/eltiempo/prediccion/avisos?r=1"
+import sys
+from pathlib import Path
 
-opts = webdriver.ChromeOptions()
-opts.add_argument("--headless=new")
-opts.add_argument("--lang=es-ES")
-opts.add_argument("--user-agent=Mozilla/5.0")
-driver = webdriver.Chrome(options=opts)
+import pandas as pd
 
-data = []
-headers = []
-try:
-    driver.get(URL)
-    WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".table")))
-    table = driver.find_element(By.CSS_SELECTOR, ".table")
-    ths = table.find_elements(By.CSS_SELECTOR, "thead tr th")
-    headers = [th.text.strip() for th in ths] if ths else []
-    for tr in table.find_elements(By.CSS_SELECTOR, "tbody tr"):
-        tds = tr.find_elements(By.CSS_SELECTOR, "td")
-        data.append([td.text.strip() for td in tds])
-finally:
-    driver.quit()
+# La sesión de navegador es la de scripts/avisos_navegador.py (una sola carga de la página)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from avisos_navegador import instantanea, tabla_avisos  # noqa: E402
 
-ncols = max((len(r) for r in data), default=0)
-if not headers or len(headers) != ncols:
-    headers = [f"col_{i+1}" for i in range(ncols)]
-data = [r + [""] * (ncols - len(r)) for r in data]
-df = pd.DataFrame(data, columns=headers)
+df = tabla_avisos(instantanea())
 
 drop_cols = [c for c in df.columns if c.strip().lower() in ("probabilidad", "comentario")]
 df = df.drop(columns=drop_cols, errors="ignore")
@@ -68,6 +43,9 @@ if col_inicio:
 if col_fin:
     df[col_fin] = only_time_series(df[col_fin].astype(str))
 
+# geopandas/shapely se importan aquí: si el scraping falla no se paga su carga
+import geopandas as gpd
+from shapely.ops import transform
 zonas_aemet = gpd.read_file("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/avisos/delimitaciones_aemet.geojson")
 df_geo = df.merge(zonas_aemet, left_on="zona", right_on="zona", how="left")
 df_geo = gpd.GeoDataFrame(df_geo, geometry="geometry", crs=zonas_aemet.crs)
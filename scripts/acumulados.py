@@ -0,0 +1,192 @@
+# acumulados.py
+# Estado de acumulados móviles por estación para estadisticas.py: los últimos 90 días de
+# precipitación y temperatura máxima en un búfer circular (estaciones × 90) y el acumulado
+# del año hidrológico (desde el 1 de octubre). Cada ejecución solo escribe los días nuevos
+# sobre el estado anterior; las ventanas de 7, 30 y 90 días se leen del búfer, así que el
+# coste por ejecución es O(estaciones) y no depende de la longitud del histórico.
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from estaciones import RUTA_BASE
+from normales import RUTA_HISTORICO, NormalesDiarias
+
+RUTA_ESTADO = Path(RUTA_BASE) / "complementarios_aemet" / "acumulados_estado.npz"
+DIAS_BUFER = 90
+VENTANAS = (7, 30, 90)
+MIN_COBERTURA = 0.8      # fracción de días con dato exigida en cada ventana
+MES_INICIO_ANIO_HIDRO = 10
+
+
+def inicio_anio_hidrologico(dia: np.datetime64) -> np.datetime64:
+    d = pd.Timestamp(dia)
+    anio = d.year if d.month >= MES_INICIO_ANIO_HIDRO else d.year - 1
+    return np.datetime64(f"{anio}-{MES_INICIO_ANIO_HIDRO:02d}-01", "D")
+
+
+class AcumuladosMoviles:
+    def __init__(self, n_estaciones: int = 0, ultimo_dia: np.datetime64 | None = None):
+        self.ultimo_dia = ultimo_dia
+        self.prec = np.full((n_estaciones, DIAS_BUFER), np.nan, dtype="float32")
+        self.tmax = np.full((n_estaciones, DIAS_BUFER), np.nan, dtype="float32")
+        self.hidro = np.zeros(n_estaciones, dtype="float64")
+        self.hidro_dias = np.zeros(n_estaciones, dtype="int16")
+        self.hidro_inicio = inicio_anio_hidrologico(ultimo_dia) if ultimo_dia is not None else None
+
+    @property
+    def n_estaciones(self) -> int:
+        return self.prec.shape[0]
+
+    # ---------- persistencia ----------
+    def guardar(self, ruta: Path = RUTA_ESTADO):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(ruta, ultimo_dia=np.array(self.ultimo_dia, dtype="datetime64[D]"),
+                            hidro_inicio=np.array(self.hidro_inicio, dtype="datetime64[D]"),
+                            prec=self.prec, tmax=self.tmax, hidro=self.hidro, hidro_dias=self.hidro_dias)
+
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_ESTADO) -> "AcumuladosMoviles | None":
+        if not ruta.exists():
+            return None
+        with np.load(ruta) as z:
+            estado = cls(0, z["ultimo_dia"][()])
+            estado.hidro_inicio = z["hidro_inicio"][()]
+            estado.prec, estado.tmax = z["prec"], z["tmax"]
+            estado.hidro, estado.hidro_dias = z["hidro"], z["hidro_dias"]
+        return estado
+
+    # ---------- actualización ----------
+    def _ampliar(self, n: int):
+        extra = n - self.n_estaciones
+        if extra <= 0:
+            return
+        vacio = np.full((extra, DIAS_BUFER), np.nan, dtype="float32")
+        self.prec = np.vstack([self.prec, vacio])
+        self.tmax = np.vstack([self.tmax, vacio])
+        self.hidro = np.concatenate([self.hidro, np.zeros(extra)])
+        self.hidro_dias = np.concatenate([self.hidro_dias, np.zeros(extra, dtype="int16")])
+
+    @staticmethod
+    def _columna(dia: np.datetime64) -> int:
+        return int(dia.astype("datetime64[D]").astype("int64") % DIAS_BUFER)
+
+    def _avanzar_a(self, dia: np.datetime64):
+        # Vacía las columnas de los días que entran en el búfer y reinicia el año hidrológico
+        if self.ultimo_dia is not None:
+            for d in np.arange(self.ultimo_dia + 1, dia + 1, dtype="datetime64[D]")[-DIAS_BUFER:]:
+                c = self._columna(d)
+                self.prec[:, c] = np.nan
+                self.tmax[:, c] = np.nan
+        else:
+            self.prec[:] = np.nan
+            self.tmax[:] = np.nan
+        inicio = inicio_anio_hidrologico(dia)
+        if self.hidro_inicio is None or inicio != self.hidro_inicio:
+            self.hidro[:] = 0.0
+            self.hidro_dias[:] = 0
+            self.hidro_inicio = inicio
+        self.ultimo_dia = dia
+
+    def anadir_dia(self, dia, ids: np.ndarray, prec: np.ndarray, tmax: np.ndarray) -> bool:
+        """Incorpora un día con los valores de las estaciones ``ids``. Un día ya incorporado
+        que siga en el búfer se sobrescribe (datos que llegan tarde o corregidos)."""
+        dia = np.datetime64(pd.Timestamp(dia).date(), "D")
+        if self.ultimo_dia is not None and dia <= self.ultimo_dia - DIAS_BUFER:
+            return False
+        self._ampliar(int(ids.max()) + 1 if len(ids) else 0)
+        if self.ultimo_dia is None or dia > self.ultimo_dia:
+            self._avanzar_a(dia)
+        c = self._columna(dia)
+        if dia >= self.hidro_inicio:
+            # El acumulado hidrológico descuenta lo que hubiera de ese día antes de sumar
+            antes = self.prec[ids, c]
+            previo = np.isfinite(antes)
+            np.add.at(self.hidro, ids[previo], -antes[previo])
+            np.add.at(self.hidro_dias, ids[previo], -1)
+            ok = np.isfinite(prec)
+            np.add.at(self.hidro, ids[ok], prec[ok])
+            np.add.at(self.hidro_dias, ids[ok], 1)
+        self.prec[ids, c] = prec
+        self.tmax[ids, c] = tmax
+        return True
+
+    def incorporar(self, diarios: pd.DataFrame) -> int:
+        """Añade, en orden de fecha, los días de ``diarios`` que caben en el búfer."""
+        fechas = pd.to_datetime(diarios["fecha"], errors="coerce").dt.normalize()
+        nuevos = 0
+        for dia, grupo in diarios.assign(_dia=fechas).dropna(subset=["_dia"]).groupby("_dia", sort=True):
+            ids = grupo["id_estacion"].to_numpy(dtype="int64")
+            ok = ids >= 0
+            prec, tmax = (pd.to_numeric(grupo[v], errors="coerce").to_numpy(dtype="float32") if v in grupo
+                          else np.full(len(ids), np.nan, dtype="float32") for v in ("prec", "tmax"))
+            nuevos += self.anadir_dia(dia, ids[ok], prec[ok], tmax[ok])
+        return nuevos
+
+    # ---------- consulta ----------
+    def _columnas(self, dias: int) -> np.ndarray:
+        fin = self._columna(self.ultimo_dia)
+        return (fin - np.arange(dias)) % DIAS_BUFER
+
+    def suma(self, dias: int) -> np.ndarray:
+        v = self.prec[:, self._columnas(dias)]
+        n = np.isfinite(v).sum(axis=1)
+        return np.where(n >= MIN_COBERTURA * dias, np.nansum(v, axis=1, dtype="float64"), np.nan)
+
+    def media_tmax(self, dias: int) -> np.ndarray:
+        v = self.tmax[:, self._columnas(dias)]
+        n = np.isfinite(v).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = np.nansum(v, axis=1, dtype="float64") / n
+        return np.where(n >= MIN_COBERTURA * dias, media, np.nan)
+
+    def dias_ventana(self, dias: int) -> pd.DatetimeIndex:
+        return pd.date_range(end=pd.Timestamp(self.ultimo_dia), periods=dias, freq="D")
+
+    def anio_hidrologico(self) -> np.ndarray:
+        dias_transcurridos = int((self.ultimo_dia - self.hidro_inicio).astype(int)) + 1
+        return np.where(self.hidro_dias >= MIN_COBERTURA * dias_transcurridos, self.hidro, np.nan)
+
+    def ultimo(self, variable: str = "prec") -> np.ndarray:
+        return getattr(self, variable)[:, self._columna(self.ultimo_dia)]
+
+
+def actualizar_estado(diarios: pd.DataFrame, ruta_historico: Path = RUTA_HISTORICO) -> AcumuladosMoviles | None:
+    """Estado anterior + días nuevos. Sin estado (o con un hueco mayor que el búfer) se
+    reconstruye una vez desde el histórico diario: del inicio del año hidrológico en adelante."""
+    estado = AcumuladosMoviles.cargar()
+    fechas = pd.to_datetime(diarios["fecha"], errors="coerce") if not diarios.empty else pd.Series(dtype="datetime64[ns]")
+    primero = fechas.min()
+    if estado is not None and pd.notna(primero) and \
+            np.datetime64(primero.date(), "D") > estado.ultimo_dia + DIAS_BUFER:
+        estado = None
+    if estado is None:
+        if not Path(ruta_historico).exists() and diarios.empty:
+            return None
+        estado = AcumuladosMoviles()
+        if Path(ruta_historico).exists():
+            historico = pd.read_pickle(ruta_historico)
+            f = pd.to_datetime(historico["fecha"], errors="coerce")
+            fin = f.max()
+            if pd.notna(fin):
+                desde = min(pd.Timestamp(inicio_anio_hidrologico(np.datetime64(fin.date(), "D"))),
+                            fin.normalize() - pd.Timedelta(days=DIAS_BUFER - 1))
+                estado.incorporar(historico.loc[f >= desde].reindex(columns=["id_estacion", "fecha", "prec", "tmax"]))
+    if not diarios.empty:
+        estado.incorporar(diarios)
+    if estado.ultimo_dia is None:
+        return None
+    estado.guardar()
+    return estado
+
+
+def normal_acumulada(ids: np.ndarray, dias: pd.DatetimeIndex) -> np.ndarray:
+    """Suma de la normal diaria de precipitación de cada estación en ``dias`` (NaN si falta)."""
+    ids = np.asarray(ids, dtype="int64")
+    normales = NormalesDiarias.cargar()
+    if normales is None or not len(ids):
+        return np.full(len(ids), np.nan)
+    valores = normales.valor("prec", np.repeat(ids, len(dias)), np.tile(dias.to_numpy(), len(ids)))
+    return valores.reshape(len(ids), len(dias)).sum(axis=1)
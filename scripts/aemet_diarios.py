@@ -0,0 +1,383 @@
+# aemet_diarios.py
+# Ingesta única de valores climatológicos diarios de AEMET para todos los paneles.
+# Cada estación-día se descarga una sola vez y se guardan TODOS los campos del payload
+# (prec, tmax, tmin, tmed, racha, sol…); lluvias.py y temperaturas.py leen de aquí.
+#
+# Uso:  python aemet_diarios.py
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests.exceptions import JSONDecodeError, HTTPError, Timeout, ConnectionError
+
+from api_keys import api_keys
+from aemet_payload import BufferColumnas, ESQUEMA_DIARIOS, registros
+from aemet_ritmo import ControlRitmo
+from estaciones import registro, ids_de
+from aemet_resiliencia import (
+    PresupuestoReintentos, Cortacircuitos, PresupuestoAgotado, CircuitoAbierto, PLAZO_PETICION_SEG,
+)
+
+# =========================
+# Configuración
+# =========================
+BASE = "https://opendata.aemet.es/opendata/api"
+_TZ_LOCAL = ZoneInfo("Europe/Madrid")
+
+RUTA_BASE = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/"
+RUTAS_INDICATIVOS = [
+    f"{RUTA_BASE}complementarios_lluvias/ids_estaciones.xlsx",
+    f"{RUTA_BASE}complementarios_temperaturas/ids_estaciones_reducido.xlsx",
+]
+DIR_AEMET      = Path(RUTA_BASE) / "complementarios_aemet"
+RUTA_DESCARGA  = DIR_AEMET / "diarios_ultimo.pkl"    # última descarga (todas las variables)
+RUTA_HISTORICO = DIR_AEMET / "historico_diario.pkl"  # acumulado estación-día
+RUTA_RITMO     = DIR_AEMET / "ritmo_claves.json"      # ritmo sostenible aprendido por clave
+RUTA_METRICAS  = DIR_AEMET / "metricas_descarga.json"
+
+_RITMO: ControlRitmo | None = None
+_PRESUPUESTO: PresupuestoReintentos | None = None
+_CIRCUITO: Cortacircuitos | None = None
+
+class SinDatosAEMET(RuntimeError):
+    pass
+
+# =========================
+# Descarga y helpers
+# =========================
+def sesion_reintentos() -> requests.Session:
+    # Sin reintentos en urllib3: todos los reintentos los gobierna aemet_descargar
+    # (presupuesto de la ejecución + plazo por petición + cortacircuitos)
+    s = requests.Session()
+    s.headers.update({"User-Agent": "aemet-downloader/1.1", "Connection": "close", "Accept": "application/json"})
+    s.mount("https://", HTTPAdapter(max_retries=Retry(total=0, raise_on_status=False)))
+    return s
+
+def _decode_json_with_bom(resp: requests.Response):
+    raw = resp.content.decode("utf-8-sig", errors="replace").strip()
+    return json.loads(raw)
+
+def _iter_api_keys(keys):
+    if isinstance(keys, str):
+        k = keys.strip()
+        if k:
+            yield k
+        return
+    if isinstance(keys, (list, tuple)):
+        for k in keys:
+            if isinstance(k, str) and k.strip():
+                yield k.strip()
+
+def control_ritmo() -> ControlRitmo:
+    global _RITMO
+    if _RITMO is None:
+        _RITMO = ControlRitmo(list(_iter_api_keys(api_keys)), ruta_estado=RUTA_RITMO)
+    return _RITMO
+
+def resiliencia() -> tuple[PresupuestoReintentos, Cortacircuitos]:
+    global _PRESUPUESTO, _CIRCUITO
+    if _PRESUPUESTO is None:
+        _PRESUPUESTO, _CIRCUITO = PresupuestoReintentos(), Cortacircuitos()
+    return _PRESUPUESTO, _CIRCUITO
+
+def reiniciar_presupuesto(**kwargs):
+    # Descargas largas por tramos (p. ej. relleno de histórico): presupuesto nuevo por tramo
+    global _PRESUPUESTO, _CIRCUITO
+    _PRESUPUESTO, _CIRCUITO = PresupuestoReintentos(**kwargs), Cortacircuitos()
+
+def _timeout(limite: float, conexion: float, lectura: float) -> tuple[float, float]:
+    restante = max(limite - time.monotonic(), 1.0)
+    return min(conexion, restante), min(lectura, restante)
+
+def aemet_descargar(endpoint: str, params_extra: dict | None = None, rondas: int = 2,
+                    plazo_seg: float = PLAZO_PETICION_SEG) -> bytes:
+    s = sesion_reintentos()
+    url = f"{BASE}/{endpoint.lstrip('/')}"
+    if "?" in url and "api_key=" in url:
+        raise ValueError("No incluyas ?api_key= en el endpoint")
+    ritmo = control_ritmo()
+    if not ritmo.claves:
+        raise RuntimeError("No hay API key configurada.")
+
+    presupuesto, circuito = resiliencia()
+    circuito.permitir()
+    if presupuesto.restante_seg() <= 0:
+        raise PresupuestoAgotado("Tiempo máximo de descarga agotado.")
+    limite = presupuesto.plazo(plazo_seg)
+
+    errores = []
+    por_429 = False     # el último intento acabó en 429: abortar por plazo no es fallo del servicio
+    for intento in range(rondas * len(ritmo.claves)):
+        if intento > 0:
+            if time.monotonic() >= limite:
+                errores.append(f"plazo de {plazo_seg:.0f}s agotado")
+                break
+            try:
+                presupuesto.consumir()
+            except PresupuestoAgotado as e:
+                errores.append(str(e))
+                break
+        key = ritmo.orden_claves()[0]
+        idx = ritmo.claves.index(key) + 1
+        if not ritmo.esperar(key, limite=limite):
+            errores.append(f"[key#{idx}] turno de la clave fuera del plazo de {plazo_seg:.0f}s")
+            break
+        params = {"api_key": key}
+        if params_extra:
+            params.update(params_extra)
+        por_429 = False
+        try:
+            r = s.get(url, params=params, timeout=_timeout(limite, 5, 45))
+            if r.status_code == 429:
+                espera = ritmo.limitada(key, r.headers.get("Retry-After"))
+                errores.append(f"[key#{idx}] HTTP 429 (espera {espera:.0f}s, ritmo → {ritmo.ritmo[key]:.2f}/s)")
+                por_429 = True
+                continue
+            r.raise_for_status()
+            try:
+                meta = _decode_json_with_bom(r)
+            except JSONDecodeError:
+                ct = r.headers.get("Content-Type", "")
+                snippet = r.content[:120].decode("utf-8", "replace")
+                errores.append(f"[key#{idx}] No-JSON (CT={ct}). Cuerpo≈ {snippet!r}")
+                continue
+            # AEMET también comunica el estado dentro del JSON con HTTP 200
+            estado = meta.get("estado")
+            if estado == 429:
+                espera = ritmo.limitada(key, r.headers.get("Retry-After"))
+                errores.append(f"[key#{idx}] estado 429 (espera {espera:.0f}s, ritmo → {ritmo.ritmo[key]:.2f}/s)")
+                por_429 = True
+                continue
+            if estado == 404:
+                ritmo.exito(key)
+                circuito.exito()
+                raise SinDatosAEMET(meta.get("descripcion", "Sin datos"))
+            if "datos" not in meta:
+                errores.append(f"[key#{idx}] Sin 'datos': {meta}")
+                continue
+            ritmo.exito(key)
+            r2 = s.get(meta["datos"], timeout=_timeout(limite, 5, 60))
+            r2.raise_for_status()
+            circuito.exito()
+            return r2.content
+        except SinDatosAEMET:
+            raise
+        except HTTPError as e:
+            code = getattr(e.response, "status_code", "¿?")
+            ct = getattr(e.response, "headers", {}).get("Content-Type", "")
+            body = (getattr(e.response, "text", "") or "")[:160]
+            errores.append(f"[key#{idx}] HTTP {code} (CT={ct}) {body!r}")
+        except (Timeout, ConnectionError) as e:
+            errores.append(f"[key#{idx}] Red: {type(e).__name__}: {e}")
+        except Exception as e:
+            errores.append(f"[key#{idx}] Excepción: {type(e).__name__}: {e}")
+
+    if not por_429:
+        circuito.fallo()
+    resumen = "\n - ".join(errores) if errores else "Sin detalles."
+    raise RuntimeError(f"No se pudo descargar con ninguna API key. Detalles:\n - {resumen}")
+
+def guardar_metricas(extra: dict | None = None, ruta: Path = RUTA_METRICAS) -> dict:
+    ritmo = control_ritmo()
+    ritmo.guardar()
+    presupuesto, circuito = resiliencia()
+    metricas = {
+        "fecha": datetime.now(_TZ_LOCAL).isoformat(timespec="seconds"),
+        **ritmo.metricas(),
+        "reintentos_usados": presupuesto.usados,
+        "reintentos_presupuesto": presupuesto.total,
+        "aperturas_circuito": circuito.aperturas,
+        **(extra or {}),
+    }
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps(metricas, indent=1, ensure_ascii=False), encoding="utf-8")
+    return metricas
+
+# ===== Sonda rápida + selección del último día con datos =====
+def _probe_aemet_rapido(indicativo: str, fecha: datetime.date) -> bool:
+    # Por aemet_descargar: la sonda respeta el ritmo por clave y el presupuesto de reintentos,
+    # y sus 429 también ajustan el ritmo de la clave
+    fechaini = f"{fecha:%Y-%m-%d}T00:00:00UTC"
+    fechafin = f"{fecha:%Y-%m-%d}T23:59:00UTC"
+    endpoint = f"valores/climatologicos/diarios/datos/fechaini/{fechaini}/fechafin/{fechafin}/estacion/{indicativo}"
+    try:
+        contenido = aemet_descargar(endpoint)
+    except (SinDatosAEMET, CircuitoAbierto, PresupuestoAgotado, RuntimeError):
+        return False
+    if not contenido or len(contenido) < 5:
+        return False
+    return len(registros(contenido)) > 0
+
+def _fecha_aemet_mas_reciente(indicativo: str, max_retraso: int = 5, deadline_seg: int = 40) -> tuple[str, str]:
+    import time as _time
+    t0 = _time.monotonic()
+    hoy_local = datetime.now(_TZ_LOCAL).date()
+    if not control_ritmo().claves:
+        raise RuntimeError("No hay API key configurada.")
+    for delta in range(1, max_retraso + 1):
+        if _time.monotonic() - t0 > deadline_seg:
+            break
+        candidato = hoy_local - timedelta(days=delta)
+        if _probe_aemet_rapido(indicativo, candidato):
+            fechaini = f"{candidato:%Y-%m-%d}T00:00:00UTC"
+            fechafin = f"{candidato:%Y-%m-%d}T23:59:00UTC"
+            return fechaini, fechafin
+    candidato = hoy_local - timedelta(days=max_retraso)
+    return (f"{candidato:%Y-%m-%d}T00:00:00UTC", f"{candidato:%Y-%m-%d}T23:59:00UTC")
+
+
+# =========================
+# Indicativos y fechas
+# =========================
+def leer_indicativos(ruta: str | Path, hoja: int | str = 0, columna: str = "indicativo") -> list[str]:
+    tabla = pd.read_excel(ruta, sheet_name=hoja, dtype={columna: str})
+    if columna not in tabla.columns:
+        raise ValueError(f"No se encuentra la columna '{columna}' en {ruta}")
+    return (
+        tabla[columna].dropna().astype(str).str.strip().str.upper()
+        .replace("", pd.NA).dropna().unique().tolist()
+    )
+
+def determinar_fechas(indicativos: list[str]) -> tuple[str, str]:
+    # Detectar el día más reciente con datos (sonda rápida, 1-3 indicativos)
+    print("Determinando día más reciente con datos (sonda rápida)…")
+    for probe in indicativos[:3]:
+        print(f"  · probando {probe}…", end="", flush=True)
+        try:
+            fechaini, fechafin = _fecha_aemet_mas_reciente(probe, max_retraso=5, deadline_seg=40)
+            print(f" OK → {fechaini} → {fechafin}")
+            return fechaini, fechafin
+        except Exception as e:
+            print(f" falló ({e})")
+    candidato = datetime.now(_TZ_LOCAL).date() - timedelta(days=5)
+    fechaini = f"{candidato:%Y-%m-%d}T00:00:00UTC"
+    fechafin = f"{candidato:%Y-%m-%d}T23:59:00UTC"
+    print(f"AVISO: usando fallback {fechaini} → {fechafin}")
+    return fechaini, fechafin
+
+# =========================
+# Descarga multivariable
+# =========================
+def descargar_diarios(
+    indicativos: list[str],
+    fechaini: str | None = None,
+    fechafin: str | None = None,
+) -> pd.DataFrame:
+    if fechaini is None or fechafin is None:
+        fechaini, fechafin = determinar_fechas(indicativos)
+
+    buffer = BufferColumnas(ESQUEMA_DIARIOS, capacidad=len(indicativos))
+    total = len(indicativos)
+    estados = {"ok": 0, "vacias": 0, "sin_datos": 0, "error": 0, "omitidas": 0}
+
+    for i, ind in enumerate(indicativos, start=1):
+        try:
+            endpoint = f"/valores/climatologicos/diarios/datos/fechaini/{fechaini}/fechafin/{fechafin}/estacion/{ind}"
+            contenido = aemet_descargar(endpoint, params_extra=None)
+            n = buffer.anadir(contenido, valores_por_defecto={"indicativo": ind})
+            if n == 0:
+                estados["vacias"] += 1
+                print(f"[{i}/{total}] {ind}: vacío tras parseo")
+                continue
+            estados["ok"] += 1
+            print(f"[{i}/{total}] {ind}: OK ({n} filas) · ritmo {control_ritmo().ritmo_agregado():.2f} pet/s")
+        except SinDatosAEMET as e:
+            estados["sin_datos"] += 1
+            print(f"[{i}/{total}] {ind}: sin datos ({e})")
+        except (CircuitoAbierto, PresupuestoAgotado) as e:
+            # Fallo rápido: no se intenta la estación
+            if estados["omitidas"] == 0:
+                print(f"[{i}/{total}] {ind}: {e} Se omiten las estaciones restantes mientras dure.")
+            estados["omitidas"] += 1
+        except Exception as e:
+            estados["error"] += 1
+            print(f"[{i}/{total}] {ind}: ERROR -> {e}")
+
+    presupuesto, circuito = resiliencia()
+    degradado = estados["omitidas"] > 0 or circuito.aperturas > 0 or presupuesto.agotado()
+    metricas = guardar_metricas({"degradado": degradado, "estaciones": estados})
+    print(f"Ritmo AEMET: {metricas['ritmo_agregado_rps']} pet/s agregado · "
+          f"{metricas['peticiones']} peticiones · {metricas['respuestas_429']} respuestas 429 · "
+          f"reintentos {presupuesto.usados}/{presupuesto.total}")
+    if degradado:
+        print(f"AVISO: ejecución DEGRADADA ({estados['omitidas']} estaciones omitidas, "
+              f"{estados['error']} con error, circuito abierto {circuito.aperturas} veces).")
+    return con_id_estacion(buffer.a_dataframe())
+
+def con_id_estacion(df: pd.DataFrame) -> pd.DataFrame:
+    # Clave entera del registro de estaciones; el indicativo queda como categoría
+    if df.empty:
+        return df
+    reg = registro()
+    reg.actualizar_desde_tabla(df.drop_duplicates("indicativo", keep="last"))
+    df.insert(0, "id_estacion", reg.ids_de(df["indicativo"]))
+    if reg.modificado:
+        reg.guardar()
+    df["indicativo"] = df["indicativo"].astype("category")
+    return df
+
+# =========================
+# Almacenamiento local
+# =========================
+def guardar_descarga(df: pd.DataFrame, ruta: Path = RUTA_DESCARGA, ruta_historico: Path = RUTA_HISTORICO):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    df.to_pickle(ruta)
+    anadir_a_historico(df, ruta_historico)
+
+def anadir_a_historico(df: pd.DataFrame, ruta_historico: Path = RUTA_HISTORICO):
+    if df.empty:
+        return
+    ruta_historico.parent.mkdir(parents=True, exist_ok=True)
+    historico = pd.read_pickle(ruta_historico) if ruta_historico.exists() else pd.DataFrame()
+    if not historico.empty and "id_estacion" not in historico.columns:
+        historico = con_id_estacion(historico)
+    historico = pd.concat([historico, df], ignore_index=True, sort=False)
+    historico = historico.drop_duplicates(subset=["id_estacion", "fecha"], keep="last")
+    historico["indicativo"] = historico["indicativo"].astype("category")
+    historico.to_pickle(ruta_historico)
+
+def cargar_descarga(indicativos: list[str] | None = None, ruta: Path = RUTA_DESCARGA) -> pd.DataFrame | None:
+    # Solo se reutiliza la descarga compartida si es de hoy (hora local)
+    if not ruta.exists():
+        return None
+    modificado = datetime.fromtimestamp(ruta.stat().st_mtime, _TZ_LOCAL).date()
+    if modificado != datetime.now(_TZ_LOCAL).date():
+        return None
+    df = pd.read_pickle(ruta)
+    if indicativos is not None and not df.empty:
+        if "id_estacion" not in df.columns:
+            df = con_id_estacion(df)
+        df = df[df["id_estacion"].isin(ids_de(indicativos))]
+    return df
+
+def obtener_diarios(indicativos: list[str]) -> pd.DataFrame:
+    # Punto de entrada de los paneles: descarga compartida de hoy o, si falta, descarga propia
+    df = cargar_descarga(indicativos)
+    if df is not None:
+        print(f"Usando descarga compartida de hoy ({len(df)} filas, {RUTA_DESCARGA.name}).")
+        return df
+    print("AVISO: no hay descarga compartida de hoy; descargando estas estaciones…")
+    return descargar_diarios(indicativos)
+
+# =========================
+# Main
+# =========================
+if __name__ == "__main__":
+    indicativos: list[str] = []
+    for ruta in RUTAS_INDICATIVOS:
+        for ind in leer_indicativos(ruta):
+            if ind not in indicativos:
+                indicativos.append(ind)
+    print(f"Descargando {len(indicativos)} estaciones (unión de paneles)…")
+    df = descargar_diarios(indicativos)
+    guardar_descarga(df)
+    cols = ", ".join(map(str, df.columns)) if not df.empty else "—"
+    print(f"Guardado {RUTA_DESCARGA} ({len(df)} filas). Campos: {cols}")
@@ -0,0 +1,89 @@
+# aemet_horario.py
+# Modo casi en tiempo real: observaciones horarias de las últimas 24 h de TODAS las estaciones
+# (/observacion/convencional/todas) en una sola petición. Se agregan por indicativo
+# (precipitación acumulada y temperatura máxima) con la misma forma que la ingesta diaria,
+# de modo que lluvias.py y temperaturas.py las tratan igual (opción --horario).
+#
+# Uso:  python aemet_horario.py
+from __future__ import annotations
+
+from datetime import datetime
+
+import pandas as pd
+
+from aemet_diarios import aemet_descargar, guardar_metricas, con_id_estacion, DIR_AEMET, _TZ_LOCAL
+from estaciones import ids_de
+from aemet_payload import BufferColumnas, NUM, TEXTO, FECHA
+
+# =========================
+# Configuración
+# =========================
+ENDPOINT_HORARIO = "/observacion/convencional/todas"
+RUTA_HORARIO     = DIR_AEMET / "horarios_ultimo.pkl"
+HORAS_ACUMULADO  = 24
+
+# Campos de /observacion/convencional/todas que usan los paneles
+ESQUEMA_HORARIO: dict[str, str] = {
+    "idema": TEXTO, "ubi": TEXTO, "fint": FECHA, "lat": NUM, "lon": NUM, "alt": NUM,
+    "prec": NUM, "ta": NUM, "tamax": NUM, "tamin": NUM,
+}
+
+# =========================
+# Descarga
+# =========================
+def descargar_horarios() -> pd.DataFrame:
+    contenido = aemet_descargar(ENDPOINT_HORARIO)
+    buffer = BufferColumnas(ESQUEMA_HORARIO, capacidad=24 * 1000)
+    n = buffer.anadir(contenido)
+    guardar_metricas({"modo": "horario", "observaciones": n})
+    df = buffer.a_dataframe().reindex(columns=list(ESQUEMA_HORARIO))
+    # fint llega en UTC
+    fint = pd.to_datetime(df["fint"], errors="coerce")
+    df["fint"] = fint.dt.tz_localize("UTC") if fint.dt.tz is None else fint.dt.tz_convert("UTC")
+    return df.drop_duplicates(subset=["idema", "fint"], keep="last")
+
+# =========================
+# Agregación por indicativo
+# =========================
+def agregar_horarios(df: pd.DataFrame, horas: int = HORAS_ACUMULADO, ahora: datetime | None = None) -> pd.DataFrame:
+    """Una fila por indicativo: prec acumulada y tmax de las últimas ``horas`` observadas.
+
+    'prec' de cada observación es la caída en la hora previa, así que el acumulado es la suma;
+    la máxima usa 'tamax' (máxima de la hora) y, si la estación no la da, 'ta'.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["indicativo", "fecha", "prec", "tmax", "horas_observadas",
+                                     "ultima_observacion", "antiguedad_horas"])
+    fin = df["fint"].max()
+    df = df[df["fint"] > fin - pd.Timedelta(hours=horas)]
+    tmax_hora = df["tamax"].fillna(df["ta"])
+    g = df.assign(tmax_hora=tmax_hora).groupby("idema", sort=False)
+
+    agregado = pd.DataFrame({
+        "prec": g["prec"].sum(min_count=1),
+        "tmax": g["tmax_hora"].max(),
+        "horas_observadas": g["fint"].size(),
+        "ultima_observacion": g["fint"].max(),
+    })
+    ahora_utc = pd.Timestamp(ahora or datetime.now(_TZ_LOCAL)).tz_convert("UTC")
+    agregado["antiguedad_horas"] = ((ahora_utc - agregado["ultima_observacion"]).dt.total_seconds() / 3600).round(1)
+    local = agregado["ultima_observacion"].dt.tz_convert(_TZ_LOCAL)
+    agregado["fecha"] = local.dt.tz_localize(None).dt.normalize()
+    agregado["ultima_observacion"] = local.dt.strftime("%Y-%m-%d %H:%M")
+    agregado.index = agregado.index.astype(str).str.strip().str.upper()
+    return agregado.rename_axis("indicativo").reset_index()
+
+def obtener_horarios(indicativos: list[str] | None = None, horas: int = HORAS_ACUMULADO) -> pd.DataFrame:
+    df = descargar_horarios()
+    RUTA_HORARIO.parent.mkdir(parents=True, exist_ok=True)
+    df.to_pickle(RUTA_HORARIO)
+    agregado = con_id_estacion(agregar_horarios(df, horas=horas))
+    if indicativos is not None:
+        agregado = agregado[agregado["id_estacion"].isin(ids_de(indicativos))]
+    return agregado.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    df = obtener_horarios()
+    print(f"Estaciones: {len(df)} · última observación: {df['ultima_observacion'].max() if len(df) else '—'}")
+    print(f"Guardado {RUTA_HORARIO}")
@@ -0,0 +1,135 @@
+# aemet_payload.py
+# Parser de respuestas 'datos' de AEMET guiado por esquema: trabaja sobre los bytes de la
+# respuesta, convierte las convenciones de AEMET (coma decimal, "Ip" = precipitación
+# inapreciable) y vuelca cada registro en buffers de columna preasignados. El DataFrame
+# tipado se construye una única vez al final, no uno por estación.
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+NUM, TEXTO, FECHA = "num", "texto", "fecha"
+
+# Campos de /valores/climatologicos/diarios/datos
+ESQUEMA_DIARIOS: dict[str, str] = {
+    "indicativo": TEXTO, "fecha": FECHA, "nombre": TEXTO, "provincia": TEXTO,
+    "altitud": NUM, "prec": NUM, "tmed": NUM, "tmin": NUM, "horatmin": TEXTO,
+    "tmax": NUM, "horatmax": TEXTO, "dir": NUM, "velmedia": NUM, "racha": NUM,
+    "horaracha": TEXTO, "sol": NUM, "presMax": NUM, "horaPresMax": TEXTO,
+    "presMin": NUM, "horaPresMin": TEXTO, "hrMedia": NUM, "hrMax": NUM,
+    "horaHrMax": TEXTO, "hrMin": NUM, "horaHrMin": TEXTO,
+}
+
+# Valores no numéricos con significado propio en AEMET
+ESPECIALES_NUM = {"ip": 0.0, "acum": math.nan, "varias": math.nan, "": math.nan}
+
+
+def a_numero(v) -> float:
+    if v is None:
+        return math.nan
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v).strip()
+    esp = ESPECIALES_NUM.get(s.lower())
+    if esp is not None:
+        return esp
+    try:
+        return float(s.replace(",", "."))
+    except ValueError:
+        return math.nan
+
+
+def decodificar(contenido: bytes) -> str:
+    # Los 'datos' de AEMET llegan en UTF-8 o ISO-8859-15 según el producto
+    try:
+        return contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return contenido.decode("latin-1")
+
+
+def registros(contenido: bytes) -> list[dict]:
+    texto = decodificar(contenido).strip()
+    if not texto:
+        return []
+    if texto[0] in "[{":
+        obj = json.loads(texto)
+        if isinstance(obj, dict):
+            return [obj]
+        return [r for r in obj if isinstance(r, dict)]
+    return list(csv.DictReader(io.StringIO(texto), delimiter=";"))
+
+
+class BufferColumnas:
+    """Buffers de columna preasignados (capacidad doblada al llenarse)."""
+
+    def __init__(self, esquema: dict[str, str] = ESQUEMA_DIARIOS, capacidad: int = 1024):
+        self.esquema = dict(esquema)
+        self.n = 0
+        self._cap = max(int(capacidad), 1)
+        self._cols = {c: self._nuevo(t, self._cap) for c, t in self.esquema.items()}
+
+    @staticmethod
+    def _nuevo(tipo: str, cap: int) -> np.ndarray:
+        if tipo == NUM:
+            return np.full(cap, np.nan, dtype="float64")
+        return np.full(cap, None, dtype=object)
+
+    def _crecer(self, minimo: int):
+        cap = self._cap
+        while cap < minimo:
+            cap *= 2
+        for c, t in self.esquema.items():
+            nuevo = self._nuevo(t, cap)
+            nuevo[: self.n] = self._cols[c][: self.n]
+            self._cols[c] = nuevo
+        self._cap = cap
+
+    def anadir_registros(self, filas: list[dict], valores_por_defecto: dict | None = None) -> int:
+        if not filas:
+            return 0
+        if self.n + len(filas) > self._cap:
+            self._crecer(self.n + len(filas))
+        i0 = self.n
+        defecto = valores_por_defecto or {}
+        for c, tipo in self.esquema.items():
+            col = self._cols[c]
+            d = defecto.get(c)
+            if tipo == NUM:
+                for k, fila in enumerate(filas):
+                    col[i0 + k] = a_numero(fila.get(c, d))
+            else:
+                for k, fila in enumerate(filas):
+                    v = fila.get(c, d)
+                    col[i0 + k] = None if v is None else str(v).strip()
+        self.n += len(filas)
+        return len(filas)
+
+    def anadir(self, contenido: bytes, valores_por_defecto: dict | None = None) -> int:
+        return self.anadir_registros(registros(contenido), valores_por_defecto)
+
+    def a_dataframe(self) -> pd.DataFrame:
+        datos = {}
+        for c, tipo in self.esquema.items():
+            col = self._cols[c][: self.n]
+            if tipo == FECHA:
+                datos[c] = pd.to_datetime(col, errors="coerce")
+            elif tipo == NUM:
+                datos[c] = col.copy()
+            else:
+                datos[c] = pd.array(col, dtype="string")
+        df = pd.DataFrame(datos)
+        # Columnas que no vinieron en ningún registro
+        vacias = [c for c in df.columns if c not in ("indicativo", "fecha") and df[c].isna().all()]
+        return df.drop(columns=vacias)
+
+
+def parsear(contenido: bytes, esquema: dict[str, str] = ESQUEMA_DIARIOS) -> pd.DataFrame:
+    buf = BufferColumnas(esquema, capacidad=64)
+    buf.anadir(contenido)
+    return buf.a_dataframe()
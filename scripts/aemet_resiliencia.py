@@ -0,0 +1,76 @@
+# aemet_resiliencia.py
+# Límites de una ejecución contra AEMET: presupuesto único de reintentos, plazo por petición
+# y cortacircuitos. Sustituye a los reintentos apilados en varias capas (urllib3 × claves ×
+# espera por 429) para que el peor caso de una ejecución quede acotado.
+
+from __future__ import annotations
+
+import time
+
+REINTENTOS_RUN = 60          # reintentos totales permitidos en toda la ejecución
+DURACION_MAX_RUN_SEG = 1200  # tope de duración de la fase de descarga
+PLAZO_PETICION_SEG = 90.0    # tiempo máximo por petición lógica (todas sus tentativas); más que
+                             # ESPERA_429_SIN_CABECERA para que tras un 429 quede un reintento
+UMBRAL_FALLOS = 6            # fallos consecutivos que abren el circuito
+ENFRIAMIENTO_SEG = 90.0      # tras este tiempo abierto se deja pasar una petición de prueba
+
+
+class PresupuestoAgotado(RuntimeError):
+    pass
+
+
+class CircuitoAbierto(RuntimeError):
+    pass
+
+
+class PresupuestoReintentos:
+    def __init__(self, reintentos: int = REINTENTOS_RUN, duracion_max_seg: float = DURACION_MAX_RUN_SEG):
+        self.total = int(reintentos)
+        self.usados = 0
+        self.fin = time.monotonic() + float(duracion_max_seg)
+
+    def restante_seg(self) -> float:
+        return self.fin - time.monotonic()
+
+    def agotado(self) -> bool:
+        return self.usados >= self.total or self.restante_seg() <= 0
+
+    def consumir(self):
+        if self.agotado():
+            raise PresupuestoAgotado(f"Presupuesto de reintentos agotado ({self.usados}/{self.total}).")
+        self.usados += 1
+
+    def plazo(self, plazo_peticion: float = PLAZO_PETICION_SEG) -> float:
+        # Instante (monotonic) límite de una petición: nunca más allá del fin de la ejecución
+        return min(time.monotonic() + plazo_peticion, self.fin)
+
+
+class Cortacircuitos:
+    def __init__(self, umbral: int = UMBRAL_FALLOS, enfriamiento_seg: float = ENFRIAMIENTO_SEG):
+        self.umbral = int(umbral)
+        self.enfriamiento_seg = float(enfriamiento_seg)
+        self.fallos_seguidos = 0
+        self.abierto_desde: float | None = None
+        self.aperturas = 0
+
+    @property
+    def abierto(self) -> bool:
+        return self.abierto_desde is not None
+
+    def permitir(self):
+        if self.abierto_desde is None:
+            return
+        if time.monotonic() - self.abierto_desde >= self.enfriamiento_seg:
+            return  # semiabierto: pasa una petición de prueba
+        raise CircuitoAbierto(f"Circuito abierto tras {self.fallos_seguidos} fallos consecutivos.")
+
+    def exito(self):
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+
+    def fallo(self):
+        self.fallos_seguidos += 1
+        if self.fallos_seguidos >= self.umbral:
+            if self.abierto_desde is None:
+                self.aperturas += 1
+            self.abierto_desde = time.monotonic()
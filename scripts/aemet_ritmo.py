@@ -0,0 +1,117 @@
+# aemet_ritmo.py
+# Control adaptativo del ritmo de peticiones a AEMET por API key (AIMD):
+#  - cada respuesta correcta sube el ritmo de esa clave un incremento fijo;
+#  - cada 429 lo multiplica por un factor < 1 y bloquea la clave lo que diga Retry-After.
+# El ritmo aprendido se guarda entre ejecuciones, así cada día se arranca desde el último
+# ritmo sostenible en lugar de desde el peor caso.
+
+from __future__ import annotations
+
+import json
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from pathlib import Path
+
+RITMO_INICIAL = 0.6        # peticiones/segundo por clave (≈ la pausa fija de 1,5 s)
+RITMO_MIN = 0.02
+RITMO_MAX = 4.0
+INCREMENTO = 0.05          # aumento aditivo por éxito
+FACTOR_REDUCCION = 0.5     # reducción multiplicativa por 429
+ESPERA_429_SIN_CABECERA = 60.0
+
+
+def segundos_retry_after(valor: str | None, por_defecto: float = ESPERA_429_SIN_CABECERA) -> float:
+    # Retry-After puede ser un número de segundos o una fecha HTTP
+    if not valor:
+        return por_defecto
+    valor = valor.strip()
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return por_defecto
+
+
+class ControlRitmo:
+    def __init__(self, claves: list[str], ruta_estado: Path | None = None):
+        self.ruta_estado = Path(ruta_estado) if ruta_estado else None
+        previo = self._leer_estado()
+        ahora = time.monotonic()
+        self.claves = list(claves)
+        self.ritmo = {k: float(previo.get(self._id(k), RITMO_INICIAL)) for k in self.claves}
+        self.disponible = {k: ahora for k in self.claves}
+        self.peticiones = {k: 0 for k in self.claves}
+        self.limitadas = {k: 0 for k in self.claves}
+
+    @staticmethod
+    def _id(clave: str) -> str:
+        # No se persiste la clave, solo su final
+        return clave[-12:]
+
+    def _leer_estado(self) -> dict:
+        if self.ruta_estado and self.ruta_estado.exists():
+            try:
+                return json.loads(self.ruta_estado.read_text(encoding="utf-8")).get("ritmo", {})
+            except Exception:
+                return {}
+        return {}
+
+    def guardar(self):
+        if not self.ruta_estado:
+            return
+        self.ruta_estado.parent.mkdir(parents=True, exist_ok=True)
+        estado = {"actualizado": datetime.now().isoformat(timespec="seconds"),
+                  "ritmo": {self._id(k): round(v, 4) for k, v in self.ritmo.items()}}
+        self.ruta_estado.write_text(json.dumps(estado, indent=1), encoding="utf-8")
+
+    # ---------- planificación ----------
+    def orden_claves(self) -> list[str]:
+        # Primero la clave que antes queda libre
+        return sorted(self.claves, key=lambda k: self.disponible[k])
+
+    def esperar(self, clave: str, limite: float | None = None) -> bool:
+        """Duerme hasta el turno de la clave. Devuelve False si eso supera ``limite`` (monotonic)."""
+        espera = self.disponible[clave] - time.monotonic()
+        if limite is not None and time.monotonic() + max(espera, 0.0) > limite:
+            return False
+        if espera > 0:
+            time.sleep(espera)
+        ahora = time.monotonic()
+        self.disponible[clave] = ahora + 1.0 / self.ritmo[clave]
+        self.peticiones[clave] += 1
+        return True
+
+    # ---------- realimentación ----------
+    def exito(self, clave: str):
+        self.ritmo[clave] = min(RITMO_MAX, self.ritmo[clave] + INCREMENTO)
+
+    def limitada(self, clave: str, retry_after: str | None = None) -> float:
+        self.ritmo[clave] = max(RITMO_MIN, self.ritmo[clave] * FACTOR_REDUCCION)
+        espera = segundos_retry_after(retry_after)
+        self.disponible[clave] = max(self.disponible[clave], time.monotonic() + espera)
+        self.limitadas[clave] += 1
+        return espera
+
+    # ---------- métricas ----------
+    def ritmo_agregado(self) -> float:
+        return sum(self.ritmo.values())
+
+    def metricas(self) -> dict:
+        return {
+            "ritmo_agregado_rps": round(self.ritmo_agregado(), 3),
+            "peticiones": sum(self.peticiones.values()),
+            "respuestas_429": sum(self.limitadas.values()),
+            "por_clave": {
+                self._id(k): {"ritmo_rps": round(self.ritmo[k], 3),
+                              "peticiones": self.peticiones[k],
+                              "respuestas_429": self.limitadas[k]}
+                for k in self.claves
+            },
+        }
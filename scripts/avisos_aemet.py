@@ -1,43 +1,27 @@
 # --- Importaciones necesarias.
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import sys
+from pathlib import Path
+
 import pandas as pd
-import geopandas as gpd
-from shapely.ops import transform
 
-# --- URL de origen de los datos.
-URL = "https://www.aemet.es/es/eltiempo/prediccion/avisos?r=1"
+from avisos_historico import anadir as anadir_al_historico
+from avisos_navegador import instantanea, tabla_avisos
+from avisos_sondeo import registrar_huella, sondear
+from sheets import ID_HOJA_CALCULO, RUTA_CREDENCIALES, ALCANCES_SHEETS, hora, subir_df_a_sheet
 
-# --- Configuración del navegador en modo headless.
-opts = webdriver.ChromeOptions()
-opts.add_argument("--headless=new")
-opts.add_argument("--lang=es-ES")
-opts.add_argument("--user-agent=Mozilla/5.0")
-driver = webdriver.Chrome(options=opts)
+# --- python avisos_aemet.py --sondeo → comprueba la página cada pocos minutos y solo vuelve a
+# ejecutar este script cuando cambian los avisos.
+if __name__ == "__main__" and "--sondeo" in sys.argv[1:]:
+    try:
+        sondear(Path(__file__).resolve())
+    except KeyboardInterrupt:
+        print("Sondeo detenido.")
+    sys.exit(0)
 
-# --- Descarga y parseo de la tabla HTML.
-data = []
-headers = []
-try:
-    driver.get(URL)
-    WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".table")))
-    table = driver.find_element(By.CSS_SELECTOR, ".table")
-    ths = table.find_elements(By.CSS_SELECTOR, "thead tr th")
-    headers = [th.text.strip() for th in ths] if ths else []
-    for tr in table.find_elements(By.CSS_SELECTOR, "tbody tr"):
-        tds = tr.find_elements(By.CSS_SELECTOR, "td")
-        data.append([td.text.strip() for td in tds])
-finally:
-    driver.quit()
-
-# --- Construcción del DataFrame con cabeceras seguras.
-ncols = max((len(r) for r in data), default=0)
-if not headers or len(headers) != ncols:
-    headers = [f"col_{i+1}" for i in range(ncols)]
-data = [r + [""] * (ncols - len(r)) for r in data]
-df = pd.DataFrame(data, columns=headers)
+# --- Tabla de avisos: una sola carga de la página compartida con los scripts de avisos/.
+datos_pagina = instantanea()
+tabla_origen = tabla_avisos(datos_pagina)
+df = tabla_origen.copy()
 
 # --- Eliminación de columnas no necesarias.
 drop_cols = [c for c in df.columns if c.strip().lower() in ("probabilidad", "comentario")]
@@ -76,6 +60,8 @@ if col_fin:
     df[col_fin] = only_time_series(df[col_fin].astype(str))
 
 # --- Carga de delimitaciones AEMET y cruce por 'zona'.
+# geopandas se importa aquí: si el scraping falla no se paga su carga
+import geopandas as gpd
 zonas_aemet = gpd.read_file("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_avisos/delimitaciones_aemet.geojson")
 df_geo = df.merge(zonas_aemet, left_on="zona", right_on="zona", how="left")
 df_geo = gpd.GeoDataFrame(df_geo, geometry="geometry", crs=zonas_aemet.crs)
@@ -104,6 +90,24 @@ df_geo = (
           .drop(columns="_prioridad")
 )
 
+# --- Lluvia observada dentro de cada zona con aviso (estaciones del mapa de lluvias, que ya
+# traen su zona de aviso asignada por cruce espacial en lluvias.py).
+ruta_lluvias = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/MAPA_LLUVIAS.xlsx"
+try:
+    lluvias = pd.read_excel(ruta_lluvias, usecols=lambda c: c in ("zona", "prec"))
+except FileNotFoundError:
+    lluvias = pd.DataFrame()
+if {"zona", "prec"} <= set(lluvias.columns):
+    lluvia_zona = (
+        lluvias.dropna(subset=["zona", "prec"])
+               .groupby("zona")["prec"]
+               .agg(lluvia_media_zona="mean", lluvia_max_zona="max", estaciones_zona="count")
+               .round(1)
+               .reset_index()
+    )
+    df_geo = df_geo.merge(lluvia_zona, on="zona", how="left")
+    print(f"Lluvia observada en {int(df_geo['estaciones_zona'].notna().sum())} de {len(df_geo)} zonas con aviso.")
+
 # --- Exportación a GeoJSON.
 salida = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/MAPA_AVISOS_AEMET.geojson"
 try:
@@ -160,7 +164,6 @@ resumen["numero_ccaa"] = n_letras
 
 # --- Preparar la subida a Google Sheets.
 SUBIR_A_SHEETS    = True
-ID_HOJA_CALCULO   = "1o0DICxbYpq_OqgwTqU9-8GaQzjYj14cdureHGN-uLQA"
 
 PESTANA_AVISOS    = "avisos_aemet"
 INICIO_A1_AVISOS  = f"{PESTANA_AVISOS}!A1"
@@ -168,125 +171,6 @@ INICIO_A1_AVISOS  = f"{PESTANA_AVISOS}!A1"
 PESTANA_DATOS     = "datos_avisos"
 INICIO_A1_DATOS   = f"{PESTANA_DATOS}!A1"
 
-RUTA_CREDENCIALES = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/credenciales_google_sheet.json"
-ALCANCES_SHEETS   = ["https://www.googleapis.com/auth/spreadsheets"]
-
-# --- Dependencias de Google Sheets.
-import re, time, math
-from datetime import datetime as _dt
-from pandas.api.types import is_datetime64_any_dtype, is_datetime64tz_dtype
-
-try:
-    import httplib2
-    from google.oauth2.service_account import Credentials
-    from googleapiclient.discovery import build
-    from googleapiclient.errors import HttpError
-    from google_auth_httplib2 import AuthorizedHttp
-    _GSHEETS_DISPONIBLE = True
-except Exception:
-    _GSHEETS_DISPONIBLE = False
-
-def hora() -> str:
-    return _dt.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-
-def _parse_a1(celda: str):
-    m = re.match(r"^([A-Za-z]+)(\d+)?$", celda)
-    if not m:
-        return "A", 1
-    col, fila = m.group(1).upper(), int(m.group(2) or 1)
-    return col, fila
-
-def _exec_reintentado(req, intentos=5, espera_base=1.5):
-    for i in range(intentos):
-        try:
-            return req.execute(num_retries=5)
-        except Exception as e:
-            transitorio = isinstance(e, TimeoutError) or isinstance(e, HttpError)
-            if (i == intentos - 1) or not transitorio:
-                raise
-            time.sleep(espera_base * (2 ** i))
-
-def _construir_servicio_sheets(ruta_credenciales: str, alcances: list[str]):
-    if not _GSHEETS_DISPONIBLE:
-        raise RuntimeError(
-            "Faltan dependencias de Google Sheets. Instala: "
-            "google-api-python-client google-auth-httplib2 google-auth httplib2"
-        )
-    cred = Credentials.from_service_account_file(ruta_credenciales, scopes=alcances)
-    _http = httplib2.Http(timeout=500)
-    _authed_http = AuthorizedHttp(cred, http=_http)
-    return build("sheets", "v4", http=_authed_http, cache_discovery=False)
-
-def subir_df_a_sheet(
-    df: pd.DataFrame,
-    spreadsheet_id: str,
-    rango_inicial: str,
-    pestana: str,
-    ruta_credenciales: str,
-    alcances: list[str] = ALCANCES_SHEETS,
-    filas_bloque: int = 2000,
-):
-    servicio = _construir_servicio_sheets(ruta_credenciales=ruta_credenciales, alcances=alcances)
-
-    df = df.copy()
-
-    ## Formatear columnas de fecha/hora.
-    for col in df.columns:
-        if is_datetime64_any_dtype(df[col]) or is_datetime64tz_dtype(df[col]):
-            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    def _a_texto(x):
-        if isinstance(x, (pd.Timestamp, _dt)):
-            return x.strftime("%Y-%m-%d %H:%M:%S")
-        return x
-
-    df = df.applymap(_a_texto).where(pd.notnull(df), None)
-
-    print(f"{hora()}Limpiando hoja '{pestana}' …")
-    _exec_reintentado(
-        servicio.spreadsheets().values().clear(
-            spreadsheetId=spreadsheet_id, range=f"{pestana}!A1:ZZ"
-        )
-    )
-
-    cabecera = list(map(str, df.columns.tolist()))
-    filas = [[("" if v is None else str(v)) for v in fila] for fila in df.to_numpy().tolist()]
-
-    celda_a1 = rango_inicial.replace(f"{pestana}!", "")
-    col_inicio, fila_inicio = _parse_a1(celda_a1)
-    rango_cabecera = f"{pestana}!{col_inicio}{fila_inicio}"
-    _exec_reintentado(
-        servicio.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=rango_cabecera,
-            valueInputOption="RAW",
-            body={"values": [cabecera]},
-        )
-    )
-
-    if not filas:
-        print(f"{hora()}No hay filas para subir en '{pestana}'.")
-        return
-
-    fila_datos_inicio = fila_inicio + 1
-    total = len(filas)
-    bloques = math.ceil(total / filas_bloque)
-    print(f"{hora()}Subiendo datos a '{pestana}' en {bloques} bloque(s) de hasta {filas_bloque} fila(s)…")
-
-    for i in range(bloques):
-        i0, i1 = i * filas_bloque, min((i + 1) * filas_bloque, total)
-        bloque = filas[i0:i1]
-        rango_escritura = f"{pestana}!{col_inicio}{fila_datos_inicio + i0}"
-        _exec_reintentado(
-            servicio.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=rango_escritura,
-                valueInputOption="RAW",
-                body={"values": bloque},
-            )
-        )
-        print(f"{hora()}  · Bloque {i+1}/{bloques} ({i1 - i0} filas) OK")
-
 # --- Subida a Google Sheets.
 if SUBIR_A_SHEETS:
     try:
@@ -314,3 +198,9 @@ if SUBIR_A_SHEETS:
         print(f"{hora()}Subida completada en la hoja '{PESTANA_DATOS}'.")
     except Exception as e:
         print(f"{hora()}ERROR subiendo a Google Sheets: {e}")
+
+# --- Histórico de avisos: la captura se añade al registro (solo la primera vez que se procesa).
+anadir_al_historico(tabla_origen, datos_pagina["capturado"])
+
+# --- Huella de los avisos publicados (el modo --sondeo no vuelve a publicar la misma tabla).
+registrar_huella(tabla_origen)
@@ -0,0 +1,169 @@
+# avisos_historico.py
+# Histórico de avisos solo de añadido: cada captura de la página de avisos deja un bloque
+# columnar (npz) con una fila por aviso: zona, fenómeno, nivel, inicio, fin y hora de la captura.
+#
+# Consultas por tiempo con un índice de intervalos: los avisos se ordenan por inicio y se guarda
+# la duración máxima D. Un aviso activo en t empieza en (t - D, t], así que dos searchsorted
+# acotan los candidatos y solo esos se filtran por fin > t (igual para un rango [a, b)).
+# El índice consolidado (indice.npz) se rehace al cargar solo si hay bloques nuevos.
+#
+# Uso:  python avisos_historico.py "2026-09-12 18:00"            → avisos activos a esa hora
+#       python avisos_historico.py "2026-09-01" "2026-10-01"     → avisos activos en el rango
+from __future__ import annotations
+
+import sys
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Configuración
+# =========================
+DIR_HISTORICO = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/avisos/historico/")
+RUTA_INDICE = DIR_HISTORICO / "indice.npz"
+COLUMNAS_TEXTO = ("zona", "fenomeno", "nivel")
+COLUMNAS_TIEMPO = ("inicio", "fin", "fuente")       # datetime64[s], hora local de la página
+
+
+def _norm(x: str) -> str:
+    x = unicodedata.normalize("NFKD", str(x).lower())
+    return " ".join("".join(c for c in x if not unicodedata.combining(c)).split())
+
+
+def _columna(df: pd.DataFrame, nombres) -> str | None:
+    return next((c for c in df.columns if _norm(c) in nombres), None)
+
+
+# =========================
+# Añadir
+# =========================
+def filas_de_tabla(tabla: pd.DataFrame, capturado: str) -> pd.DataFrame:
+    """Avisos de la tabla de la página (avisos_navegador.tabla_avisos) en formato del histórico."""
+    c_zona = _columna(tabla, ("zona de avisos", "zona de aviso", "zona avisos", "zona"))
+    c_fen = _columna(tabla, ("fenomeno", "fenomenos"))
+    c_niv = _columna(tabla, ("nivel de riesgo", "nivel riesgo", "riesgo"))
+    c_ini = _columna(tabla, ("hora de comienzo", "hora comienzo", "inicio"))
+    c_fin = _columna(tabla, ("hora de finalizacion", "hora finalizacion", "fin"))
+    if None in (c_zona, c_ini, c_fin):
+        return pd.DataFrame(columns=[*COLUMNAS_TEXTO, *COLUMNAS_TIEMPO])
+
+    zona = tabla[c_zona].astype(str).str.replace("–", "-", regex=False)
+    zona = zona.str.extract(r"^(?P<zona>.+?)\s*-\s*.+$")["zona"].fillna(zona).str.strip()
+    out = pd.DataFrame({
+        "zona": zona,
+        "fenomeno": tabla[c_fen].astype(str).str.strip().str.lower() if c_fen else "",
+        "nivel": tabla[c_niv].astype(str).str.strip() if c_niv else "",
+        "inicio": pd.to_datetime(tabla[c_ini], errors="coerce", dayfirst=True),
+        "fin": pd.to_datetime(tabla[c_fin], errors="coerce", dayfirst=True),
+    })
+    out = out.dropna(subset=["inicio", "fin"])
+    out = out[out["fin"] > out["inicio"]].drop_duplicates()
+    out["fuente"] = pd.Timestamp(capturado)
+    return out.reset_index(drop=True)
+
+
+def anadir(tabla: pd.DataFrame, capturado: str, directorio: Path = DIR_HISTORICO) -> Path | None:
+    """Añade un bloque con los avisos de una captura (una sola vez por captura)."""
+    ruta = Path(directorio) / f"avisos_{pd.Timestamp(capturado):%Y%m%d_%H%M%S}.npz"
+    if ruta.exists():
+        return None
+    filas = filas_de_tabla(tabla, capturado)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        ruta,
+        **{c: filas[c].to_numpy(dtype=str) for c in COLUMNAS_TEXTO},
+        **{c: filas[c].to_numpy(dtype="datetime64[s]") for c in COLUMNAS_TIEMPO},
+    )
+    print(f"Histórico de avisos: {len(filas)} avisos de {capturado} → {ruta.name}")
+    return ruta
+
+
+# =========================
+# Índice de intervalos
+# =========================
+class HistoricoAvisos:
+    def __init__(self, datos: dict[str, np.ndarray], bloques: list[str]):
+        orden = np.argsort(datos["inicio"], kind="stable")
+        self.datos = {k: v[orden] for k, v in datos.items()}
+        self.bloques = bloques
+        dur = self.datos["fin"] - self.datos["inicio"]
+        self.duracion_max = dur.max() if len(dur) else np.timedelta64(0, "s")
+
+    def __len__(self):
+        return len(self.datos["inicio"])
+
+    @classmethod
+    def cargar(cls, directorio: Path = DIR_HISTORICO) -> "HistoricoAvisos":
+        directorio = Path(directorio)
+        bloques = sorted(p.name for p in directorio.glob("avisos_*.npz"))
+        datos = {c: np.array([], dtype=str) for c in COLUMNAS_TEXTO}
+        datos.update({c: np.array([], dtype="datetime64[s]") for c in COLUMNAS_TIEMPO})
+        ya = []
+        indice = directorio / RUTA_INDICE.name
+        if indice.exists():
+            with np.load(indice) as z:
+                datos = {c: z[c] for c in (*COLUMNAS_TEXTO, *COLUMNAS_TIEMPO)}
+                ya = [str(b) for b in z["bloques"]]
+        nuevos = sorted(set(bloques) - set(ya))
+        if not nuevos:
+            return cls(datos, ya)
+        partes = [datos]
+        for b in nuevos:
+            with np.load(directorio / b) as z:
+                partes.append({c: z[c] for c in (*COLUMNAS_TEXTO, *COLUMNAS_TIEMPO)})
+        historico = cls({c: np.concatenate([p[c] for p in partes]) for c in partes[0]}, ya + nuevos)
+        historico.guardar_indice(indice)
+        return historico
+
+    def guardar_indice(self, ruta: Path = RUTA_INDICE):
+        np.savez_compressed(ruta, bloques=np.array(self.bloques, dtype=str), **self.datos)
+
+    def _tabla(self, sel: np.ndarray) -> pd.DataFrame:
+        df = pd.DataFrame({c: self.datos[c][sel] for c in (*COLUMNAS_TEXTO, *COLUMNAS_TIEMPO)})
+        # Un mismo aviso aparece en todas las capturas en que estuvo publicado: vale la última
+        df = df.sort_values("fuente").drop_duplicates(["zona", "fenomeno", "nivel", "inicio", "fin"], keep="last")
+        return df.sort_values(["inicio", "zona"]).reset_index(drop=True)
+
+    def _candidatos(self, desde: np.datetime64, hasta: np.datetime64, derecha: bool) -> np.ndarray:
+        # Índices con inicio en (desde - D, hasta] (o hasta) gracias al orden por inicio
+        ini = self.datos["inicio"]
+        i0 = np.searchsorted(ini, desde - self.duracion_max, side="right")
+        i1 = np.searchsorted(ini, hasta, side="right" if derecha else "left")
+        return np.arange(i0, i1)
+
+    def activos_en(self, t) -> pd.DataFrame:
+        """Avisos vigentes en el instante t (inicio <= t < fin)."""
+        t = np.datetime64(pd.Timestamp(t), "s")
+        c = self._candidatos(t, t, derecha=True)
+        return self._tabla(c[self.datos["fin"][c] > t])
+
+    def activos_entre(self, desde, hasta) -> pd.DataFrame:
+        """Avisos vigentes en algún momento de [desde, hasta)."""
+        desde, hasta = np.datetime64(pd.Timestamp(desde), "s"), np.datetime64(pd.Timestamp(hasta), "s")
+        c = self._candidatos(desde, hasta, derecha=False)
+        return self._tabla(c[self.datos["fin"][c] > desde])
+
+    def fotogramas(self, desde, hasta, paso: str = "1h") -> pd.DataFrame:
+        """Avisos activos en cada instante de una rejilla regular (para animar la evolución)."""
+        partes = [self.activos_en(t).assign(instante=t) for t in pd.date_range(desde, hasta, freq=paso)]
+        return pd.concat(partes, ignore_index=True) if partes else self._tabla(np.array([], dtype=int))
+
+
+def main(argv: list[str]):
+    historico = HistoricoAvisos.cargar()
+    print(f"Histórico: {len(historico)} filas en {len(historico.bloques)} capturas.")
+    if len(argv) == 1:
+        df = historico.activos_en(argv[0])
+    elif len(argv) == 2:
+        df = historico.activos_entre(argv[0], argv[1])
+    else:
+        print('Uso: python avisos_historico.py "AAAA-MM-DD HH:MM" ["AAAA-MM-DD HH:MM"]')
+        return
+    with pd.option_context("display.max_rows", 200, "display.width", 200):
+        print(df)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+# avisos_navegador.py
+# Una sola sesión de navegador para la página de avisos de AEMET (avisos?r=1).
+#
+# La página se carga una vez y un único script dentro de ella devuelve en JSON la tabla de avisos
+# (cabecera y filas) y la rejilla horaria de #resumen-avisos (zona, hora, nivel): dos
+# round-trips de WebDriver en lugar de uno por celda. La instantánea se guarda en disco y
+# avisos_aemet.py, avisos/avisos_individual.py y avisos/avisos_ccaa.py la reutilizan mientras
+# tenga menos de MAX_EDAD_MIN minutos, así que el navegador se abre una vez para los tres.
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+# =========================
+# Configuración
+# =========================
+URL = "https://www.aemet.es/es/eltiempo/prediccion/avisos?r=1"
+RUTA_INSTANTANEA = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/avisos/instantanea_avisos.json")
+MAX_EDAD_MIN = 15          # instantáneas más recientes se reutilizan sin abrir el navegador
+ESPERA_TABLA_S = 30
+ESPERA_RESUMEN_S = 10      # la rejilla horaria llega después de la tabla (o no hay avisos)
+
+SELECTOR_TABLA = ".table"
+SELECTOR_RESUMEN = "#resumen-avisos .rs-dia-zona[data-zona-id]"
+
+_EXTRAER_JS = """
+const txt = el => (el.innerText || el.textContent || "").trim();
+const tabla = document.querySelector(arguments[0]);
+const cabecera = tabla ? [...tabla.querySelectorAll("thead tr th")].map(txt) : [];
+const filas = tabla ? [...tabla.querySelectorAll("tbody tr")].map(tr => [...tr.querySelectorAll("td")].map(txt)) : [];
+const horas = [];
+document.querySelectorAll(arguments[1]).forEach(dia => {
+  const nombre = dia.querySelector(".rs-zona .rs-nombre-zona");
+  if (!nombre) return;
+  const zona = txt(nombre);
+  dia.querySelectorAll(".rs-horas .rs-hora[data-rs-fecha]").forEach(h => {
+    const nivel = [...h.classList].find(c => c.startsWith("rs-nivel-")) || "sin-nivel";
+    horas.push([zona, h.getAttribute("data-rs-fecha"), nivel]);
+  });
+});
+return JSON.stringify({cabecera: cabecera, filas: filas, horas: horas});
+"""
+
+
+# =========================
+# Captura
+# =========================
+def capturar(url: str = URL) -> dict:
+    """Abre la página una vez y devuelve {'capturado', 'cabecera', 'filas', 'horas'}."""
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    opts = webdriver.ChromeOptions()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--lang=es-ES")
+    opts.add_argument("--user-agent=Mozilla/5.0")
+    driver = webdriver.Chrome(options=opts)
+    try:
+        driver.get(url)
+        WebDriverWait(driver, ESPERA_TABLA_S).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, SELECTOR_TABLA)))
+        try:
+            WebDriverWait(driver, ESPERA_RESUMEN_S).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, SELECTOR_RESUMEN)))
+        except TimeoutException:
+            print("AVISO: la página no trae la rejilla horaria de #resumen-avisos.")
+        datos = json.loads(driver.execute_script(_EXTRAER_JS, SELECTOR_TABLA, SELECTOR_RESUMEN))
+    finally:
+        driver.quit()
+    datos["capturado"] = datetime.now().isoformat(timespec="seconds")
+    return datos
+
+
+def instantanea(max_edad_min: float = MAX_EDAD_MIN, ruta: Path = RUTA_INSTANTANEA) -> dict:
+    """Instantánea de la página: la guardada si es reciente, si no una captura nueva."""
+    if max_edad_min > 0 and ruta.exists():
+        try:
+            datos = json.loads(ruta.read_text(encoding="utf-8"))
+            edad = datetime.now() - datetime.fromisoformat(datos["capturado"])
+            if edad <= timedelta(minutes=max_edad_min):
+                print(f"Instantánea de avisos reutilizada ({datos['capturado']}).")
+                return datos
+        except (ValueError, KeyError):
+            pass
+    datos = capturar()
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps(datos, ensure_ascii=False), encoding="utf-8")
+    print(f"Instantánea de avisos: {len(datos['filas'])} filas, {len(datos['horas'])} horas → {ruta}")
+    return datos
+
+
+# =========================
+# Tablas
+# =========================
+def tabla_avisos(datos: dict) -> pd.DataFrame:
+    """Tabla de avisos con cabeceras seguras (col_i si no cuadran con las filas)."""
+    filas, cabecera = datos["filas"], datos["cabecera"]
+    ncols = max((len(r) for r in filas), default=0)
+    if not cabecera or len(cabecera) != ncols:
+        cabecera = [f"col_{i+1}" for i in range(ncols)]
+    filas = [r + [""] * (ncols - len(r)) for r in filas]
+    return pd.DataFrame(filas, columns=cabecera)
+
+
+def horas_avisos(datos: dict) -> pd.DataFrame:
+    """Rejilla horaria: una fila por (zona, fecha_hora) con su clase de nivel."""
+    return pd.DataFrame(datos["horas"], columns=["zona", "fecha_hora", "nivel"])
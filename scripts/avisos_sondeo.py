@@ -0,0 +1,120 @@
+# avisos_sondeo.py
+# Sondeo de avisos durante el día: python avisos_aemet.py --sondeo
+#
+# Cada INTERVALO_MIN minutos se pregunta a la página de avisos con una petición condicional
+# (If-None-Match / If-Modified-Since con el ETag y Last-Modified de la vez anterior): si responde
+# 304 no se hace nada más. Si no, se captura la página (avisos_navegador) y se calcula la huella
+# de la tabla de avisos normalizada; solo si la huella cambia se lanza avisos_aemet.py completo
+# (cruce con zonas, GeoJSON y subida a Sheets), que reutiliza esa misma captura.
+from __future__ import annotations
+
+import hashlib
+import json
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from avisos_navegador import URL, instantanea, tabla_avisos
+from sheets import hora
+
+# =========================
+# Configuración
+# =========================
+INTERVALO_MIN = 5
+TIMEOUT_S = 20
+RUTA_ESTADO = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/avisos/estado_sondeo.json")
+
+
+# =========================
+# Estado
+# =========================
+def leer_estado(ruta: Path = RUTA_ESTADO) -> dict:
+    try:
+        return json.loads(ruta.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def guardar_estado(estado: dict, ruta: Path = RUTA_ESTADO):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps(estado, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+def huella_tabla(df: pd.DataFrame) -> str:
+    """sha1 de la tabla de avisos sin espacios sobrantes y con las filas ordenadas: el orden en
+    que la página lista los avisos no cuenta como cambio."""
+    t = df.astype(str).apply(lambda c: c.str.split().str.join(" "))
+    t = t.sort_values(list(t.columns)).reset_index(drop=True)
+    h = hashlib.sha1("|".join(map(str, t.columns)).encode())
+    h.update(pd.util.hash_pandas_object(t, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def registrar_huella(df: pd.DataFrame, ruta: Path = RUTA_ESTADO):
+    # La ejecución normal también deja su huella: el sondeo no repite lo que ya se publicó
+    estado = leer_estado(ruta)
+    estado["huella"] = huella_tabla(df)
+    estado["publicado"] = datetime.now().isoformat(timespec="seconds")
+    guardar_estado(estado, ruta)
+
+
+# =========================
+# Sondeo
+# =========================
+def origen_modificado(sesion, estado: dict) -> tuple[bool, dict]:
+    """(False, {}) si la página responde 304 (o no responde); si no, (True, validadores nuevos).
+    Los validadores no se guardan aquí: solo cuando la ronda termina bien."""
+    import requests
+    cabeceras = {}
+    if estado.get("etag"):
+        cabeceras["If-None-Match"] = estado["etag"]
+    if estado.get("last_modified"):
+        cabeceras["If-Modified-Since"] = estado["last_modified"]
+    try:
+        r = sesion.get(URL, headers=cabeceras, timeout=TIMEOUT_S)
+    except requests.RequestException as e:
+        print(f"{hora()}Sin respuesta de la página de avisos: {e}")
+        return False, {}
+    if r.status_code == 304:
+        return False, {}
+    return True, {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+
+
+def sondear(script: Path, intervalo_min: float = INTERVALO_MIN, rondas: int | None = None):
+    import requests
+    sesion = requests.Session()
+    sesion.headers.update({"User-Agent": "Mozilla/5.0", "Accept-Language": "es-ES,es;q=0.9"})
+    ronda = 0
+    while rondas is None or ronda < rondas:
+        ronda += 1
+        estado = leer_estado()
+        modificado, validadores = origen_modificado(sesion, estado)
+        if not modificado:
+            print(f"{hora()}Avisos sin cambios (304 o sin respuesta).")
+        else:
+            try:
+                h = huella_tabla(tabla_avisos(instantanea(max_edad_min=0)))
+            except Exception as e:   # timeout de Selenium, WebDriver caído…: se prueba en la siguiente ronda
+                print(f"{hora()}ERROR capturando la página de avisos: {e}")
+                h = None
+            if h is not None and h == estado.get("huella"):
+                print(f"{hora()}Página nueva, mismos avisos: no se publica.")
+                estado.update(validadores)
+            elif h is not None:
+                print(f"{hora()}Avisos cambiados: se ejecuta {script.name}.")
+                try:
+                    subprocess.run([sys.executable, str(script)], check=True, cwd=script.parent)
+                    estado = leer_estado()          # el script deja su huella al terminar
+                    estado.update(validadores)
+                    estado["huella"] = h
+                    estado["publicado"] = datetime.now().isoformat(timespec="seconds")
+                except subprocess.CalledProcessError as e:
+                    print(f"{hora()}ERROR en {script.name} ({e.returncode}); se reintenta en la siguiente ronda.")
+        estado["comprobado"] = datetime.now().isoformat(timespec="seconds")
+        guardar_estado(estado)
+        if rondas is None or ronda < rondas:
+            time.sleep(intervalo_min * 60)
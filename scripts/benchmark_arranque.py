@@ -0,0 +1,93 @@
+# benchmark_arranque.py
+# Mide el coste de arranque de cada paso del pipeline con `python -X importtime`: se ejecutan
+# solo las importaciones de nivel de módulo del script (no su lógica), se suma el tiempo de
+# importación y se guarda en un histórico para comparar con la medición anterior.
+#
+# Uso:  python benchmark_arranque.py [repeticiones]
+from __future__ import annotations
+
+import ast
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+from PANEL_LLUVIAS_PIPELINE import PIPELINE  # noqa: E402
+
+RUTA_HISTORICO = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_aemet/benchmark_arranque.json")
+REPETICIONES = 5
+TOP_MODULOS = 5
+
+
+def importaciones_modulo(script: Path) -> str:
+    """Código con las importaciones que se ejecutan al cargar el script (fuera de funciones)."""
+    arbol = ast.parse(script.read_text(encoding="utf-8"))
+    nodos = []
+    pendientes = list(arbol.body)
+    while pendientes:
+        nodo = pendientes.pop(0)
+        if isinstance(nodo, (ast.Import, ast.ImportFrom)):
+            if getattr(nodo, "module", None) != "__future__":
+                nodos.append(nodo)
+        elif isinstance(nodo, (ast.Try, ast.If, ast.With)):
+            pendientes[:0] = [n for bloque in ("body", "orelse", "finalbody") for n in getattr(nodo, bloque, [])]
+            for h in getattr(nodo, "handlers", []):
+                pendientes[:0] = h.body
+    # Cada importación aislada: una dependencia ausente no invalida la medición del resto
+    return "\n".join(f"try:\n    {ast.unparse(n)}\nexcept Exception:\n    pass" for n in nodos)
+
+
+def medir(script: Path, codigo: str) -> dict:
+    t0 = time.perf_counter()
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo],
+                       cwd=script.parent, capture_output=True, text=True)
+    arranque_ms = (time.perf_counter() - t0) * 1000
+    propio_us, top = 0, []
+    for linea in r.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        propio_us += int(propio)
+        # Los módulos de primer nivel llevan un solo espacio; los anidados, más sangría
+        if not nombre.startswith("  "):
+            top.append((int(acumulado), nombre.strip()))
+    top.sort(reverse=True)
+    return {"importacion_ms": propio_us / 1000, "arranque_ms": arranque_ms, "top": top[:TOP_MODULOS]}
+
+
+def main(repeticiones: int = REPETICIONES):
+    previo = {}
+    historico = []
+    if RUTA_HISTORICO.exists():
+        historico = json.loads(RUTA_HISTORICO.read_text(encoding="utf-8"))
+        previo = historico[-1]["pasos"] if historico else {}
+
+    pasos = {}
+    for script, _args, _to in PIPELINE:
+        codigo = importaciones_modulo(script)
+        medidas = [medir(script, codigo) for _ in range(repeticiones)]
+        imp = statistics.median(m["importacion_ms"] for m in medidas)
+        arr = statistics.median(m["arranque_ms"] for m in medidas)
+        pasos[script.name] = {"importacion_ms": round(imp, 1), "arranque_ms": round(arr, 1),
+                              "top": [f"{n} ({us / 1000:.0f} ms)" for us, n in medidas[0]["top"]]}
+        antes = previo.get(script.name, {}).get("arranque_ms")
+        delta = f"  ({arr - antes:+.0f} ms)" if antes is not None else ""
+        print(f"{script.name:<28} importación {imp:7.0f} ms · arranque {arr:7.0f} ms{delta}")
+        print(f"{'':<28} {', '.join(pasos[script.name]['top'])}")
+
+    total = sum(p["arranque_ms"] for p in pasos.values())
+    print(f"{'TOTAL':<28} arranque {total:.0f} ms")
+    historico.append({"fecha": datetime.now().isoformat(timespec="seconds"),
+                      "python": sys.version.split()[0], "total_arranque_ms": round(total, 1), "pasos": pasos})
+    RUTA_HISTORICO.parent.mkdir(parents=True, exist_ok=True)
+    RUTA_HISTORICO.write_text(json.dumps(historico, indent=1, ensure_ascii=False), encoding="utf-8")
+    print("Guardado:", RUTA_HISTORICO)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REPETICIONES)
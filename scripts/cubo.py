@@ -0,0 +1,213 @@
+# cubo.py
+# Cubo de agregados diarios por jerarquía estación → zona de aviso → provincia → comunidad.
+#
+# Cada estación tiene su zona (zonas.zonas_de_estaciones) y cada zona su provincia y comunidad:
+# con esos arrays de índices de grupo se calculan suma, número de datos y máximo de todas las
+# variables a la vez (un bincount sobre grupo · n_variables + variable). Cada nivel se obtiene
+# del anterior y no de las estaciones, porque suma, cuenta y máximo se pueden volver a agregar;
+# la media es suma / cuenta. Una vista nueva (p. ej. otra variable u otro estadístico) se lee
+# del cubo guardado sin volver a pasar por los datos.
+#
+# Uso:  python cubo.py
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aemet_diarios import RUTA_DESCARGA
+from estaciones import RUTA_BASE, registro
+from sheets import subir_si_procede
+from zonas import cargar_zonas, zonas_de_estaciones
+
+# =========================
+# Configuración
+# =========================
+NIVELES = ("zona", "provincia", "ccaa")
+VARIABLES = ("prec", "tmax", "tmin", "tmed")
+TABLAS_CATEGORIA = {            # prefijo: mapa con la categoría de cada estación
+    "lluvia": Path(RUTA_BASE) / "MAPA_LLUVIAS.xlsx",
+    "temperatura": Path(RUTA_BASE) / "MAPA_TEMPERATURAS.xlsx",
+}
+RUTA_CUBO = Path(RUTA_BASE) / "complementarios_aemet" / "cubo_diario.npz"
+SALIDA_XLSX = Path(RUTA_BASE) / "CUBO_DIARIO.xlsx"
+SUBIR_A_SHEETS = True
+NOMBRE_PESTANA = "cubo"
+
+
+# =========================
+# Jerarquía
+# =========================
+def jerarquia() -> tuple[np.ndarray, dict[str, np.ndarray], dict[str, pd.DataFrame]]:
+    """Grupo de cada estación en el primer nivel, grupo padre de cada grupo en los siguientes y
+    etiquetas (codigo, nombre) de los grupos de cada nivel."""
+    zonas = cargar_zonas().drop(columns="geometry").reset_index(drop=True)
+    por_estacion = zonas_de_estaciones()
+    grupo_estacion = pd.Index(zonas["cod_zona"]).get_indexer(por_estacion["cod_zona"]).astype("int64")
+
+    etiquetas = {"zona": pd.DataFrame({"codigo": zonas["cod_zona"], "nombre": zonas["zona"]})}
+    provincias = zonas.drop_duplicates("cod_provincia").reset_index(drop=True)
+    comunidades = zonas.drop_duplicates("cod_ccaa").reset_index(drop=True)
+    etiquetas["provincia"] = pd.DataFrame({"codigo": provincias["cod_provincia"], "nombre": provincias["provincia"]})
+    etiquetas["ccaa"] = pd.DataFrame({"codigo": comunidades["cod_ccaa"], "nombre": comunidades["ccaa"]})
+    padres = {
+        "provincia": pd.Index(provincias["cod_provincia"]).get_indexer(zonas["cod_provincia"]).astype("int64"),
+        "ccaa": pd.Index(comunidades["cod_ccaa"]).get_indexer(provincias["cod_ccaa"]).astype("int64"),
+    }
+    return grupo_estacion, padres, etiquetas
+
+
+def _subir(grupo: np.ndarray, n_grupos: int, suma: np.ndarray, n: np.ndarray, maximo: np.ndarray):
+    # Reagrega (suma, cuenta, máximo) de filas (hijos × variables) a n_grupos en una pasada
+    nv = suma.shape[1]
+    ok = grupo >= 0
+    plano = (grupo[ok, None] * nv + np.arange(nv)[None, :]).ravel()
+    tam = n_grupos * nv
+    s = np.bincount(plano, weights=suma[ok].ravel(), minlength=tam).reshape(n_grupos, nv)
+    c = np.bincount(plano, weights=n[ok].ravel(), minlength=tam).reshape(n_grupos, nv)
+    m = np.full(tam, -np.inf)
+    np.maximum.at(m, plano, maximo[ok].ravel())
+    return s, c, m.reshape(n_grupos, nv)
+
+
+class CuboDiario:
+    def __init__(self, fecha: str, variables: list[str], niveles: dict[str, dict]):
+        self.fecha = fecha
+        self.variables = variables
+        self.niveles = niveles      # nivel: {"etiquetas", "suma", "n", "maximo"}
+
+    @classmethod
+    def construir(cls, valores: pd.DataFrame, fecha: str) -> "CuboDiario":
+        """``valores``: una fila por id_estacion (índice) y una columna por variable."""
+        grupo_estacion, padres, etiquetas = jerarquia()
+        ids = valores.index.to_numpy(dtype="int64")
+        v = valores.to_numpy(dtype="float64")
+        finito = np.isfinite(v)
+        grupo = np.full(len(ids), -1, dtype="int64")
+        dentro = (ids >= 0) & (ids < len(grupo_estacion))
+        grupo[dentro] = grupo_estacion[ids[dentro]]
+        suma, n, maximo = np.where(finito, v, 0.0), finito.astype("float64"), np.where(finito, v, -np.inf)
+
+        # Estaciones → zonas; después cada nivel se agrega desde el anterior
+        niveles = {}
+        for nivel in NIVELES:
+            if nivel in padres:
+                grupo = padres[nivel]
+            suma, n, maximo = _subir(grupo, len(etiquetas[nivel]), suma, n, maximo)
+            niveles[nivel] = {"etiquetas": etiquetas[nivel], "suma": suma, "n": n, "maximo": maximo}
+        return cls(fecha, list(valores.columns), niveles)
+
+    # ---------- vistas ----------
+    def vista(self, nivel: str, variable: str, estadistico: str = "media") -> pd.Series:
+        d = self.niveles[nivel]
+        j = self.variables.index(variable)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            valores = {
+                "suma": d["suma"][:, j],
+                "n": d["n"][:, j],
+                "media": d["suma"][:, j] / d["n"][:, j],
+                "maximo": np.where(d["n"][:, j] > 0, d["maximo"][:, j], np.nan),
+            }[estadistico]
+        return pd.Series(valores, index=d["etiquetas"]["nombre"].to_numpy(), name=f"{variable}_{estadistico}")
+
+    def tabla(self) -> pd.DataFrame:
+        """Formato largo: nivel, código, nombre, variable, suma, media, máximo, n."""
+        partes = []
+        for nivel, d in self.niveles.items():
+            g, nv = d["suma"].shape
+            with np.errstate(invalid="ignore", divide="ignore"):
+                media = d["suma"] / d["n"]
+            partes.append(pd.DataFrame({
+                "nivel": nivel,
+                "codigo": np.repeat(d["etiquetas"]["codigo"].to_numpy(), nv),
+                "nombre": np.repeat(d["etiquetas"]["nombre"].to_numpy(), nv),
+                "variable": np.tile(self.variables, g),
+                "suma": d["suma"].ravel(),
+                "media": media.ravel(),
+                "maximo": np.where(d["n"] > 0, d["maximo"], np.nan).ravel(),
+                "n": d["n"].ravel().astype(int),
+            }))
+        df = pd.concat(partes, ignore_index=True)
+        df = df[df["n"] > 0].round({"suma": 1, "media": 1, "maximo": 1})
+        df.insert(0, "fecha", self.fecha)
+        return df.reset_index(drop=True)
+
+    # ---------- persistencia ----------
+    def guardar(self, ruta: Path = RUTA_CUBO):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {}
+        for nivel, d in self.niveles.items():
+            arrays[f"{nivel}_codigo"] = np.asarray(d["etiquetas"]["codigo"].astype(str), dtype=str)
+            arrays[f"{nivel}_nombre"] = np.asarray(d["etiquetas"]["nombre"].astype(str), dtype=str)
+            for k in ("suma", "n", "maximo"):
+                arrays[f"{nivel}_{k}"] = d[k]
+        np.savez_compressed(ruta, fecha=np.array(self.fecha), variables=np.array(self.variables), **arrays)
+
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_CUBO) -> "CuboDiario | None":
+        if not Path(ruta).exists():
+            return None
+        with np.load(ruta) as z:
+            niveles = {
+                nivel: {
+                    "etiquetas": pd.DataFrame({"codigo": z[f"{nivel}_codigo"], "nombre": z[f"{nivel}_nombre"]}),
+                    **{k: z[f"{nivel}_{k}"] for k in ("suma", "n", "maximo")},
+                }
+                for nivel in NIVELES if f"{nivel}_suma" in z.files
+            }
+            return cls(str(z["fecha"]), [str(v) for v in z["variables"]], niveles)
+
+
+# =========================
+# Datos del día
+# =========================
+def valores_del_dia() -> tuple[pd.DataFrame, str]:
+    """Último día de la descarga compartida (una fila por estación) y recuentos de categoría de
+    los mapas como variables 0/1, para que el cubo dé estaciones por categoría y zona."""
+    diarios = pd.read_pickle(RUTA_DESCARGA)
+    fechas = pd.to_datetime(diarios["fecha"], errors="coerce")
+    dia = fechas.max()
+    hoy = diarios[fechas == dia].drop_duplicates("id_estacion", keep="last").set_index("id_estacion")
+    valores = hoy.reindex(columns=list(VARIABLES)).apply(pd.to_numeric, errors="coerce")
+
+    reg = registro()
+    for prefijo, ruta in TABLAS_CATEGORIA.items():
+        if not ruta.exists():
+            continue
+        mapa = pd.read_excel(ruta, usecols=lambda c: c in ("indicativo", "categoria"), dtype={"indicativo": str})
+        if not {"indicativo", "categoria"} <= set(mapa.columns):
+            continue
+        mapa = mapa.dropna(subset=["indicativo", "categoria"])
+        mapa = mapa[mapa["categoria"].astype(str).str.strip() != ""]
+        ids = reg.ids_de(mapa["indicativo"])
+        dummies = pd.get_dummies(mapa["categoria"].astype(str), prefix=f"{prefijo}_cat", dtype="float64")
+        dummies.index = ids
+        dummies = dummies[dummies.index >= 0].groupby(level=0).max()
+        valores = valores.join(dummies, how="outer")
+    valores.index.name = "id_estacion"
+    return valores, dia.strftime("%Y-%m-%d")
+
+
+def main():
+    if not RUTA_DESCARGA.exists():
+        print(f"AVISO: no hay descarga diaria en {RUTA_DESCARGA}; no se construye el cubo.")
+        return
+    valores, fecha = valores_del_dia()
+    cubo = CuboDiario.construir(valores, fecha)
+    cubo.guardar()
+    tabla = cubo.tabla()
+    for nivel in NIVELES:
+        print(f"  · {nivel}: {int((cubo.niveles[nivel]['n'].max(axis=1) > 0).sum())} grupos con datos")
+    print(f"Cubo de {fecha}: {len(cubo.variables)} variables, {len(tabla)} filas → {RUTA_CUBO}")
+
+    tabla.to_excel(SALIDA_XLSX, index=False)
+    print("Exportado:", SALIDA_XLSX)
+    subir_si_procede(tabla, NOMBRE_PESTANA, activo=SUBIR_A_SHEETS)
+
+
+if __name__ == "__main__":
+    t0 = datetime.now()
+    main()
+    print(f"Tiempo: {(datetime.now() - t0).total_seconds():.1f}s")
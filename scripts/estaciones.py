@@ -0,0 +1,203 @@
+# estaciones.py
+# Registro compacto de estaciones AEMET: cada indicativo recibe un id entero estable (su
+# posición en el registro; las estaciones nuevas se añaden al final y nunca se renumeran).
+# Coordenadas, altitud, provincia y nombre se guardan en arrays tipados en un .npz, y las
+# descargas, cruces y almacenes usan 'id_estacion' (int32) en lugar del texto del indicativo.
+#
+# Uso:  python estaciones.py               (desde los Excel de estaciones de los paneles)
+#       python estaciones.py --inventario  (además, desde el inventario de estaciones de AEMET)
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Configuración
+# =========================
+RUTA_BASE = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/"
+RUTA_REGISTRO = Path(RUTA_BASE) / "complementarios_aemet" / "registro_estaciones.npz"
+RUTAS_MAESTROS = [
+    f"{RUTA_BASE}complementarios_lluvias/datos_mapa.xlsx",
+    f"{RUTA_BASE}complementarios_temperaturas/datos_mapa.xlsx",
+    f"{RUTA_BASE}complementarios_lluvias/ids_estaciones.xlsx",
+    f"{RUTA_BASE}complementarios_temperaturas/ids_estaciones_reducido.xlsx",
+]
+ENDPOINT_INVENTARIO = "/valores/climatologicos/inventarioestaciones/todasestaciones"
+
+SIN_ID = -1
+_REGISTRO: "RegistroEstaciones | None" = None
+
+
+def normalizar(indicativos) -> np.ndarray:
+    """Indicativos limpios (sin espacios, en mayúsculas) como array de texto."""
+    s = pd.Series(indicativos, dtype="object").astype("string").str.strip().str.upper()
+    return s.fillna("").to_numpy(dtype=str)
+
+
+def _grados(valor) -> float:
+    # El inventario de AEMET da las coordenadas como 'ddmmssH' (p. ej. 394924N, 025309W)
+    m = re.fullmatch(r"(\d{2,3})(\d{2})(\d{2})([NSEW])", str(valor).strip().upper())
+    if not m:
+        try:
+            return float(str(valor).replace(",", "."))
+        except ValueError:
+            return np.nan
+    g = int(m.group(1)) + int(m.group(2)) / 60 + int(m.group(3)) / 3600
+    return -g if m.group(4) in "SW" else g
+
+
+class RegistroEstaciones:
+    def __init__(self, indicativo=(), nombre=(), provincia=(), lat=(), lon=(), altitud=(), ruta: Path = RUTA_REGISTRO):
+        self.ruta = Path(ruta)
+        self.indicativo = np.asarray(indicativo, dtype=str)
+        self.nombre = np.asarray(nombre, dtype=str)
+        self.provincia = np.asarray(provincia, dtype=str)
+        self.lat = np.asarray(lat, dtype="float32")
+        self.lon = np.asarray(lon, dtype="float32")
+        self.altitud = np.asarray(altitud, dtype="float32")
+        self._indice: pd.Index | None = None
+        self.modificado = False
+
+    def __len__(self) -> int:
+        return len(self.indicativo)
+
+    # ---------- persistencia ----------
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_REGISTRO) -> "RegistroEstaciones":
+        ruta = Path(ruta)
+        if not ruta.exists():
+            return cls(ruta=ruta)
+        with np.load(ruta, allow_pickle=False) as z:
+            provincia = z["provincias"][z["provincia_cod"]]
+            return cls(z["indicativo"], z["nombre"], provincia, z["lat"], z["lon"], z["altitud"], ruta=ruta)
+
+    def guardar(self):
+        # La provincia se guarda como código int16 sobre la lista de provincias
+        provincias, codigos = np.unique(self.provincia, return_inverse=True)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.ruta.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp, indicativo=self.indicativo, nombre=self.nombre.astype(str),
+                            provincias=provincias.astype(str), provincia_cod=codigos.astype("int16"),
+                            lat=self.lat, lon=self.lon, altitud=self.altitud)
+        tmp.replace(self.ruta)
+        self.modificado = False
+
+    # ---------- consulta ----------
+    @property
+    def version(self) -> str:
+        """Huella de indicativos y coordenadas: cambia al dar de alta o mover estaciones."""
+        # El texto y no los bytes del array: el ancho del dtype crece con el indicativo más largo
+        h = hashlib.sha1("\n".join(self.indicativo.tolist()).encode())
+        for arr in (self.lat, self.lon):
+            h.update(np.ascontiguousarray(arr).tobytes())
+        return h.hexdigest()[:16]
+
+    @property
+    def indice(self) -> pd.Index:
+        if self._indice is None:
+            self._indice = pd.Index(self.indicativo)
+        return self._indice
+
+    def ids_de(self, indicativos, registrar: bool = False) -> np.ndarray:
+        """Ids int32 de los indicativos (SIN_ID si no están y no se registran)."""
+        claves = normalizar(indicativos)
+        ids = self.indice.get_indexer(claves).astype("int32")
+        if registrar:
+            nuevos = pd.unique(claves[(ids == SIN_ID) & (claves != "")])
+            if len(nuevos):
+                self._anadir(nuevos)
+                ids = self.indice.get_indexer(claves).astype("int32")
+        return ids
+
+    def indicativos_de(self, ids) -> np.ndarray:
+        return self.indicativo[np.asarray(ids, dtype="int64")]
+
+    def a_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "id_estacion": np.arange(len(self), dtype="int32"),
+            "indicativo": self.indicativo,
+            "nombre": self.nombre,
+            "provincia": pd.Categorical(self.provincia),
+            "latitud": self.lat,
+            "longitud": self.lon,
+            "altitud": self.altitud,
+        })
+
+    # ---------- altas y atributos ----------
+    def _anadir(self, nuevos: np.ndarray):
+        n = len(nuevos)
+        self.indicativo = np.concatenate([self.indicativo, np.asarray(nuevos, dtype=str)])
+        self.nombre = np.concatenate([self.nombre.astype(object), np.full(n, "", dtype=object)]).astype(str)
+        self.provincia = np.concatenate([self.provincia.astype(object), np.full(n, "", dtype=object)]).astype(str)
+        for campo in ("lat", "lon", "altitud"):
+            setattr(self, campo, np.concatenate([getattr(self, campo), np.full(n, np.nan, dtype="float32")]))
+        self._indice = None
+        self.modificado = True
+
+    def actualizar_desde_tabla(self, tabla: pd.DataFrame, clave: str = "indicativo") -> np.ndarray:
+        """Registra los indicativos de la tabla y rellena los atributos que traiga
+        (nombre, provincia, altitud, latitud, longitud). Devuelve los ids de sus filas."""
+        ids = self.ids_de(tabla[clave], registrar=True)
+        ok = ids != SIN_ID
+        for col, campo in (("nombre", "nombre"), ("provincia", "provincia")):
+            if col in tabla.columns:
+                v = tabla[col].astype("string").str.strip().fillna("").to_numpy(dtype=str)
+                sel = ok & (v != "")
+                arr = getattr(self, campo).astype(object)
+                if (arr[ids[sel]] != v[sel]).any():
+                    arr[ids[sel]] = v[sel]
+                    setattr(self, campo, arr.astype(str))
+                    self.modificado = True
+        for col, campo in (("latitud", "lat"), ("longitud", "lon"), ("altitud", "altitud")):
+            if col in tabla.columns:
+                v = tabla[col].map(_grados).to_numpy(dtype="float32")
+                sel = ok & np.isfinite(v)
+                arr = getattr(self, campo)
+                # Solo cuenta como cambio un valor distinto (NaN frente a NaN no lo es)
+                if not np.array_equal(arr[ids[sel]], v[sel], equal_nan=True):
+                    arr[ids[sel]] = v[sel]
+                    self.modificado = True
+        return ids
+
+
+def registro() -> RegistroEstaciones:
+    """Registro compartido dentro del proceso."""
+    global _REGISTRO
+    if _REGISTRO is None:
+        _REGISTRO = RegistroEstaciones.cargar()
+    return _REGISTRO
+
+
+def ids_de(indicativos, registrar: bool = True) -> np.ndarray:
+    reg = registro()
+    ids = reg.ids_de(indicativos, registrar=registrar)
+    if reg.modificado:
+        reg.guardar()
+    return ids
+
+
+def inventario_aemet() -> pd.DataFrame:
+    from aemet_diarios import aemet_descargar
+    from aemet_payload import registros
+    return pd.DataFrame(registros(aemet_descargar(ENDPOINT_INVENTARIO)))
+
+
+def main(usar_inventario: bool = False):
+    reg = registro()
+    antes = len(reg)
+    for ruta in RUTAS_MAESTROS:
+        if Path(ruta).exists():
+            reg.actualizar_desde_tabla(pd.read_excel(ruta, dtype={"indicativo": str}))
+    if usar_inventario:
+        reg.actualizar_desde_tabla(inventario_aemet())
+    reg.guardar()
+    print(f"Registro de estaciones: {len(reg)} ({len(reg) - antes} nuevas) → {reg.ruta}")
+
+
+if __name__ == "__main__":
+    main(usar_inventario="--inventario" in sys.argv[1:])
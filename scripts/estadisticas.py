@@ -1,141 +1,143 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import math, time, re
-from datetime import datetime as _dt
-from pandas.api.types import is_datetime64_any_dtype, is_datetime64tz_dtype
+import sys
 from pathlib import Path
 
 directorio = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/"
 
-# --- Estadísticas de las lluvias.
-ruta_historico_lluvias = f"{directorio}complementarios_lluvias/"
-
-historico_lluvias = pd.read_excel(f"{ruta_historico_lluvias}datos_historicos.xlsx")
-lluvias_media_agosto_historico_mensual = historico_lluvias["precip_media_mensual_historica"].mean()
-lluvias_media_agosto_historico_diario = lluvias_media_agosto_historico_mensual / 30
-
-datos_ultimas_lluvias = pd.read_excel(f"{directorio}MAPA_LLUVIAS.xlsx")
-ultimas_lluvias = datos_ultimas_lluvias["prec"].sum()
-print(f"Ha llovido {ultimas_lluvias} mm en las últimas 24 horas.")
-lluvia_ultimas_media = datos_ultimas_lluvias["prec"].mean()
+# --- Acumulados móviles por estación (estado incremental en complementarios_aemet).
+# Cada ejecución solo añade los días de la descarga compartida (aemet_diarios.py) al estado
+# anterior; las ventanas de 7, 30 y 90 días y el año hidrológico se leen de ese estado.
+from acumulados import VENTANAS, actualizar_estado, normal_acumulada
+from aemet_diarios import RUTA_DESCARGA, RUTAS_INDICATIVOS
+from estaciones import registro
+from sheets import ID_HOJA_CALCULO, RUTA_CREDENCIALES, ALCANCES_SHEETS, _GSHEETS_DISPONIBLE, subir_df_a_sheet
 
-lluvias_variacion_pct = ((lluvia_ultimas_media - lluvias_media_agosto_historico_diario) / lluvias_media_agosto_historico_diario) * 100
-print(f"La media reciente de lluvias ha variado un {lluvias_variacion_pct:.2f}% respecto al histórico diario de agosto.")
+ruta_historico_lluvias = f"{directorio}complementarios_lluvias/"
+SALIDA_ESTACIONES = f"{directorio}ESTADISTICAS_ESTACIONES.xlsx"
+SALIDA_CCAA = f"{directorio}ESTADISTICAS_CCAA.xlsx"
+PESTANA_ESTACIONES = "estadisticas_estaciones"
+PESTANA_CCAA = "estadisticas_ccaa"
+
+diarios = pd.read_pickle(RUTA_DESCARGA) if RUTA_DESCARGA.exists() else pd.DataFrame()
+estado = actualizar_estado(diarios)
+if estado is None:
+    print("AVISO: no hay descarga diaria ni histórico; no se calculan estadísticas.")
+    sys.exit(0)
+dia = pd.Timestamp(estado.ultimo_dia)
+print(f"Acumulados actualizados hasta {dia:%d/%m/%Y} ({estado.n_estaciones} estaciones).")
+
+# scipy y las zonas (vía interpolacion/thiessen) se cargan solo si hay datos que agregar
+from interpolacion import estaciones_panel
+from thiessen import TeselasThiessen
+
+# Estaciones de cada panel: las lluvias se agregan sobre las del mapa de lluvias y las
+# temperaturas sobre las del mapa de temperaturas, como en los paneles. Cada estación pesa
+# por el área de su polígono de Thiessen (las que no tienen dato ceden su área a las vecinas).
+ids_lluvias, lon, lat = estaciones_panel(RUTAS_INDICATIVOS[0])
+teselas_lluvias = TeselasThiessen.para(ids_lluvias, lon, lat)
+ids_temperaturas, lon, lat = estaciones_panel(RUTAS_INDICATIVOS[1])
+teselas_temperaturas = TeselasThiessen.para(ids_temperaturas, lon, lat)
+ids_lluvias = ids_lluvias[ids_lluvias < estado.n_estaciones]
+ids_temperaturas = ids_temperaturas[ids_temperaturas < estado.n_estaciones]
+
+# --- Estadísticas de las lluvias (último día).
+prec_dia = estado.ultimo("prec")[ids_lluvias].astype("float64")
+ultimas_lluvias = round(teselas_lluvias.media(ids_lluvias, prec_dia), 1)
+print(f"Han caído {ultimas_lluvias} mm de media en las últimas 24 horas (ponderado por área).")
+
+# Referencia: normal diaria de cada estación para ese día, sobre las estaciones con ambos datos
+normal_dia = normal_acumulada(ids_lluvias, pd.DatetimeIndex([dia]))
+con_normal = np.isfinite(prec_dia) & np.isfinite(normal_dia)
+if con_normal.any():
+    lluvia_ultimas_media = teselas_lluvias.media(ids_lluvias[con_normal], prec_dia[con_normal])
+    lluvias_media_historico_diario = teselas_lluvias.media(ids_lluvias[con_normal], normal_dia[con_normal])
+    referencia = "la normal del día"
+else:
+    historico_lluvias = pd.read_excel(f"{ruta_historico_lluvias}datos_historicos.xlsx")
+    lluvia_ultimas_media = ultimas_lluvias
+    lluvias_media_historico_diario = historico_lluvias["precip_media_mensual_historica"].mean() / 30
+    referencia = f"el histórico diario de {historico_lluvias['mes_historico'].iloc[0]}"
+
+lluvias_variacion_pct = ((lluvia_ultimas_media - lluvias_media_historico_diario) / lluvias_media_historico_diario) * 100
+print(f"La media reciente de lluvias ha variado un {lluvias_variacion_pct:.2f}% respecto a {referencia}.")
+
+# --- Ventanas móviles por estación.
+por_estacion = registro().a_dataframe().iloc[: estado.n_estaciones].copy()
+normales = {}
+for dias in VENTANAS:
+    acumulado = estado.suma(dias)
+    normal = normales[dias] = normal_acumulada(por_estacion["id_estacion"], estado.dias_ventana(dias))
+    por_estacion[f"lluvia_{dias}d"] = np.round(acumulado, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        por_estacion[f"lluvia_{dias}d_pct_normal"] = np.round(100 * acumulado / normal, 1)
+    por_estacion[f"tmax_media_{dias}d"] = np.round(estado.media_tmax(dias), 1)
+dias_hidro = pd.date_range(pd.Timestamp(estado.hidro_inicio), dia, freq="D")
+hidro = estado.anio_hidrologico()
+normales["anio_hidrologico"] = normal_acumulada(por_estacion["id_estacion"], dias_hidro)
+por_estacion["lluvia_anio_hidrologico"] = np.round(hidro, 1)
+with np.errstate(invalid="ignore", divide="ignore"):
+    por_estacion["lluvia_anio_hidrologico_pct_normal"] = np.round(100 * hidro / normales["anio_hidrologico"], 1)
+por_estacion.insert(1, "fecha", dia.strftime("%d/%m/%Y"))
+
+# --- Agregados nacionales y por comunidad, ponderados por área.
+def valores(columna, ids):
+    return por_estacion[columna].to_numpy(dtype="float64")[ids]
+
+def pct_normal(columna, normal, teselas, ids):
+    # Acumulado medio / normal media sobre las estaciones que tienen los dos
+    v, n = valores(columna, ids), normal[ids]
+    ok = np.isfinite(v) & np.isfinite(n) & (n > 0)
+    return 100 * teselas.media(ids[ok], v[ok]) / teselas.media(ids[ok], n[ok]) if ok.any() else np.nan
+
+periodos_lluvia = [(f"lluvia_{d}d", d) for d in VENTANAS] + [("lluvia_anio_hidrologico", "anio_hidrologico")]
+def anadir_ccaa(tabla, columna, teselas, ids, v):
+    ccaa = teselas.media(ids, v, por_ccaa=True)[["cod_ccaa", "ccaa", "valor"]].rename(columns={"valor": columna})
+    return ccaa if tabla is None else tabla.merge(ccaa, on=["cod_ccaa", "ccaa"], how="outer")
+
+nacional = {}
+por_ccaa = anadir_ccaa(None, "lluvia_dia", teselas_lluvias, ids_lluvias, prec_dia)
+for columna, periodo in periodos_lluvia:
+    nacional[columna] = teselas_lluvias.media(ids_lluvias, valores(columna, ids_lluvias))
+    nacional[f"{columna}_pct_normal"] = pct_normal(columna, normales[periodo], teselas_lluvias, ids_lluvias)
+    por_ccaa = anadir_ccaa(por_ccaa, columna, teselas_lluvias, ids_lluvias, valores(columna, ids_lluvias))
+for dias in VENTANAS:
+    columna = f"tmax_media_{dias}d"
+    nacional[columna] = teselas_temperaturas.media(ids_temperaturas, valores(columna, ids_temperaturas))
+    por_ccaa = anadir_ccaa(por_ccaa, columna, teselas_temperaturas, ids_temperaturas, valores(columna, ids_temperaturas))
+for clave, valor in nacional.items():
+    print(f"  · {clave}: {valor:.1f}")
+por_ccaa = por_ccaa.sort_values("ccaa").round(1)
+por_ccaa.insert(2, "fecha", dia.strftime("%d/%m/%Y"))
 
 # --- Crear DataFrame con los resultados.
 fecha_actual = datetime.now().strftime("%d/%m/%Y a las %H:%M")
 
 def num_es(n, dec=1):
+    if pd.isna(n):
+        return ""
     s = f"{float(n):,.{dec}f}"
     return s.replace(",", "X").replace(".", ",").replace("X", ".")
 
 resultados = pd.DataFrame([{
     "actualizacion": fecha_actual,
     "precipitaciones": num_es(ultimas_lluvias, 1),
-    "diferencia": num_es(lluvias_variacion_pct, 1)
+    "diferencia": num_es(lluvias_variacion_pct, 1),
+    "fecha_datos": dia.strftime("%d/%m/%Y"),
+    **{clave: num_es(valor, 1) for clave, valor in nacional.items()},
 }])
 
+por_estacion = por_estacion[por_estacion[[f"lluvia_{d}d" for d in VENTANAS] + ["tmax_media_7d"]].notna().any(axis=1)]
+por_estacion.to_excel(SALIDA_ESTACIONES, index=False)
+print("Exportado:", SALIDA_ESTACIONES)
+por_ccaa.to_excel(SALIDA_CCAA, index=False)
+print("Exportado:", SALIDA_CCAA)
+
 # --- Subir a Google Sheet.
 SUBIR_A_SHEETS    = True
-ID_HOJA_CALCULO   = "1o0DICxbYpq_OqgwTqU9-8GaQzjYj14cdureHGN-uLQA"
 NOMBRE_PESTANA    = "datos"
 INICIO_A1         = f"{NOMBRE_PESTANA}!A1"
-RUTA_CREDENCIALES = f"{directorio}credenciales_google_sheet.json"
-ALCANCES_SHEETS   = ["https://www.googleapis.com/auth/spreadsheets"]
-
-try:
-    import httplib2
-    from googleapiclient.discovery import build
-    from googleapiclient.errors import HttpError
-    from google_auth_httplib2 import AuthorizedHttp
-    from google.oauth2.service_account import Credentials
-    _GSHEETS_DISPONIBLE = True
-except Exception:
-    _GSHEETS_DISPONIBLE = False
-
-def hora() -> str:
-    return _dt.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-
-def _parse_a1(celda: str):
-    m = re.match(r"^([A-Za-z]+)(\d+)?$", celda)
-    if not m:
-        return "A", 1
-    col, fila = m.group(1).upper(), int(m.group(2) or 1)
-    return col, fila
-
-def _exec_reintentado(req, intentos=5, espera_base=1.5):
-    for i in range(intentos):
-        try:
-            return req.execute(num_retries=5)
-        except Exception as e:
-            transitorio = isinstance(e, TimeoutError) or isinstance(e, HttpError)
-            if (i == intentos - 1) or not transitorio:
-                raise
-            time.sleep(espera_base * (2 ** i))
-
-def _construir_servicio_sheets(ruta_credenciales: str, alcances: list[str]):
-    if not _GSHEETS_DISPONIBLE:
-        raise RuntimeError("Faltan dependencias de Google Sheets. Instala: google-api-python-client google-auth-httplib2 google-auth httplib2")
-    cred = Credentials.from_service_account_file(ruta_credenciales, scopes=alcances)
-    _http = httplib2.Http(timeout=500)
-    _authed_http = AuthorizedHttp(cred, http=_http)
-    return build("sheets", "v4", http=_authed_http, cache_discovery=False)
-
-def subir_df_a_sheet(
-    df: pd.DataFrame,
-    spreadsheet_id: str,
-    rango_inicial: str,
-    pestana: str,
-    ruta_credenciales: str,
-    alcances: list[str] = ALCANCES_SHEETS,
-    filas_bloque: int = 2000,
-):
-    servicio = _construir_servicio_sheets(ruta_credenciales=ruta_credenciales, alcances=alcances)
-
-    df = df.copy()
-    for col in df.columns:
-        if is_datetime64_any_dtype(df[col]) or is_datetime64tz_dtype(df[col]):
-            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
-    df = df.applymap(lambda x: x if pd.notnull(x) else None)
-
-    print(f"{hora()}Limpiando hoja '{pestana}' …")
-    _exec_reintentado(servicio.spreadsheets().values().clear(
-        spreadsheetId=spreadsheet_id,
-        range=f"{pestana}!A1:ZZ"
-    ))
-
-    cabecera = list(map(str, df.columns.tolist()))
-    celda_a1 = rango_inicial.replace(f"{pestana}!", "")
-    col_inicio, fila_inicio = _parse_a1(celda_a1)
-    rango_cabecera = f"{pestana}!{col_inicio}{fila_inicio}"
-
-    _exec_reintentado(servicio.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id,
-        range=rango_cabecera,
-        valueInputOption="RAW",
-        body={"values": [cabecera]}
-    ))
-
-    filas = [[("" if v is None else str(v)) for v in fila] for fila in df.to_numpy().tolist()]
-    if not filas:
-        print(f"{hora()}No hay filas para subir en '{pestana}'."); return
-
-    fila_datos_inicio = fila_inicio + 1
-    total = len(filas)
-    bloques = math.ceil(total / filas_bloque)
-    print(f"{hora()}Subiendo datos a '{pestana}' en {bloques} bloque(s)…")
-
-    for i in range(bloques):
-        i0, i1 = i * filas_bloque, min((i + 1) * filas_bloque, total)
-        bloque = filas[i0:i1]
-        rango_escritura = f"{pestana}!{col_inicio}{fila_datos_inicio + i0}"
-        _exec_reintentado(servicio.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=rango_escritura,
-            valueInputOption="RAW",
-            body={"values": bloque}
-        ))
-        print(f"{hora()}  · Bloque {i+1}/{bloques} ({i1 - i0} filas) OK")
 
 # --- Llamada para subir los datos.
 if SUBIR_A_SHEETS:
@@ -156,6 +158,16 @@ if SUBIR_A_SHEETS:
                 alcances=ALCANCES_SHEETS,
                 filas_bloque=2000,
             )
+            for tabla, pestana in ((por_estacion, PESTANA_ESTACIONES), (por_ccaa, PESTANA_CCAA)):
+                subir_df_a_sheet(
+                    df=tabla,
+                    spreadsheet_id=ID_HOJA_CALCULO,
+                    rango_inicial=f"{pestana}!A1",
+                    pestana=pestana,
+                    ruta_credenciales=RUTA_CREDENCIALES,
+                    alcances=ALCANCES_SHEETS,
+                    filas_bloque=2000,
+                )
             print("Subida a Google Sheets completada.")
         except Exception as e:
             print(f"ERROR subiendo a Google Sheets: {e}")
@@ -0,0 +1,193 @@
+# interpolacion.py
+# Rejillas regulares de lluvia y temperatura máxima sobre España a partir de las estaciones de
+# los mapas (MAPA_LLUVIAS.xlsx, MAPA_TEMPERATURAS.xlsx), por distancia inversa ponderada (IDW).
+#
+#  - Vecinos con un cKDTree sobre coordenadas en km; los pesos de cada celda de tierra a sus
+#    VECINOS estaciones más cercanas se guardan como matriz dispersa (celdas × estaciones).
+#  - La caché depende de la rejilla y de las coordenadas de las estaciones del panel: en el día
+#    a día la interpolación es un único producto matriz dispersa × vector. Las estaciones sin
+#    dato ese día se descartan renormalizando los pesos en ese mismo producto.
+#  - Salida: un GeoTIFF float32 por capa y región (península y Baleares / Canarias).
+#
+# Uso:  python interpolacion.py
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from aemet_diarios import RUTAS_INDICATIVOS, leer_indicativos
+from estaciones import RUTA_BASE, ids_de, registro
+from zonas import cargar_zonas, firma_zonas
+
+# =========================
+# Parámetros
+# =========================
+CELDA_GRADOS = 0.025
+REGIONES = {                       # (lon_min, lat_min, lon_max, lat_max)
+    "peninsula": (-9.4, 35.9, 4.4, 43.85),
+    "canarias": (-18.2, 27.6, -13.3, 29.45),
+}
+VECINOS = 8
+POTENCIA = 2.0
+RADIO_KM = 150.0                   # estaciones más lejanas no cuentan
+DISTANCIA_MIN_KM = 0.5             # evita pesos infinitos en la celda de la propia estación
+DIR_CACHE = Path(RUTA_BASE) / "complementarios_aemet" / "cache_interpolacion"
+DIR_SALIDA = Path(RUTA_BASE) / "interpolacion"
+
+CAPAS = {                          # capa: (tabla del mapa, variable, estaciones del panel)
+    "lluvias": (Path(RUTA_BASE) / "MAPA_LLUVIAS.xlsx", "prec", RUTAS_INDICATIVOS[0]),
+    "temperaturas": (Path(RUTA_BASE) / "MAPA_TEMPERATURAS.xlsx", "tmax", RUTAS_INDICATIVOS[1]),
+}
+
+
+# =========================
+# Rejilla y máscara de tierra
+# =========================
+def rejilla(region: str, celda: float = CELDA_GRADOS):
+    """Transformada afín (norte arriba) y forma (filas, columnas) de la región."""
+    lon_min, lat_min, lon_max, lat_max = REGIONES[region]
+    ancho = int(np.ceil((lon_max - lon_min) / celda))
+    alto = int(np.ceil((lat_max - lat_min) / celda))
+    return (celda, 0.0, lon_min, 0.0, -celda, lat_max), (alto, ancho)
+
+
+def centros(transform, shape) -> tuple[np.ndarray, np.ndarray]:
+    a, _, c, _, e, f = transform
+    lon = c + a * (np.arange(shape[1]) + 0.5)
+    lat = f + e * (np.arange(shape[0]) + 0.5)
+    return np.meshgrid(lon, lat)
+
+
+def mascara_tierra(transform, shape) -> np.ndarray:
+    from affine import Affine
+    from rasterio.features import rasterize
+    zonas = cargar_zonas()
+    return rasterize(((g, 1) for g in zonas.geometry), out_shape=shape, transform=Affine(*transform),
+                     fill=0, all_touched=True, dtype="uint8").astype(bool)
+
+
+def _km(lon, lat, lat_ref: float) -> np.ndarray:
+    # Proyección equirrectangular local: suficiente para distancias de vecindad
+    return np.column_stack([np.asarray(lon) * 111.32 * np.cos(np.radians(lat_ref)), np.asarray(lat) * 110.57])
+
+
+# =========================
+# Pesos IDW (cacheados)
+# =========================
+def _clave(region: str, ids: np.ndarray, lon: np.ndarray, lat: np.ndarray) -> str:
+    h = hashlib.sha1()
+    h.update(repr((REGIONES[region], CELDA_GRADOS, VECINOS, POTENCIA, RADIO_KM, firma_zonas())).encode())
+    for arr in (ids.astype("int32"), lon.astype("float32"), lat.astype("float32")):
+        h.update(arr.tobytes())
+    return h.hexdigest()[:16]
+
+
+def pesos_idw(region: str, ids: np.ndarray, lon: np.ndarray, lat: np.ndarray, dir_cache: Path = DIR_CACHE):
+    """Matriz dispersa CSR (celdas de tierra × estaciones) de pesos IDW sin normalizar, índices
+    planos de esas celdas, transformada y forma. Se calcula una vez por conjunto de estaciones."""
+    transform, shape = rejilla(region)
+    cache = Path(dir_cache) / f"idw_{region}_{_clave(region, ids, lon, lat)}.npz"
+    if cache.exists():
+        with np.load(cache) as z:
+            w = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["forma"]))
+            return w, z["celdas"], transform, shape
+
+    lon_c, lat_c = centros(transform, shape)
+    celdas = np.flatnonzero(mascara_tierra(transform, shape))
+    lat_ref = float(np.mean(REGIONES[region][1::2]))
+    k = min(VECINOS, len(ids))
+    arbol = cKDTree(_km(lon, lat, lat_ref))
+    d, j = arbol.query(_km(lon_c.ravel()[celdas], lat_c.ravel()[celdas], lat_ref), k=k,
+                       distance_upper_bound=RADIO_KM)
+    d, j = d.reshape(len(celdas), k), j.reshape(len(celdas), k)
+    validos = np.isfinite(d)                        # sin vecino dentro del radio: d = inf
+    filas = np.repeat(np.arange(len(celdas)), k).reshape(len(celdas), k)
+    w = 1.0 / np.maximum(d[validos], DISTANCIA_MIN_KM) ** POTENCIA
+    w = sparse.csr_matrix((w.astype("float32"), (filas[validos], j[validos])), shape=(len(celdas), len(ids)))
+
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(cache, data=w.data, indices=w.indices, indptr=w.indptr,
+                        forma=np.array(w.shape), celdas=celdas)
+    return w, celdas, transform, shape
+
+
+def interpolar(w: sparse.csr_matrix, valores: np.ndarray) -> np.ndarray:
+    # Numerador y denominador en un solo producto: las estaciones sin dato pesan cero
+    ok = np.isfinite(valores)
+    cols = np.column_stack([np.where(ok, valores, 0.0), ok.astype("float64")])
+    num, den = (w @ cols).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def guardar_geotiff(ruta: Path, arr: np.ndarray, transform):
+    import rasterio
+    from affine import Affine
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(ruta, "w", driver="GTiff", height=arr.shape[0], width=arr.shape[1], count=1,
+                       dtype="float32", crs="EPSG:4326", transform=Affine(*transform), nodata=np.nan,
+                       compress="deflate", predictor=3, tiled=True) as ds:
+        ds.write(arr.astype("float32"), 1)
+
+
+# =========================
+# Capas
+# =========================
+def estaciones_panel(ruta_indicativos) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Ids y coordenadas (registro) de las estaciones del panel con posición conocida."""
+    ids = np.unique(ids_de(leer_indicativos(ruta_indicativos)))
+    reg = registro()
+    ids = ids[(ids >= 0) & (ids < len(reg))]
+    lon, lat = reg.lon[ids].astype("float64"), reg.lat[ids].astype("float64")
+    ok = np.isfinite(lon) & np.isfinite(lat)
+    return ids[ok], lon[ok], lat[ok]
+
+
+def interpolar_capa(capa: str) -> list[Path]:
+    ruta_mapa, variable, ruta_indicativos = CAPAS[capa]
+    if not ruta_mapa.exists():
+        print(f"AVISO: no existe {ruta_mapa}; se omite la capa {capa}.")
+        return []
+    mapa = pd.read_excel(ruta_mapa, dtype={"indicativo": str})
+    # Las coordenadas del mapa completan las del registro antes de fijar el conjunto de estaciones
+    reg = registro()
+    reg.actualizar_desde_tabla(mapa[[c for c in ("indicativo", "latitud", "longitud") if c in mapa.columns]])
+    if reg.modificado:
+        reg.guardar()
+    ids, lon, lat = estaciones_panel(ruta_indicativos)
+
+    valores = np.full(len(ids), np.nan)
+    ids_mapa = reg.ids_de(mapa["indicativo"])
+    pos = pd.Index(ids).get_indexer(ids_mapa)
+    v = pd.to_numeric(mapa[variable], errors="coerce").to_numpy(dtype="float64")
+    sel = pos >= 0
+    valores[pos[sel]] = v[sel]
+
+    salidas = []
+    for region in REGIONES:
+        w, celdas, transform, shape = pesos_idw(region, ids, lon, lat)
+        arr = np.full(shape[0] * shape[1], np.nan, dtype="float32")
+        arr[celdas] = interpolar(w, valores)
+        ruta = DIR_SALIDA / f"{capa}_{region}.tif"
+        guardar_geotiff(ruta, arr.reshape(shape), transform)
+        salidas.append(ruta)
+        print(f"  · {capa}/{region}: {shape[0]}x{shape[1]} celdas, {len(celdas)} en tierra, "
+              f"{int(np.isfinite(valores).sum())}/{len(ids)} estaciones con dato → {ruta.name}")
+    return salidas
+
+
+def main():
+    for capa in CAPAS:
+        interpolar_capa(capa)
+
+
+if __name__ == "__main__":
+    t0 = datetime.now()
+    main()
+    print(f"Tiempo: {(datetime.now() - t0).total_seconds():.1f}s")
@@ -0,0 +1,181 @@
+# mar_climatologia.py
+# Climatología mensual de SST acumulada de forma incremental a partir de las rejillas diarias
+# (temperatura_mar_<stamp>.npz). Sumas, sumas de cuadrados y recuentos por mes viven en
+# ficheros memmap: añadir un día cuesta O(rejilla) y el histórico nunca se carga entero en RAM.
+# Por celda y mes se guarda también qué años han aportado días (máscara de bits): la media de
+# unas semanas no es una climatología, así que las consultas pueden exigir MIN_ANIOS años.
+#
+# Uso:  python mar_climatologia.py   → incorpora todas las rejillas diarias aún no acumuladas
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+
+from mar_rejilla import cargar_rejilla, desplazamiento
+
+DIR_MAR = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_mar/")
+DIR_CLIMATOLOGIA = DIR_MAR / "climatologia"
+MIN_DIAS_MES = 20  # días acumulados mínimos por celda y mes para usar la media
+MIN_ANIOS = 5      # años distintos por celda y mes para usarla como línea base o umbral
+ANIO_BASE = 1990   # bit 0 de la máscara de años (uint64: hasta 2053)
+
+_PATRON_REJILLA = re.compile(r"temperatura_mar_(\d{8})_12utc\.npz$")
+
+
+class ClimatologiaSST:
+    def __init__(self, directorio: Path, shape: tuple[int, int], transform: tuple, fechas: set[str], modo: str):
+        self.directorio = Path(directorio)
+        self.shape = tuple(shape)
+        self.transform = tuple(transform)
+        self.fechas = fechas
+        forma = (12, *self.shape)
+        self.sumas = np.memmap(self.directorio / "sumas.dat", dtype="float64", mode=modo, shape=forma)
+        self.sumas2 = np.memmap(self.directorio / "sumas2.dat", dtype="float64", mode=modo, shape=forma)
+        self.cuentas = np.memmap(self.directorio / "cuentas.dat", dtype="uint16", mode=modo, shape=forma)
+        ruta_anios = self.directorio / "anios.dat"
+        nuevo = not ruta_anios.exists()
+        self.anios_bits = np.memmap(ruta_anios, dtype="uint64", mode="w+" if nuevo else modo, shape=forma)
+        if nuevo and self.fechas:
+            # Climatología anterior a la máscara: cada fecha acumulada marca su año en las celdas
+            # con algún dato en ese mes
+            for f in sorted(self.fechas):
+                mes, bit = int(f[4:6]) - 1, np.uint64(1) << np.uint64(int(f[:4]) - ANIO_BASE)
+                self.anios_bits[mes][np.asarray(self.cuentas[mes]) > 0] |= bit
+
+    # ---------- persistencia ----------
+    @classmethod
+    def abrir(cls, directorio: Path = DIR_CLIMATOLOGIA, shape=None, transform=None) -> "ClimatologiaSST":
+        directorio = Path(directorio)
+        meta = directorio / "meta.json"
+        if meta.exists():
+            m = json.loads(meta.read_text(encoding="utf-8"))
+            return cls(directorio, m["shape"], m["transform"], set(m["fechas"]), modo="r+")
+        if shape is None or transform is None:
+            raise FileNotFoundError(f"No existe climatología en {directorio} y no se ha indicado rejilla base.")
+        directorio.mkdir(parents=True, exist_ok=True)
+        clim = cls(directorio, shape, tuple(float(v) for v in tuple(transform)[:6]), set(), modo="w+")
+        clim.guardar()
+        return clim
+
+    def guardar(self):
+        for mm in (self.sumas, self.sumas2, self.cuentas, self.anios_bits):
+            mm.flush()
+        meta = {"shape": list(self.shape), "transform": list(self.transform), "fechas": sorted(self.fechas)}
+        (self.directorio / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    # ---------- actualización ----------
+    def _ventanas(self, transform, shape_sub):
+        fila_off, col_off = desplazamiento(self.transform, transform)
+        r0, c0 = max(fila_off, 0), max(col_off, 0)
+        r1 = min(fila_off + shape_sub[0], self.shape[0])
+        c1 = min(col_off + shape_sub[1], self.shape[1])
+        if r1 <= r0 or c1 <= c0:
+            return None
+        base = (slice(r0, r1), slice(c0, c1))
+        sub = (slice(r0 - fila_off, r1 - fila_off), slice(c0 - col_off, c1 - col_off))
+        return base, sub
+
+    def actualizar(self, arr: np.ndarray, transform, fecha: str) -> bool:
+        """Suma un día (fecha 'YYYYMMDD') a su mes. Devuelve False si ya estaba acumulado."""
+        if fecha in self.fechas:
+            return False
+        ventanas = self._ventanas(transform, arr.shape)
+        if ventanas is None:
+            raise ValueError("La rejilla diaria no solapa con la rejilla de la climatología.")
+        base, sub = ventanas
+        mes = int(fecha[4:6]) - 1
+        valores = np.asarray(arr[sub], dtype="float64")
+        ok = np.isfinite(valores)
+        v = np.where(ok, valores, 0.0)
+        self.sumas[mes][base] += v
+        self.sumas2[mes][base] += v * v
+        self.cuentas[mes][base] += ok.astype("uint16")
+        self.anios_bits[mes][base] |= np.where(ok, np.uint64(1) << np.uint64(int(fecha[:4]) - ANIO_BASE), np.uint64(0))
+        self.fechas.add(fecha)
+        return True
+
+    # ---------- consulta ----------
+    def anios(self, mes: int) -> np.ndarray:
+        """Años distintos con algún dato por celda en ese mes."""
+        bits = np.ascontiguousarray(self.anios_bits[mes - 1])
+        return np.unpackbits(bits.view(np.uint8).reshape(*bits.shape, 8), axis=-1).sum(axis=-1)
+
+    def media(self, mes: int, min_dias: int = MIN_DIAS_MES, min_anios: int = 0) -> np.ndarray:
+        n = np.asarray(self.cuentas[mes - 1], dtype="float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = np.asarray(self.sumas[mes - 1]) / n
+        m[n < max(min_dias, 1)] = np.nan
+        if min_anios > 0:
+            m[self.anios(mes) < min_anios] = np.nan
+        return m.astype("float32")
+
+    def desviacion(self, mes: int, min_dias: int = MIN_DIAS_MES, min_anios: int = 0) -> np.ndarray:
+        n = np.asarray(self.cuentas[mes - 1], dtype="float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = np.asarray(self.sumas[mes - 1]) / n
+            var = np.asarray(self.sumas2[mes - 1]) / n - m * m
+        var = np.clip(var, 0.0, None) * n / np.maximum(n - 1, 1)  # corrección muestral
+        var[n < max(min_dias, 2)] = np.nan
+        if min_anios > 0:
+            var[self.anios(mes) < min_anios] = np.nan
+        return np.sqrt(var).astype("float32")
+
+    def media_en(self, mes: int, transform, shape, min_dias: int = MIN_DIAS_MES, min_anios: int = 0) -> np.ndarray:
+        # Media mensual recortada a otra rejilla de la misma malla (p. ej. la del día actual)
+        out = np.full(shape, np.nan, dtype="float32")
+        ventanas = self._ventanas(transform, shape)
+        if ventanas is not None:
+            base, sub = ventanas
+            out[sub] = self.media(mes, min_dias, min_anios)[base]
+        return out
+
+    def desviacion_en(self, mes: int, transform, shape, min_dias: int = MIN_DIAS_MES, min_anios: int = 0) -> np.ndarray:
+        out = np.full(shape, np.nan, dtype="float32")
+        ventanas = self._ventanas(transform, shape)
+        if ventanas is not None:
+            base, sub = ventanas
+            out[sub] = self.desviacion(mes, min_dias, min_anios)[base]
+        return out
+
+
+def acumular_dia(arr: np.ndarray, transform, fecha: str, directorio: Path = DIR_CLIMATOLOGIA) -> bool:
+    clim = ClimatologiaSST.abrir(directorio, shape=arr.shape, transform=transform)
+    nuevo = clim.actualizar(arr, transform, fecha)
+    if nuevo:
+        clim.guardar()
+    return nuevo
+
+
+def rejillas_diarias(dir_mar: Path = DIR_MAR) -> list[tuple[str, Path]]:
+    out = []
+    for p in Path(dir_mar).glob("temperatura_mar_*_12utc.npz"):
+        m = _PATRON_REJILLA.search(p.name)
+        if m:
+            out.append((m.group(1), p))
+    return sorted(out)
+
+
+def main():
+    pendientes = rejillas_diarias()
+    if not pendientes:
+        print(f"No hay rejillas diarias en {DIR_MAR}.")
+        return
+    clim = None
+    nuevos = 0
+    for fecha, ruta in pendientes:
+        arr, transform = cargar_rejilla(ruta)
+        if clim is None:
+            clim = ClimatologiaSST.abrir(DIR_CLIMATOLOGIA, shape=arr.shape, transform=transform)
+        if clim.actualizar(arr, transform, fecha):
+            nuevos += 1
+            print(f"  · {fecha} acumulado")
+    clim.guardar()
+    print(f"Climatología actualizada: {nuevos} día(s) nuevo(s), {len(clim.fechas)} en total.")
+
+
+if __name__ == "__main__":
+    main()
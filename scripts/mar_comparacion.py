@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
-import geopandas as gpd
+import sys
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
 
+from mar_rejilla import cargar_rejilla, guardar_rejilla, rejilla_desde_puntos, alinear, a_puntos
+from mar_climatologia import ClimatologiaSST, DIR_CLIMATOLOGIA, MIN_ANIOS
+from mar_zonas import mascara_zonas, estadisticas_zonales
+from sheets import ID_HOJA_CALCULO, RUTA_CREDENCIALES, ALCANCES_SHEETS, hora, subir_df_a_sheet
+
 # =========================
 # Configuración de paths
 # =========================
@@ -14,135 +21,10 @@ DIR = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_mar/")
 # Opciones de subida a Google Sheets
 # =========================
 SUBIR_A_SHEETS    = True
-ID_HOJA_CALCULO   = "1o0DICxbYpq_OqgwTqU9-8GaQzjYj14cdureHGN-uLQA"
 NOMBRE_PESTANA    = "temperatura_mar"
 INICIO_A1         = f"{NOMBRE_PESTANA}!A1"
-RUTA_CREDENCIALES = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/credenciales_google_sheet.json"
-ALCANCES_SHEETS   = ["https://www.googleapis.com/auth/spreadsheets"]
-
-# =========================
-# Dependencias y helpers Google Sheets
-# =========================
-import re, time, math
-from datetime import datetime as _dt
-from pandas.api.types import is_datetime64_any_dtype, is_datetime64tz_dtype
-
-try:
-    import httplib2
-    from google.oauth2.service_account import Credentials
-    from googleapiclient.discovery import build
-    from googleapiclient.errors import HttpError
-    from google_auth_httplib2 import AuthorizedHttp
-    _GSHEETS_DISPONIBLE = True
-except Exception:
-    _GSHEETS_DISPONIBLE = False
-
-def hora() -> str:
-    return _dt.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-
-def _parse_a1(celda: str):
-    m = re.match(r"^([A-Za-z]+)(\d+)?$", celda)
-    if not m:
-        return "A", 1
-    col, fila = m.group(1).upper(), int(m.group(2) or 1)
-    return col, fila
-
-def _exec_reintentado(req, intentos=5, espera_base=1.5):
-    for i in range(intentos):
-        try:
-            return req.execute(num_retries=5)
-        except Exception as e:
-            transitorio = isinstance(e, TimeoutError) or isinstance(e, HttpError)
-            if (i == intentos - 1) or not transitorio:
-                raise
-            time.sleep(espera_base * (2 ** i))
-
-def _construir_servicio_sheets(ruta_credenciales: str, alcances: list[str]):
-    if not _GSHEETS_DISPONIBLE:
-        raise RuntimeError(
-            "Faltan dependencias de Google Sheets. Instala: "
-            "google-api-python-client google-auth-httplib2 google-auth httplib2"
-        )
-    cred = Credentials.from_service_account_file(ruta_credenciales, scopes=alcances)
-    _http = httplib2.Http(timeout=500)
-    _authed_http = AuthorizedHttp(cred, http=_http)
-    return build("sheets", "v4", http=_authed_http, cache_discovery=False)
-
-def subir_df_a_sheet(
-    df: pd.DataFrame,
-    spreadsheet_id: str,
-    rango_inicial: str,
-    pestana: str,
-    ruta_credenciales: str,
-    alcances: list[str] = ALCANCES_SHEETS,
-    filas_bloque: int = 2000,
-):
-    servicio = _construir_servicio_sheets(ruta_credenciales=ruta_credenciales, alcances=alcances)
-
-    df = df.copy()
-
-    # Asegurar que lat/lon como texto si existiesen con estos nombres habituales
-    for c in ["LATITUD", "LONGITUD", "LATITUDE", "LONGITUDE", "latitud", "longitud"]:
-        if c in df.columns:
-            df[c] = df[c].astype(str)
-
-    # Formatear columnas de fecha/hora
-    for col in df.columns:
-        if is_datetime64_any_dtype(df[col]) or is_datetime64tz_dtype(df[col]):
-            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    def _a_texto(x):
-        if isinstance(x, (pd.Timestamp, _dt)):
-            return x.strftime("%Y-%m-%d %H:%M:%S")
-        return x
-
-    df = df.applymap(_a_texto).where(pd.notnull(df), None)
-
-    print(f"{hora()}Limpiando hoja '{pestana}' …")
-    _exec_reintentado(
-        servicio.spreadsheets().values().clear(
-            spreadsheetId=spreadsheet_id, range=f"{pestana}!A1:ZZ"
-        )
-    )
-
-    cabecera = list(map(str, df.columns.tolist()))
-    filas = [[("" if v is None else str(v)) for v in fila] for fila in df.to_numpy().tolist()]
-
-    celda_a1 = rango_inicial.replace(f"{pestana}!", "")
-    col_inicio, fila_inicio = _parse_a1(celda_a1)
-
-    rango_cabecera = f"{pestana}!{col_inicio}{fila_inicio}"
-    _exec_reintentado(
-        servicio.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=rango_cabecera,
-            valueInputOption="RAW",
-            body={"values": [cabecera]},
-        )
-    )
-
-    if not filas:
-        print(f"{hora()}No hay filas para subir en '{pestana}'.")
-        return
-
-    fila_datos_inicio = fila_inicio + 1
-    total = len(filas)
-    bloques = math.ceil(total / filas_bloque)
-    print(f"{hora()}Subiendo datos a '{pestana}' en {bloques} bloque(s) de hasta {filas_bloque} fila(s)…")
-
-    for i in range(bloques):
-        i0, i1 = i * filas_bloque, min((i + 1) * filas_bloque, total)
-        bloque = filas[i0:i1]
-        rango_escritura = f"{pestana}!{col_inicio}{fila_datos_inicio + i0}"
-        _exec_reintentado(
-            servicio.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=rango_escritura,
-                valueInputOption="RAW",
-                body={"values": bloque},
-            )
-        )
-        print(f"{hora()}  · Bloque {i+1}/{bloques} ({i1 - i0} filas) OK")
+PESTANA_ZONAS     = "temperatura_mar_zonas"
+INICIO_A1_ZONAS   = f"{PESTANA_ZONAS}!A1"
 
 # =========================
 # Lógica original
@@ -156,23 +38,79 @@ ayer_utc = hoy_utc - pd.Timedelta(days=1)          # día anterior
 fecha = ayer_utc + pd.Timedelta(hours=12)          # 12:00Z del día anterior
 stamp = fecha.strftime("%Y%m%d_12utc")
 
-# Leer datos
-gdf_actual = gpd.read_file(DIR / f"temperatura_mar_{stamp}.geojson")[["lon", "lat", "sst_c"]]
-gdf_actual = gdf_actual.rename(columns={"sst_c": "sst_actual"})
-
-gdf_hist = gpd.read_file(DIR / "ssc_septiembre_historico.geojson")[["lon", "lat", "sst_media_sep_c"]]
-
-# Asegurar que lon y lat son numéricas float
-for col in ["lon", "lat"]:
-    gdf_actual[col] = pd.to_numeric(gdf_actual[col], errors="coerce").astype(float)
-    gdf_hist[col] = pd.to_numeric(gdf_hist[col], errors="coerce").astype(float)
-
-# Usar valor histórico tal cual (sin calcular medias)
-df_hist_media = gdf_hist.rename(columns={"sst_media_sep_c": "sst_hist_media"})
-
-# Unir y calcular diferencia
-df_comp = gdf_actual.merge(df_hist_media, on=["lon", "lat"], how="inner")
-df_comp["diferencia"] = df_comp["sst_actual"] - df_comp["sst_hist_media"]
+# Rejilla actual (generada por mar_temperatura_actual.py)
+sst_actual, transform = cargar_rejilla(DIR / f"temperatura_mar_{stamp}.npz")
+
+# Línea base del mes del dato: el fichero histórico de ese mes (ssc_<mes>_historico.geojson).
+# La climatología acumulada (mar_climatologia.py) solo lo sustituye en las celdas que ya
+# reúnen MIN_ANIOS años distintos: antes sería la media del propio mes en curso.
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+         "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+mes = int(ayer_utc.month)
+nombre_mes = MESES[mes - 1]
+RUTA_HIST_GEOJSON = DIR / f"ssc_{nombre_mes}_historico.geojson"
+RUTA_HIST_REJILLA = DIR / f"ssc_{nombre_mes}_historico.npz"
+
+def _rejilla_historica(transform_base, shape_base):
+    # La rejilla del fichero histórico se construye una sola vez (lon/lat → fila/columna
+    # enteras) y se reutiliza desde el .npz
+    if RUTA_HIST_REJILLA.exists():
+        arr, transform_hist = cargar_rejilla(RUTA_HIST_REJILLA)
+        return alinear(arr, transform_hist, transform_base, shape_base)
+    if not RUTA_HIST_GEOJSON.exists():
+        return None
+    import geopandas as gpd
+    gdf_hist = gpd.read_file(RUTA_HIST_GEOJSON)
+    col_media = next((c for c in gdf_hist.columns if c.startswith("sst_media")), None)
+    if col_media is None:
+        raise ValueError(f"{RUTA_HIST_GEOJSON.name} no tiene ninguna columna 'sst_media_*'.")
+    lon = pd.to_numeric(gdf_hist["lon"], errors="coerce").to_numpy(dtype="float64")
+    lat = pd.to_numeric(gdf_hist["lat"], errors="coerce").to_numpy(dtype="float64")
+    val = pd.to_numeric(gdf_hist[col_media], errors="coerce").to_numpy(dtype="float64")
+    ok = np.isfinite(lon) & np.isfinite(lat)
+    arr = rejilla_desde_puntos(lon[ok], lat[ok], val[ok], transform_base, shape_base)
+    guardar_rejilla(RUTA_HIST_REJILLA, arr, transform_base)
+    print("Rejilla histórica generada en:", RUTA_HIST_REJILLA)
+    return arr
+
+def _rejilla_climatologia(transform_base, shape_base):
+    try:
+        clim = ClimatologiaSST.abrir(DIR_CLIMATOLOGIA)
+    except FileNotFoundError:
+        return None
+    media = clim.media_en(mes, transform_base, shape_base, min_anios=MIN_ANIOS)
+    # Sin ninguna celda con MIN_ANIOS años la climatología aún no sirve de línea base
+    return media if np.isfinite(media).any() else None
+
+sst_clim = _rejilla_climatologia(transform, sst_actual.shape)
+sst_fichero = _rejilla_historica(transform, sst_actual.shape)
+if sst_clim is None and sst_fichero is None:
+    raise FileNotFoundError(f"No hay línea base para {nombre_mes}: ni climatología ni {RUTA_HIST_GEOJSON.name}.")
+if sst_clim is None:
+    sst_hist = sst_fichero
+elif sst_fichero is None:
+    sst_hist = sst_clim
+else:
+    sst_hist = np.where(np.isfinite(sst_clim), sst_clim, sst_fichero)
+n_clim = 0 if sst_clim is None else int(np.isfinite(sst_clim).sum())
+print(f"Línea base de {nombre_mes}: {n_clim} celdas desde climatología acumulada "
+      f"(≥ {MIN_ANIOS} años), el resto desde el fichero histórico.")
+if not np.isfinite(sst_hist).any():
+    # Sin línea base no se publica una comparación vacía: las hojas conservan la anterior
+    print(f"AVISO: la línea base de {nombre_mes} no tiene ninguna celda con dato; no se exporta ni se sube la comparación.")
+    sys.exit(0)
+
+# Diferencia como resta de arrays alineados; solo se generan puntos para exportar
+diferencia = sst_actual - sst_hist
+filas, cols, lons, lats = a_puntos(diferencia, transform)
+
+df_comp = pd.DataFrame({
+    "lon": lons,
+    "lat": lats,
+    "sst_actual": sst_actual[filas, cols].astype("float64"),
+    "sst_hist_media": sst_hist[filas, cols].astype("float64"),
+    "diferencia": diferencia[filas, cols].astype("float64"),
+})
 
 # Redondear temperaturas a 1 decimal
 temp_cols = ["sst_actual", "sst_hist_media", "diferencia"]
@@ -225,6 +163,25 @@ df_comp.to_excel(out_xlsx, index=False, sheet_name="comparacion")
 print("Guardado:", out_xlsx)
 print(df_comp.dtypes)
 
+# =========================
+# SST por zona costera AEMET (media, máxima y anomalía)
+# =========================
+etiquetas, tabla_zonas = mascara_zonas(transform, sst_actual.shape)
+stats = estadisticas_zonales(etiquetas, len(tabla_zonas), sst=sst_actual, anomalia=diferencia)
+df_zonas = pd.concat([tabla_zonas.reset_index(drop=True), stats], axis=1)
+df_zonas = df_zonas.rename(columns={"sst_n_celdas": "n_celdas"}).drop(columns=["anomalia_n_celdas", "anomalia_max"])
+df_zonas = df_zonas[df_zonas["n_celdas"] > 0].reset_index(drop=True)
+for c in ["sst_media", "sst_max", "anomalia_media"]:
+    df_zonas[c] = df_zonas[c].astype(float).round(1)
+df_zonas["sst_media_txt"] = df_zonas["sst_media"].apply(fmt_es)
+df_zonas["sst_max_txt"] = df_zonas["sst_max"].apply(fmt_es)
+df_zonas["anomalia_media_txt"] = df_zonas["anomalia_media"].apply(fmt_es_signed)
+df_zonas["fecha_actualizado"] = FECHA_ACTUALIZADO
+
+out_zonas = DIR / "sst_zonas_costeras.xlsx"
+df_zonas.to_excel(out_zonas, index=False, sheet_name="zonas")
+print("Guardado:", out_zonas, f"({len(df_zonas)} zonas)")
+
 # =========================
 # Subida a Google Sheets (opcional)
 # =========================
@@ -240,5 +197,14 @@ if SUBIR_A_SHEETS:
             alcances=ALCANCES_SHEETS,
         )
         print(f"{hora()}Subida completada en la hoja '{NOMBRE_PESTANA}'.")
+        subir_df_a_sheet(
+            df=df_zonas,
+            spreadsheet_id=ID_HOJA_CALCULO,
+            rango_inicial=INICIO_A1_ZONAS,
+            pestana=PESTANA_ZONAS,
+            ruta_credenciales=RUTA_CREDENCIALES,
+            alcances=ALCANCES_SHEETS,
+        )
+        print(f"{hora()}Subida completada en la hoja '{PESTANA_ZONAS}'.")
     except Exception as e:
         print(f"{hora()}ERROR subiendo a Google Sheets: {e}")
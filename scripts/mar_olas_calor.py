@@ -0,0 +1,141 @@
+# mar_olas_calor.py
+# Detección de olas de calor marinas sobre la pila de rejillas diarias de SST
+# (temperatura_mar_<stamp>.npz que guarda mar_temperatura_actual.py).
+#
+# Criterio (Hobday et al., 2016): una celda está en ola de calor cuando supera el umbral
+# climatológico del percentil 90 durante al menos DIAS_MINIMOS días seguidos. El umbral se
+# aproxima con la climatología mensual acumulada: media + z(p) · desviación típica, solo en
+# las celdas cuya climatología reúne ya MIN_ANIOS años (antes no es un percentil climatológico).
+
+from __future__ import annotations
+
+from datetime import datetime
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from mar_rejilla import cargar_rejilla, alinear, lon_lat
+from mar_climatologia import ClimatologiaSST, DIR_CLIMATOLOGIA, DIR_MAR, MIN_ANIOS, rejillas_diarias
+from rachas import rachas, recortar_rachas, reducir_rachas
+from sheets import subir_si_procede
+
+# =========================
+# Parámetros
+# =========================
+VENTANA_DIAS = 120   # días de SST diaria que se analizan
+DIAS_MINIMOS = 5     # duración mínima de un episodio
+PERCENTIL = 90       # percentil climatológico del umbral
+SUBIR_A_SHEETS = True
+NOMBRE_PESTANA = "olas_calor_marinas"
+SALIDA_XLSX = DIR_MAR / "olas_calor_marinas.xlsx"
+
+
+def cargar_pila(ventana_dias: int = VENTANA_DIAS):
+    """Pila (T, H, W) float32 alineada con la rejilla más reciente, con un plano por día de
+    calendario (los días sin fichero quedan a NaN)."""
+    disponibles = rejillas_diarias()
+    if not disponibles:
+        raise FileNotFoundError(f"No hay rejillas diarias de SST en {DIR_MAR}.")
+    ultima = pd.Timestamp(disponibles[-1][0])
+    fechas = pd.date_range(ultima - pd.Timedelta(days=ventana_dias - 1), ultima, freq="D")
+    pos = {f.strftime("%Y%m%d"): i for i, f in enumerate(fechas)}
+
+    arr_ref, transform = cargar_rejilla(disponibles[-1][1])
+    pila = np.full((len(fechas), *arr_ref.shape), np.nan, dtype="float32")
+    for fecha, ruta in disponibles:
+        if fecha not in pos:
+            continue
+        arr, t = cargar_rejilla(ruta)
+        pila[pos[fecha]] = arr if t == transform and arr.shape == arr_ref.shape else \
+            alinear(arr, t, transform, arr_ref.shape)
+    return pila, fechas, transform
+
+
+def umbrales(fechas: pd.DatetimeIndex, transform, shape, percentil: float = PERCENTIL):
+    # Media y umbral por día: se calculan una vez por mes presente en la ventana
+    clim = ClimatologiaSST.abrir(DIR_CLIMATOLOGIA)
+    z = NormalDist().inv_cdf(percentil / 100.0)
+    media = np.empty((len(fechas), *shape), dtype="float32")
+    umbral = np.empty_like(media)
+    meses = fechas.month.to_numpy()
+    for mes in np.unique(meses):
+        m = clim.media_en(int(mes), transform, shape, min_anios=MIN_ANIOS)
+        s = clim.desviacion_en(int(mes), transform, shape, min_anios=MIN_ANIOS)
+        sel = meses == mes
+        media[sel] = m
+        umbral[sel] = m + z * s
+    return media, umbral
+
+
+def detectar(pila: np.ndarray, media: np.ndarray, umbral: np.ndarray, dias_minimos: int = DIAS_MINIMOS):
+    """Episodios por celda: (celda, inicio, fin, dias_observados, intensidad_media, intensidad_max).
+
+    Los días sin dato (nubes) no cortan un episodio, pero solo cuentan los días observados
+    por encima del umbral para alcanzar la duración mínima, y el episodio empieza y acaba en
+    días observados por encima del umbral.
+    """
+    t = pila.shape[0]
+    sst = pila.reshape(t, -1)
+    anom = sst - media.reshape(t, -1)
+    supera = sst > umbral.reshape(t, -1)
+    hueco = np.isnan(sst)
+
+    celda, inicio, fin = recortar_rachas(supera, *rachas(supera | hueco))
+    observados = reducir_rachas(supera.astype(np.int32), celda, inicio, fin, np.add)
+    ok = observados >= dias_minimos
+    celda, inicio, fin, observados = celda[ok], inicio[ok], fin[ok], observados[ok]
+
+    anom_sup = np.where(supera, anom, np.nan).astype("float64")
+    suma = reducir_rachas(np.nan_to_num(anom_sup, nan=0.0), celda, inicio, fin, np.add)
+    maximo = reducir_rachas(anom_sup, celda, inicio, fin, np.fmax)
+    return celda, inicio, fin, observados, suma / observados, maximo
+
+
+def tabla_episodios(celda, inicio, fin, observados, int_media, int_max, fechas, transform, shape) -> pd.DataFrame:
+    filas, cols = np.unravel_index(celda, shape)
+    lon, lat = lon_lat(transform, filas, cols)
+    ultimo = len(fechas) - 1
+    df = pd.DataFrame({
+        "lon": lon,
+        "lat": lat,
+        "inicio": fechas[inicio].strftime("%Y-%m-%d"),
+        "fin": fechas[fin - 1].strftime("%Y-%m-%d"),
+        "duracion_dias": (fin - inicio).astype(int),
+        "dias_sobre_umbral": observados.astype(int),
+        "intensidad_media": np.round(int_media, 2),
+        "intensidad_max": np.round(int_max, 2),
+        "activa": (fin - 1) == ultimo,
+    })
+    return df.sort_values(["activa", "intensidad_max"], ascending=[False, False]).reset_index(drop=True)
+
+
+def main():
+    pila, fechas, transform = cargar_pila()
+    shape = pila.shape[1:]
+    print(f"Pila SST: {pila.shape[0]} días × {shape[0]}x{shape[1]} celdas "
+          f"({fechas[0]:%Y-%m-%d} → {fechas[-1]:%Y-%m-%d})")
+
+    media, umbral = umbrales(fechas, transform, shape)
+    if not np.isfinite(umbral).any():
+        print(f"AVISO: ninguna celda tiene aún {MIN_ANIOS} años de climatología; no se detectan olas de calor marinas.")
+        return
+    episodios = detectar(pila, media, umbral)
+    df = tabla_episodios(*episodios, fechas, transform, shape)
+
+    celdas_validas = int(np.isfinite(umbral[-1]).sum())
+    activas = int(df["activa"].sum())
+    pct = 100.0 * activas / celdas_validas if celdas_validas else 0.0
+    print(f"Episodios: {len(df)} · activos hoy: {activas} celdas ({pct:.1f}% de las celdas con climatología)")
+
+    df["fecha_actualizado"] = fechas[-1].strftime("%d/%m/%Y")
+    df.to_excel(SALIDA_XLSX, index=False, sheet_name="episodios")
+    print("Guardado:", SALIDA_XLSX)
+
+    subir_si_procede(df[df["activa"]], NOMBRE_PESTANA, activo=SUBIR_A_SHEETS)
+
+
+if __name__ == "__main__":
+    t0 = datetime.now()
+    main()
+    print(f"Tiempo: {(datetime.now() - t0).total_seconds():.1f}s")
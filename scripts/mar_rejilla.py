@@ -0,0 +1,100 @@
+# mar_rejilla.py
+# Rejillas de SST alineadas: array float32 + transformada afín (a, b, c, d, e, f),
+# con claves enteras fila/columna en lugar de coordenadas lon/lat en coma flotante.
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+# Tolerancia (en fracción de celda) para considerar dos rejillas alineadas
+TOLERANCIA_CELDA = 1e-3
+
+
+def _afin(transform) -> tuple[float, float, float, float, float, float]:
+    # Admite rasterio.Affine (9 coeficientes), tuplas o arrays de 6
+    a, b, c, d, e, f = (float(v) for v in tuple(transform)[:6])
+    if b != 0.0 or d != 0.0:
+        raise ValueError("Solo se admiten rejillas norte-arriba (sin rotación).")
+    return a, b, c, d, e, f
+
+
+def guardar_rejilla(ruta: str | Path, arr: np.ndarray, transform, **meta) -> Path:
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    extra = {k: np.asarray(v) for k, v in meta.items()}
+    np.savez_compressed(
+        ruta,
+        sst=np.asarray(arr, dtype="float32"),
+        transform=np.asarray(_afin(transform), dtype="float64"),
+        **extra,
+    )
+    return ruta
+
+
+def cargar_rejilla(ruta: str | Path) -> tuple[np.ndarray, tuple]:
+    with np.load(ruta) as z:
+        return z["sst"].astype("float32"), tuple(float(v) for v in z["transform"])
+
+
+def filas_columnas(transform, lon, lat) -> tuple[np.ndarray, np.ndarray]:
+    # Centro de celda → índice entero (redondeo: inmune a diferencias de 1 ULP)
+    a, _, c, _, e, f = _afin(transform)
+    cols = np.rint((np.asarray(lon, dtype="float64") - c) / a - 0.5).astype("int64")
+    filas = np.rint((np.asarray(lat, dtype="float64") - f) / e - 0.5).astype("int64")
+    return filas, cols
+
+
+def lon_lat(transform, filas, cols) -> tuple[np.ndarray, np.ndarray]:
+    a, _, c, _, e, f = _afin(transform)
+    lon = c + a * (np.asarray(cols, dtype="float64") + 0.5)
+    lat = f + e * (np.asarray(filas, dtype="float64") + 0.5)
+    return lon, lat
+
+
+def rejilla_desde_puntos(lon, lat, valores, transform, shape) -> np.ndarray:
+    filas, cols = filas_columnas(transform, lon, lat)
+    arr = np.full(shape, np.nan, dtype="float32")
+    dentro = (filas >= 0) & (filas < shape[0]) & (cols >= 0) & (cols < shape[1])
+    arr[filas[dentro], cols[dentro]] = np.asarray(valores, dtype="float32")[dentro]
+    return arr
+
+
+def desplazamiento(transform_base, transform_sub) -> tuple[int, int]:
+    # Offset entero (fila, columna) de la rejilla 'sub' dentro de la rejilla 'base'
+    a0, _, c0, _, e0, f0 = _afin(transform_base)
+    a1, _, c1, _, e1, f1 = _afin(transform_sub)
+    if abs(a0 - a1) > abs(a0) * TOLERANCIA_CELDA or abs(e0 - e1) > abs(e0) * TOLERANCIA_CELDA:
+        raise ValueError("Las rejillas tienen distinta resolución y no se pueden alinear por índice.")
+    dc, df = (c1 - c0) / a0, (f1 - f0) / e0
+    col_off, fila_off = int(round(dc)), int(round(df))
+    if abs(dc - col_off) > 0.01 or abs(df - fila_off) > 0.01:
+        raise ValueError("Las rejillas no comparten malla (desfase de fracción de celda).")
+    return fila_off, col_off
+
+
+def alinear(arr: np.ndarray, transform, transform_base, shape_base) -> np.ndarray:
+    # Recoloca 'arr' sobre la rejilla base; lo que no solapa queda como NaN
+    fila_off, col_off = desplazamiento(transform_base, transform)
+    out = np.full(shape_base, np.nan, dtype="float32")
+    r0, c0 = max(fila_off, 0), max(col_off, 0)
+    r1 = min(fila_off + arr.shape[0], shape_base[0])
+    c1 = min(col_off + arr.shape[1], shape_base[1])
+    if r1 > r0 and c1 > c0:
+        out[r0:r1, c0:c1] = arr[r0 - fila_off:r1 - fila_off, c0 - col_off:c1 - col_off]
+    return out
+
+
+def a_puntos(arr: np.ndarray, transform, paso: int = 1, mascara: np.ndarray | None = None):
+    # Solo para la exportación final: devuelve (filas, cols, lon, lat) de las celdas válidas
+    valido = np.isfinite(arr)
+    if mascara is not None:
+        valido &= mascara
+    if paso > 1:
+        submuestreo = np.zeros_like(valido)
+        submuestreo[::paso, ::paso] = True
+        valido &= submuestreo
+    filas, cols = np.nonzero(valido)
+    lon, lat = lon_lat(transform, filas, cols)
+    return filas, cols, lon, lat
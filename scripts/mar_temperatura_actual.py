@@ -1,23 +1,37 @@
 # sst_actual_12utc.py
 # Requisitos: pip install requests rasterio numpy shapely geopandas pandas python-dateutil
 
-import requests, rasterio, numpy as np, geopandas as gpd, pandas as pd
-from shapely.geometry import Point
+import numpy as np, geopandas as gpd, pandas as pd
 from pathlib import Path
 from datetime import datetime
 
+from mar_rejilla import guardar_rejilla, a_puntos
+from mar_wcs import abrir_cobertura
+from mar_climatologia import acumular_dia
+from mar_zonas import ventana_costera
+
 # ===========================
 # ⟵ PARÁMETROS AJUSTABLES
 # ===========================
 START_LAT_MIN, START_LAT_MAX = 0.0, 60.0
 START_LON_MIN, START_LON_MAX = -40.0, 40.0
 SHRINK = 0.2
+
+# Descarga WCS
+PERSISTIR_COBERTURA = True   # False: el GeoTIFF se abre directamente desde memoria
+TESELAS_WCS = (1, 1)         # (filas, columnas) de sub-peticiones; p. ej. (2, 2) para trocear el bbox
+HILOS_WCS = 4                # descargas simultáneas cuando hay varias teselas
+MAX_FECHAS_CACHE = 30        # días de coberturas que se conservan en caché
+
+# Lectura solo de la ventana que cubre las zonas costeras AEMET (+ margen)
+USAR_VENTANA_COSTERA = True
 # ===========================
 
 URL_WCS = "https://view.eumetsat.int/geoserver/ows"
 CAPA = "eps__osisaf_avhrr_l3_sst"
 DIR_SALIDA = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_mar/")
 DIR_SALIDA.mkdir(parents=True, exist_ok=True)
+DIR_CACHE_WCS = DIR_SALIDA / "cache_wcs"
 PASO_CELDA = 2  # muestreo del ráster al exportar puntos
 
 def shrink_bbox(lat_min, lat_max, lon_min, lon_max, shrink=0.2):
@@ -47,36 +61,28 @@ fecha_iso = fecha.strftime("%Y-%m-%dT%H:%M:%SZ")
 print("Descargando datos para:", fecha_iso)
 
 stamp = fecha.strftime("%Y%m%d_12utc")
-TIF_SALIDA = DIR_SALIDA / f"temperatura_mar_{stamp}.tif"
 GEOJSON_SALIDA = DIR_SALIDA / f"temperatura_mar_{stamp}.geojson"
-
-# Descargar ráster vía WCS
-params = {
-    "service": "WCS",
-    "version": "2.0.1",
-    "request": "GetCoverage",
-    "coverageId": CAPA,
-    "format": "image/tiff",
-    "subset": [
-        f'time("{fecha_iso}")',
-        f"Lat({LAT_MIN},{LAT_MAX})",
-        f"Long({LON_MIN},{LON_MAX})",
-    ],
-}
-query = [(k, v) for k, v in params.items() if k != "subset"]
-for s in params["subset"]:
-    query.append(("subset", s))
-resp = requests.get(URL_WCS, params=query, timeout=240)
-resp.raise_for_status()
-with open(TIF_SALIDA, "wb") as f:
-    f.write(resp.content)
-
-# Leer y procesar ráster
-with rasterio.open(TIF_SALIDA) as ds:
-    arr = ds.read(1).astype("float64")
+REJILLA_SALIDA = DIR_SALIDA / f"temperatura_mar_{stamp}.npz"
+
+# Descargar ráster vía WCS (streaming + caché por fecha) y leerlo
+with abrir_cobertura(
+    URL_WCS, CAPA, fecha_iso, stamp, (LAT_MIN, LAT_MAX, LON_MIN, LON_MAX),
+    dir_cache=DIR_CACHE_WCS,
+    persistir=PERSISTIR_COBERTURA,
+    teselas=TESELAS_WCS,
+    max_hilos=HILOS_WCS,
+    max_fechas_cache=MAX_FECHAS_CACHE,
+) as ds:
+    if USAR_VENTANA_COSTERA:
+        ventana = ventana_costera(ds)
+        arr = ds.read(1, window=ventana).astype("float32")
+        transform = ds.window_transform(ventana)
+        print(f"Ventana costera: {ventana.height}x{ventana.width} de {ds.height}x{ds.width} celdas")
+    else:
+        arr = ds.read(1).astype("float32")
+        transform = ds.transform
     nodata = ds.nodata
     tags = ds.tags(1) if ds.count >= 1 else {}
-    transform = ds.transform
 
 if nodata is not None:
     arr[arr == nodata] = np.nan
@@ -89,20 +95,23 @@ arr = arr * scale + offset
 if np.nanmin(arr) > 150:
     arr = arr - 273.15
 
-# Muestrear a puntos
-filas, cols = arr.shape
-geoms, vals, lons, lats = [], [], [], []
-for r in range(0, filas, PASO_CELDA):
-    for c in range(0, cols, PASO_CELDA):
-        v = arr[r, c]
-        if np.isfinite(v):
-            x, y = rasterio.transform.xy(transform, r, c)
-            geoms.append(Point(x, y))
-            vals.append(float(v))
-            lons.append(float(x))
-            lats.append(float(y))
-
-gdf = gpd.GeoDataFrame({"sst_c": vals, "lon": lons, "lat": lats}, geometry=geoms, crs="EPSG:4326")
+# Guardar la rejilla (float32 + transformada) para comparaciones por índice
+guardar_rejilla(REJILLA_SALIDA, arr, transform, fecha=fecha_iso)
+print("Rejilla guardada en:", REJILLA_SALIDA)
+
+# Incorporar el día a la climatología mensual (incremental, O(rejilla))
+if acumular_dia(arr, transform, fecha.strftime("%Y%m%d")):
+    print("Climatología mensual actualizada con", fecha.strftime("%Y-%m-%d"))
+
+# Muestrear a puntos (vectorizado sobre la rejilla)
+filas_m, cols_m, lons, lats = a_puntos(arr, transform, paso=PASO_CELDA)
+vals = arr[filas_m, cols_m].astype("float64")
+
+gdf = gpd.GeoDataFrame(
+    {"sst_c": vals, "lon": lons, "lat": lats},
+    geometry=gpd.points_from_xy(lons, lats),
+    crs="EPSG:4326",
+)
 
 # Categorización y texto
 bins = list(range(5, 45, 5))  # 5–40
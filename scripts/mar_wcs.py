@@ -0,0 +1,215 @@
+# mar_wcs.py
+# Descarga de coberturas WCS (GetCoverage) en streaming, con caché local por fecha,
+# apertura en memoria y troceado opcional del bbox en teselas descargadas en paralelo.
+
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+TAMANO_TROZO = 1 << 20  # 1 MiB por escritura
+TIMEOUT = (10, 240)     # (conexión, lectura entre trozos)
+FIRMAS_TIFF = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+
+def construir_consulta(capa: str, fecha_iso: str, lat_min, lat_max, lon_min, lon_max) -> list[tuple[str, str]]:
+    query = [
+        ("service", "WCS"),
+        ("version", "2.0.1"),
+        ("request", "GetCoverage"),
+        ("coverageId", capa),
+        ("format", "image/tiff"),
+    ]
+    for s in (f'time("{fecha_iso}")', f"Lat({lat_min},{lat_max})", f"Long({lon_min},{lon_max})"):
+        query.append(("subset", s))
+    return query
+
+
+def _comprobar_tiff(cabecera: bytes, url: str):
+    if not cabecera.startswith(FIRMAS_TIFF):
+        snippet = cabecera[:160].decode("utf-8", "replace")
+        raise RuntimeError(f"La respuesta WCS no es un GeoTIFF ({url}). Cuerpo≈ {snippet!r}")
+
+
+def descargar_a_disco(url: str, query, destino: Path, timeout=TIMEOUT) -> Path:
+    # Escritura por trozos a un .part y renombrado atómico: nunca queda un TIFF a medias en caché
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(destino.suffix + ".part")
+    with requests.get(url, params=query, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        primero = True
+        with open(tmp, "wb") as f:
+            for trozo in resp.iter_content(chunk_size=TAMANO_TROZO):
+                if not trozo:
+                    continue
+                if primero:
+                    _comprobar_tiff(trozo, resp.url)
+                    primero = False
+                f.write(trozo)
+    os.replace(tmp, destino)
+    return destino
+
+
+def descargar_a_memoria(url: str, query, timeout=TIMEOUT) -> bytes:
+    with requests.get(url, params=query, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        buf = bytearray()
+        for trozo in resp.iter_content(chunk_size=TAMANO_TROZO):
+            buf += trozo
+    _comprobar_tiff(bytes(buf[:8]), url)
+    return bytes(buf)
+
+
+# =========================
+# Caché por fecha
+# =========================
+def ruta_cache(dir_cache: Path, capa: str, stamp: str, bbox) -> Path:
+    lat_min, lat_max, lon_min, lon_max = bbox
+    clave = f"{capa}_{lat_min:.3f}_{lat_max:.3f}_{lon_min:.3f}_{lon_max:.3f}.tif"
+    return Path(dir_cache) / stamp / clave
+
+
+def purgar_cache(dir_cache: Path, max_fechas: int) -> list[Path]:
+    # Los subdirectorios son sellos YYYYMMDD_...: orden alfabético = orden cronológico
+    dir_cache = Path(dir_cache)
+    if not dir_cache.exists() or max_fechas <= 0:
+        return []
+    fechas = sorted(p for p in dir_cache.iterdir() if p.is_dir())
+    eliminadas = fechas[:-max_fechas] if len(fechas) > max_fechas else []
+    for p in eliminadas:
+        shutil.rmtree(p, ignore_errors=True)
+    return eliminadas
+
+
+# =========================
+# Teselas
+# =========================
+def teselas_bbox(bbox, n_lat: int = 1, n_lon: int = 1) -> list[tuple[float, float, float, float]]:
+    lat_min, lat_max, lon_min, lon_max = bbox
+    d_lat = (lat_max - lat_min) / n_lat
+    d_lon = (lon_max - lon_min) / n_lon
+    return [
+        (lat_min + i * d_lat, lat_min + (i + 1) * d_lat, lon_min + j * d_lon, lon_min + (j + 1) * d_lon)
+        for i in range(n_lat)
+        for j in range(n_lon)
+    ]
+
+
+def _con_reintentos(fn, intentos: int, espera_base: float):
+    for i in range(intentos):
+        try:
+            return fn()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            if i == intentos - 1:
+                raise
+            time.sleep(espera_base * (2 ** i))
+
+
+def _fusionar_en_memoria(fuentes: list):
+    # Mosaico de teselas → GeoTIFF en memoria, conservando las etiquetas de la banda 1
+    import rasterio
+    from rasterio.io import MemoryFile
+    from rasterio.merge import merge
+
+    datasets = [rasterio.open(f) if isinstance(f, (str, Path)) else f for f in fuentes]
+    try:
+        mosaico, transform = merge(datasets)
+        perfil = datasets[0].profile.copy()
+        tags = datasets[0].tags(1) if datasets[0].count >= 1 else {}
+    finally:
+        for ds in datasets:
+            ds.close()
+    perfil.update(driver="GTiff", height=mosaico.shape[1], width=mosaico.shape[2],
+                  count=mosaico.shape[0], transform=transform)
+    for k in ("tiled", "blockxsize", "blockysize", "compress"):
+        perfil.pop(k, None)
+    mem = MemoryFile()
+    with mem.open(**perfil) as dst:
+        dst.write(mosaico)
+        dst.update_tags(1, **tags)
+    return mem
+
+
+@contextmanager
+def abrir_cobertura(
+    url: str,
+    capa: str,
+    fecha_iso: str,
+    stamp: str,
+    bbox,
+    dir_cache: Path | None = None,
+    persistir: bool = True,
+    teselas: tuple[int, int] = (1, 1),
+    max_hilos: int = 4,
+    intentos: int = 3,
+    espera_base: float = 5.0,
+    max_fechas_cache: int = 30,
+):
+    """Devuelve un dataset rasterio abierto con la cobertura del bbox.
+
+    Con ``persistir`` cada tesela se guarda en ``dir_cache/<stamp>/`` y se reutiliza en
+    ejecuciones posteriores; sin él todo se mantiene en memoria. Una tesela que falla
+    solo vuelve a descargarse ella, nunca las que ya llegaron.
+    """
+    from rasterio.io import MemoryFile
+    import rasterio
+
+    if persistir and dir_cache is None:
+        raise ValueError("persistir=True requiere dir_cache.")
+
+    piezas = teselas_bbox(bbox, *teselas)
+    fuentes: dict[int, object] = {}
+
+    def _obtener(i: int, pieza):
+        query = construir_consulta(capa, fecha_iso, *pieza)
+        if persistir:
+            destino = ruta_cache(dir_cache, capa, stamp, pieza)
+            if destino.exists():
+                print(f"  · tesela {i + 1}/{len(piezas)} desde caché")
+                return destino
+            return _con_reintentos(lambda: descargar_a_disco(url, query, destino), intentos, espera_base)
+        return _con_reintentos(lambda: descargar_a_memoria(url, query), intentos, espera_base)
+
+    if len(piezas) == 1:
+        fuentes[0] = _obtener(0, piezas[0])
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_hilos, len(piezas)))) as ex:
+            futuros = {ex.submit(_obtener, i, p): i for i, p in enumerate(piezas)}
+            for fut in as_completed(futuros):
+                fuentes[futuros[fut]] = fut.result()
+
+    if persistir:
+        purgar_cache(dir_cache, max_fechas_cache)
+
+    ordenadas = [fuentes[i] for i in range(len(piezas))]
+    mem = None
+    try:
+        if len(ordenadas) > 1:
+            mems = [MemoryFile(f) for f in ordenadas if not isinstance(f, Path)]
+            it_mems = iter(mems)
+            abiertas = [f if isinstance(f, Path) else next(it_mems).open() for f in ordenadas]
+            try:
+                mem = _fusionar_en_memoria(abiertas)
+            finally:
+                for m in mems:
+                    m.close()
+            ds = mem.open()
+        elif isinstance(ordenadas[0], Path):
+            ds = rasterio.open(ordenadas[0])
+        else:
+            mem = MemoryFile(ordenadas[0])
+            ds = mem.open()
+        try:
+            yield ds
+        finally:
+            ds.close()
+    finally:
+        if mem is not None:
+            mem.close()
@@ -0,0 +1,106 @@
+# mar_zonas.py
+# Zonas costeras de avisos AEMET sobre la rejilla de SST: ventana de lectura que las cubre,
+# máscara rasterizada (cacheada en disco) y estadísticas zonales vectorizadas.
+
+from __future__ import annotations
+
+import hashlib
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RUTA_ZONAS_COSTERAS = Path(
+    "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/delimitacion_zonas/zonas_costeras/"
+    "AEMET-meteoalerta-v6-zonas-costeras-32630.shp"
+)
+DIR_CACHE_ZONAS = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_mar/cache_zonas/")
+MARGEN_GRADOS = 2.0  # mar alrededor de las zonas costeras que se conserva en la ventana
+
+_ZONAS = None
+
+
+def cargar_zonas_costeras(ruta: Path = RUTA_ZONAS_COSTERAS):
+    global _ZONAS
+    if _ZONAS is None:
+        import geopandas as gpd
+        zonas = gpd.read_file(ruta)
+        zonas = zonas[~zonas.geometry.isna()].to_crs(4326).reset_index(drop=True)
+        zonas = zonas.rename(columns={"COD_Z": "cod_zona", "NOM_Z": "zona", "NOM_PROV": "provincia", "NOM_CCAA": "ccaa"})
+        _ZONAS = zonas[["cod_zona", "zona", "provincia", "ccaa", "geometry"]]
+    return _ZONAS
+
+
+def bbox_costero(margen: float = MARGEN_GRADOS) -> tuple[float, float, float, float]:
+    lon_min, lat_min, lon_max, lat_max = cargar_zonas_costeras().total_bounds
+    return lat_min - margen, lat_max + margen, lon_min - margen, lon_max + margen
+
+
+def ventana_costera(ds, margen: float = MARGEN_GRADOS):
+    # Ventana entera (misma malla que el ráster) que cubre las zonas costeras + margen
+    from rasterio.windows import Window
+
+    lat_min, lat_max, lon_min, lon_max = bbox_costero(margen)
+    a, _, c, _, e, f = tuple(ds.transform)[:6]
+    col0 = max(int(math.floor((lon_min - c) / a)), 0)
+    col1 = min(int(math.ceil((lon_max - c) / a)), ds.width)
+    fila0 = max(int(math.floor((lat_max - f) / e)), 0)
+    fila1 = min(int(math.ceil((lat_min - f) / e)), ds.height)
+    if col1 <= col0 or fila1 <= fila0:
+        raise ValueError("La cobertura descargada no solapa con las zonas costeras.")
+    return Window(col0, fila0, col1 - col0, fila1 - fila0)
+
+
+def _clave_mascara(transform, shape, ruta: Path) -> str:
+    st = Path(ruta).stat()
+    firma = f"{tuple(round(float(v), 9) for v in tuple(transform)[:6])}|{tuple(shape)}|{st.st_size}|{int(st.st_mtime)}"
+    return hashlib.sha1(firma.encode()).hexdigest()[:16]
+
+
+def mascara_zonas(transform, shape, ruta: Path = RUTA_ZONAS_COSTERAS, dir_cache: Path = DIR_CACHE_ZONAS):
+    """Etiquetas int16 por celda (0 = fuera; i+1 = zona i) y tabla de zonas.
+
+    La rasterización se hace una vez por rejilla y se reutiliza desde ``dir_cache``.
+    """
+    zonas = cargar_zonas_costeras(ruta)
+    tabla = pd.DataFrame(zonas.drop(columns="geometry"))
+    cache = Path(dir_cache) / f"mascara_{_clave_mascara(transform, shape, ruta)}.npz"
+    if cache.exists():
+        with np.load(cache) as z:
+            return z["etiquetas"], tabla
+
+    from affine import Affine
+    from rasterio.features import rasterize
+
+    formas = ((geom, i + 1) for i, geom in enumerate(zonas.geometry))
+    etiquetas = rasterize(
+        formas,
+        out_shape=tuple(shape),
+        transform=Affine(*tuple(transform)[:6]),
+        fill=0,
+        all_touched=True,
+        dtype="int16",
+    )
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(cache, etiquetas=etiquetas)
+    return etiquetas, tabla
+
+
+def estadisticas_zonales(etiquetas: np.ndarray, n_zonas: int, **variables: np.ndarray) -> pd.DataFrame:
+    # Una pasada por variable con bincount / maximum.at sobre las celdas válidas de cada zona
+    out = {}
+    for nombre, valores in variables.items():
+        valores = np.asarray(valores, dtype="float64")
+        ok = (etiquetas > 0) & np.isfinite(valores)
+        lab = etiquetas[ok].astype("int64") - 1
+        v = valores[ok]
+        n = np.bincount(lab, minlength=n_zonas)
+        s = np.bincount(lab, weights=v, minlength=n_zonas)
+        mx = np.full(n_zonas, -np.inf)
+        np.maximum.at(mx, lab, v)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[f"{nombre}_media"] = np.where(n > 0, s / n, np.nan)
+        out[f"{nombre}_max"] = np.where(n > 0, mx, np.nan)
+        out[f"{nombre}_n_celdas"] = n
+    return pd.DataFrame(out)
@@ -0,0 +1,159 @@
+# normales.py
+# Normales climatológicas diarias por estación: tabla (id_estacion, día del año) para cada
+# variable, construida con los datos diarios del histórico (historico_diario.pkl) y suavizada
+# con una media móvil circular. Sustituye a las referencias fijas (media mensual / 30, media
+# de agosto, media de máximas de un mes) por la normal del día de cada observación.
+#
+# Uso:  python normales.py                 (recalcula con el histórico local)
+#       python normales.py --rellenar 30   (antes descarga de AEMET los últimos 30 años)
+from __future__ import annotations
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from estaciones import RUTA_BASE, registro
+
+# =========================
+# Configuración
+# =========================
+RUTA_NORMALES = Path(RUTA_BASE) / "complementarios_aemet" / "normales_diarias.npz"
+RUTA_HISTORICO = Path(RUTA_BASE) / "complementarios_aemet" / "historico_diario.pkl"
+VARIABLES = ("prec", "tmax", "tmin", "tmed")
+DIAS_ANIO = 366
+SEMIVENTANA = 15        # media móvil de 31 días centrada en cada día
+MIN_ANIOS = 5           # años con dato (equivalentes) exigidos dentro de la ventana
+TRAMO_DIAS = 180        # rango máximo por petición al rellenar desde AEMET
+
+
+def dia_del_anio(fechas) -> np.ndarray:
+    """Índice 0..365 sobre un año bisiesto: el 1 de marzo es siempre el 60 (29-F = 59)."""
+    f = pd.DatetimeIndex(pd.to_datetime(fechas, errors="coerce"))
+    doy = f.dayofyear.to_numpy(dtype="int64", na_value=0) - 1
+    no_bisiesto = ~f.is_leap_year
+    doy[no_bisiesto & (doy >= 59)] += 1
+    doy[f.isna()] = -1
+    return doy
+
+
+def _suavizar(sumas: np.ndarray, cuentas: np.ndarray, semiventana: int, min_obs: int) -> np.ndarray:
+    # Media móvil circular en el eje de días con sumas acumuladas (todas las estaciones a la vez)
+    w = semiventana
+    ext_s = np.concatenate([sumas[:, -w:], sumas, sumas[:, :w]], axis=1)
+    ext_c = np.concatenate([cuentas[:, -w:], cuentas, cuentas[:, :w]], axis=1)
+    cs = np.pad(np.cumsum(ext_s, axis=1), ((0, 0), (1, 0)))
+    cc = np.pad(np.cumsum(ext_c, axis=1), ((0, 0), (1, 0)))
+    n = 2 * w + 1
+    s = cs[:, n:] - cs[:, :-n]
+    c = cc[:, n:] - cc[:, :-n]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = s / c
+    media[c < min_obs] = np.nan
+    return media.astype("float32")
+
+
+class NormalesDiarias:
+    def __init__(self, tablas: dict[str, np.ndarray], anio_inicio: int | None = None, anio_fin: int | None = None):
+        self.tablas = tablas
+        self.anio_inicio = anio_inicio
+        self.anio_fin = anio_fin
+
+    @classmethod
+    def construir(cls, diarios: pd.DataFrame, n_estaciones: int, variables=VARIABLES,
+                  semiventana: int = SEMIVENTANA, min_anios: int = MIN_ANIOS) -> "NormalesDiarias":
+        ids = diarios["id_estacion"].to_numpy(dtype="int64")
+        doy = dia_del_anio(diarios["fecha"])
+        ok = (ids >= 0) & (ids < n_estaciones) & (doy >= 0)
+        plano = ids * DIAS_ANIO + doy
+        # Observaciones exigidas en la ventana: min_anios completos con un 20 % de huecos
+        min_obs = int(min_anios * (2 * semiventana + 1) * 0.8)
+        tablas = {}
+        for var in variables:
+            if var not in diarios.columns:
+                continue
+            v = pd.to_numeric(diarios[var], errors="coerce").to_numpy(dtype="float64")
+            sel = ok & np.isfinite(v)
+            sumas = np.bincount(plano[sel], weights=v[sel], minlength=n_estaciones * DIAS_ANIO)
+            cuentas = np.bincount(plano[sel], minlength=n_estaciones * DIAS_ANIO).astype("float64")
+            tablas[var] = _suavizar(sumas.reshape(n_estaciones, DIAS_ANIO),
+                                    cuentas.reshape(n_estaciones, DIAS_ANIO), semiventana, min_obs)
+        anios = pd.to_datetime(diarios["fecha"], errors="coerce").dt.year
+        return cls(tablas, int(anios.min()) if len(anios) else None, int(anios.max()) if len(anios) else None)
+
+    # ---------- persistencia ----------
+    def guardar(self, ruta: Path = RUTA_NORMALES):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(ruta, **self.tablas,
+                            periodo=np.array([self.anio_inicio or 0, self.anio_fin or 0], dtype="int32"))
+
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_NORMALES) -> "NormalesDiarias | None":
+        if not Path(ruta).exists():
+            return None
+        with np.load(ruta) as z:
+            tablas = {k: z[k] for k in z.files if k != "periodo"}
+            ini, fin = (int(x) for x in z["periodo"])
+        return cls(tablas, ini or None, fin or None)
+
+    # ---------- consulta ----------
+    def valor(self, variable: str, ids, fechas) -> np.ndarray:
+        """Normal de ``variable`` para cada par (id_estacion, fecha); NaN si no la hay."""
+        ids = np.asarray(ids, dtype="int64")
+        doy = dia_del_anio(fechas)
+        out = np.full(len(ids), np.nan, dtype="float64")
+        tabla = self.tablas.get(variable)
+        if tabla is None:
+            return out
+        ok = (ids >= 0) & (ids < tabla.shape[0]) & (doy >= 0)
+        out[ok] = tabla[ids[ok], doy[ok]]
+        return out
+
+
+def normal_de(variable: str, ids, fechas) -> np.ndarray:
+    """Atajo para los paneles: NaN en todo si aún no se ha construido la tabla."""
+    normales = NormalesDiarias.cargar()
+    if normales is None:
+        return np.full(len(ids), np.nan)
+    return normales.valor(variable, ids, fechas)
+
+
+# =========================
+# Relleno del histórico desde AEMET
+# =========================
+def rellenar_historico(anios: int, indicativos: list[str]):
+    from aemet_diarios import descargar_diarios, anadir_a_historico, reiniciar_presupuesto
+    fin = date.today() - timedelta(days=1)
+    inicio = date(fin.year - anios, 1, 1)
+    tramo_ini = inicio
+    while tramo_ini <= fin:
+        tramo_fin = min(tramo_ini + timedelta(days=TRAMO_DIAS - 1), fin)
+        print(f"Tramo {tramo_ini} → {tramo_fin}")
+        reiniciar_presupuesto()
+        df = descargar_diarios(indicativos, f"{tramo_ini:%Y-%m-%d}T00:00:00UTC", f"{tramo_fin:%Y-%m-%d}T23:59:59UTC")
+        anadir_a_historico(df, RUTA_HISTORICO)
+        tramo_ini = tramo_fin + timedelta(days=1)
+
+
+def main(anios_relleno: int = 0):
+    if anios_relleno:
+        from aemet_diarios import RUTAS_INDICATIVOS, leer_indicativos
+        indicativos = list(dict.fromkeys(i for r in RUTAS_INDICATIVOS for i in leer_indicativos(r)))
+        rellenar_historico(anios_relleno, indicativos)
+    if not RUTA_HISTORICO.exists():
+        print(f"AVISO: no hay histórico diario en {RUTA_HISTORICO}; no se calculan normales.")
+        return
+    diarios = pd.read_pickle(RUTA_HISTORICO)
+    normales = NormalesDiarias.construir(diarios, n_estaciones=len(registro()))
+    normales.guardar()
+    for var, tabla in normales.tablas.items():
+        cubiertas = int(np.isfinite(tabla).all(axis=1).sum())
+        print(f"  · {var}: {cubiertas}/{tabla.shape[0]} estaciones con normal en los 366 días")
+    print(f"Normales {normales.anio_inicio}-{normales.anio_fin} guardadas en {RUTA_NORMALES}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[args.index("--rellenar") + 1]) if "--rellenar" in args else 0)
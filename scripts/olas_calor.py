@@ -0,0 +1,150 @@
+# olas_calor.py
+# Episodios de ola de calor por estación sobre la serie diaria de temperatura máxima del
+# histórico local (historico_diario.pkl).
+#
+# Criterio (el de AEMET, aplicado estación a estación): una estación está en ola de calor
+# cuando su máxima supera su percentil 95 de las máximas de julio y agosto durante al menos
+# DIAS_MINIMOS días seguidos. Toda la red va en una matriz (días × estaciones) y los episodios
+# salen con la codificación run-length de rachas.py, sin bucles por estación ni por día.
+#
+# Uso:  python olas_calor.py
+from __future__ import annotations
+
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from estaciones import RUTA_BASE, registro
+from normales import RUTA_HISTORICO
+from rachas import rachas, recortar_rachas, reducir_rachas
+from sheets import subir_si_procede
+
+# =========================
+# Parámetros
+# =========================
+DIAS_MINIMOS = 3           # duración mínima de un episodio
+PERCENTIL = 95             # percentil del umbral
+MESES_UMBRAL = (7, 8)      # meses con los que se calcula el umbral
+MIN_MUESTRA_UMBRAL = 300   # máximas de julio-agosto exigidas (≈ 5 veranos)
+MAX_HUECO_DIAS = 1         # huecos de hasta este número de días no cortan un episodio
+SALIDA_XLSX = Path(RUTA_BASE) / "OLAS_CALOR.xlsx"
+SUBIR_A_SHEETS = True
+NOMBRE_PESTANA = "olas_calor"
+
+
+def matriz_diaria(diarios: pd.DataFrame, variable: str = "tmax", n_estaciones: int | None = None):
+    """Matriz (días × estaciones) float32 con NaN en los días sin dato, y sus fechas."""
+    ids = diarios["id_estacion"].to_numpy(dtype="int64")
+    fechas = pd.to_datetime(diarios["fecha"], errors="coerce").dt.normalize().to_numpy()
+    v = pd.to_numeric(diarios[variable], errors="coerce").to_numpy(dtype="float32")
+    ok = (ids >= 0) & ~np.isnat(fechas) & np.isfinite(v)
+    ids, fechas, v = ids[ok], fechas[ok], v[ok]
+    f0 = fechas.min().astype("datetime64[D]")
+    dia = (fechas.astype("datetime64[D]") - f0).astype("int64")
+    n_est = max(n_estaciones or 0, int(ids.max()) + 1)
+    m = np.full((int(dia.max()) + 1, n_est), np.nan, dtype="float32")
+    m[dia, ids] = v
+    return m, pd.date_range(pd.Timestamp(f0), periods=m.shape[0], freq="D")
+
+
+def umbrales(m: np.ndarray, fechas: pd.DatetimeIndex, percentil: float = PERCENTIL) -> np.ndarray:
+    verano = m[np.isin(fechas.month, MESES_UMBRAL)]
+    n = np.isfinite(verano).sum(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # estaciones sin ningún verano
+        u = np.nanpercentile(verano, percentil, axis=0)
+    u[n < MIN_MUESTRA_UMBRAL] = np.nan
+    return u.astype("float32")
+
+
+def _huecos_cortos(hueco: np.ndarray, max_dias: int = MAX_HUECO_DIAS) -> np.ndarray:
+    # Máscara (T, N) de los huecos de como mucho max_dias que no tocan los extremos de la serie
+    serie, inicio, fin = rachas(hueco)
+    sel = ((fin - inicio) <= max_dias) & (inicio > 0) & (fin < hueco.shape[0])
+    serie, inicio, fin = serie[sel], inicio[sel], fin[sel]
+    largo = fin - inicio
+    t = np.repeat(inicio, largo) + (np.arange(largo.sum()) - np.repeat(np.cumsum(largo) - largo, largo))
+    corto = np.zeros(hueco.shape, dtype=bool)
+    corto[t, np.repeat(serie, largo)] = True
+    return corto
+
+
+def detectar(m: np.ndarray, umbral: np.ndarray, dias_minimos: int = DIAS_MINIMOS):
+    """Episodios: (estacion, inicio, fin, dias_sobre_umbral, tmax_pico, dia_pico, exceso_medio).
+
+    ``fin`` es exclusivo. Un hueco corto dentro del episodio no lo corta, pero solo los días
+    observados por encima del umbral cuentan para la duración mínima, y el episodio empieza y
+    acaba en días observados por encima del umbral.
+    """
+    supera = m > umbral[None, :]
+    puente = _huecos_cortos(np.isnan(m))
+    estacion, inicio, fin = recortar_rachas(supera, *rachas(supera | puente))
+    dias_sobre = reducir_rachas(supera.astype(np.int32), estacion, inicio, fin, np.add)
+    ok = dias_sobre >= dias_minimos
+    estacion, inicio, fin, dias_sobre = estacion[ok], inicio[ok], fin[ok], dias_sobre[ok]
+
+    valores = np.where(supera, m, np.nan).astype("float64")
+    pico = reducir_rachas(valores, estacion, inicio, fin, np.fmax)
+    exceso = reducir_rachas(np.where(supera, m - umbral[None, :], 0.0), estacion, inicio, fin, np.add) / dias_sobre
+
+    # Día del pico: primer día de cada episodio cuyo valor es el máximo del episodio
+    largo = fin - inicio
+    episodio = np.repeat(np.arange(len(inicio)), largo)
+    t = np.repeat(inicio, largo) + (np.arange(largo.sum()) - np.repeat(np.cumsum(largo) - largo, largo))
+    es_pico = valores[t, estacion[episodio]] == pico[episodio]
+    _, primero = np.unique(episodio[es_pico], return_index=True)
+    dia_pico = t[es_pico][primero]
+    return estacion, inicio, fin, dias_sobre, pico, dia_pico, exceso
+
+
+def tabla_episodios(estacion, inicio, fin, dias_sobre, pico, dia_pico, exceso, umbral, fechas) -> pd.DataFrame:
+    info = registro().a_dataframe().set_index("id_estacion")[["indicativo", "nombre", "provincia"]]
+    info = info.reindex(estacion)
+    df = pd.DataFrame({
+        "id_estacion": estacion.astype("int32"),
+        "indicativo": info["indicativo"].to_numpy(),
+        "nombre": info["nombre"].to_numpy(),
+        "provincia": info["provincia"].astype(object).to_numpy(),
+        "inicio": fechas[inicio].strftime("%Y-%m-%d"),
+        "fin": fechas[fin - 1].strftime("%Y-%m-%d"),
+        "duracion_dias": (fin - inicio).astype(int),
+        "dias_sobre_umbral": dias_sobre.astype(int),
+        "tmax_pico": np.round(pico, 1),
+        "fecha_pico": fechas[dia_pico].strftime("%Y-%m-%d"),
+        "exceso_medio": np.round(exceso, 1),
+        "umbral": np.round(umbral[estacion].astype("float64"), 1),
+        "activa": (fin - 1) == len(fechas) - 1,
+    })
+    return df.sort_values(["inicio", "id_estacion"], ascending=[False, True]).reset_index(drop=True)
+
+
+def main():
+    if not RUTA_HISTORICO.exists():
+        print(f"AVISO: no hay histórico diario en {RUTA_HISTORICO}; no se detectan olas de calor.")
+        return
+    diarios = pd.read_pickle(RUTA_HISTORICO)[["id_estacion", "fecha", "tmax"]]
+    m, fechas = matriz_diaria(diarios, "tmax", n_estaciones=len(registro()))
+    print(f"Serie de máximas: {m.shape[0]} días × {m.shape[1]} estaciones "
+          f"({fechas[0]:%Y-%m-%d} → {fechas[-1]:%Y-%m-%d})")
+
+    umbral = umbrales(m, fechas)
+    df = tabla_episodios(*detectar(m, umbral), umbral, fechas)
+    activas = int(df["activa"].sum())
+    print(f"Episodios: {len(df)} en {df['id_estacion'].nunique()} estaciones "
+          f"({int(np.isfinite(umbral).sum())} con umbral) · activos hoy: {activas}")
+
+    df["fecha_actualizado"] = fechas[-1].strftime("%d/%m/%Y")
+    df.to_excel(SALIDA_XLSX, index=False, sheet_name="episodios")
+    print("Guardado:", SALIDA_XLSX)
+
+    # A la hoja solo van los episodios del año en curso
+    subir_si_procede(df[df["inicio"] >= f"{fechas[-1].year}-01-01"], NOMBRE_PESTANA, activo=SUBIR_A_SHEETS)
+
+
+if __name__ == "__main__":
+    t0 = datetime.now()
+    main()
+    print(f"Tiempo: {(datetime.now() - t0).total_seconds():.1f}s")
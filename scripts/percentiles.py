@@ -0,0 +1,150 @@
+# percentiles.py
+# Distribuciones históricas ordenadas por estación y mes para situar cada observación en su
+# percentil. Todas las distribuciones de una variable van en un único array plano: los valores
+# de cada grupo (estación, mes) están ordenados y desplazados por grupo, de modo que un solo
+# np.searchsorted sobre todo el array da el rango de todas las observaciones de la red.
+#
+# Uso:  python percentiles.py   (reconstruye las distribuciones con el histórico diario)
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from estaciones import RUTA_BASE, registro
+from normales import RUTA_HISTORICO
+
+# =========================
+# Configuración
+# =========================
+RUTA_DISTRIBUCIONES = Path(RUTA_BASE) / "complementarios_aemet" / "distribuciones.npz"
+VARIABLES = ("prec", "tmax")
+N_VENTANAS = 12          # una distribución por estación y mes del año
+MARGEN_DIAS = 7          # cada mes incluye también los días a ±7 días de sus bordes
+MIN_MUESTRA = 100        # por debajo no se da percentil (se usan los tramos fijos)
+_ESCALA = 1.0e5          # separación entre grupos en la clave global (>> rango de valores)
+_DESPLAZAMIENTO = 1.0e3  # para que los valores sean positivos dentro de cada grupo
+
+# Umbrales de percentil de las cinco categorías de los paneles
+CORTES_PERCENTIL = [0, 10, 100 / 3, 200 / 3, 90, 100]
+
+
+def _grupos(ids: np.ndarray, meses: np.ndarray) -> np.ndarray:
+    return ids.astype("int64") * N_VENTANAS + (np.asarray(meses, dtype="int64") - 1)
+
+
+class Distribuciones:
+    def __init__(self, valores: dict[str, np.ndarray], inicio: dict[str, np.ndarray], n_estaciones: int):
+        self.valores = valores      # float32 ordenado dentro de cada grupo
+        self.inicio = inicio        # int64, len = n_grupos + 1
+        self.n_estaciones = n_estaciones
+        self._claves: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def construir(cls, diarios: pd.DataFrame, n_estaciones: int, variables=VARIABLES) -> "Distribuciones":
+        ids = diarios["id_estacion"].to_numpy(dtype="int64")
+        fechas = pd.DatetimeIndex(pd.to_datetime(diarios["fecha"], errors="coerce"))
+        ok = (ids >= 0) & (ids < n_estaciones) & ~fechas.isna()
+        ids, fechas = ids[ok], fechas[ok]
+        # Cada día entra en su mes y, si está cerca del borde, también en el mes vecino
+        dia, dias_mes = fechas.day.to_numpy(), fechas.days_in_month.to_numpy()
+        antes, despues = dia <= MARGEN_DIAS, dia > dias_mes - MARGEN_DIAS
+        margen = np.timedelta64(MARGEN_DIAS, "D")
+        vecino = np.where(antes, fechas.to_numpy() - margen, fechas.to_numpy() + margen)
+        con_vecino = antes | despues
+        grupos = np.concatenate([_grupos(ids, fechas.month),
+                                 _grupos(ids[con_vecino], pd.DatetimeIndex(vecino[con_vecino]).month)])
+        n_grupos = n_estaciones * N_VENTANAS
+
+        valores, inicio = {}, {}
+        for var in variables:
+            if var not in diarios.columns:
+                continue
+            v = pd.to_numeric(diarios[var], errors="coerce").to_numpy(dtype="float64")[ok]
+            v = np.concatenate([v, v[con_vecino]])
+            sel = np.isfinite(v)
+            g, v = grupos[sel], v[sel]
+            orden = np.lexsort((v, g))
+            valores[var] = v[orden].astype("float32")
+            inicio[var] = np.concatenate([[0], np.cumsum(np.bincount(g, minlength=n_grupos))]).astype("int64")
+        return cls(valores, inicio, n_estaciones)
+
+    # ---------- persistencia ----------
+    def guardar(self, ruta: Path = RUTA_DISTRIBUCIONES):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {f"{v}_valores": a for v, a in self.valores.items()}
+        arrays.update({f"{v}_inicio": a for v, a in self.inicio.items()})
+        np.savez_compressed(ruta, n_estaciones=np.int64(self.n_estaciones), **arrays)
+
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_DISTRIBUCIONES) -> "Distribuciones | None":
+        if not Path(ruta).exists():
+            return None
+        with np.load(ruta) as z:
+            variables = [k[: -len("_valores")] for k in z.files if k.endswith("_valores")]
+            return cls({v: z[f"{v}_valores"] for v in variables},
+                       {v: z[f"{v}_inicio"] for v in variables}, int(z["n_estaciones"]))
+
+    # ---------- consulta ----------
+    def _clave(self, var: str) -> np.ndarray:
+        # Clave global ordenada: grupo · ESCALA + valor (se construye una vez por variable)
+        if var not in self._claves:
+            inicio = self.inicio[var]
+            grupo = np.repeat(np.arange(len(inicio) - 1), np.diff(inicio))
+            self._claves[var] = grupo * _ESCALA + (self.valores[var].astype("float64") + _DESPLAZAMIENTO)
+        return self._claves[var]
+
+    def percentil(self, var: str, ids, fechas, valores) -> np.ndarray:
+        """Percentil (0-100, rango medio para empates) de cada valor en la distribución de su
+        estación y mes. NaN si no hay distribución suficiente o falta el dato."""
+        ids = np.asarray(ids, dtype="int64")
+        fechas = pd.DatetimeIndex(pd.to_datetime(fechas, errors="coerce"))
+        x = np.asarray(valores, dtype="float64")
+        out = np.full(len(ids), np.nan)
+        if var not in self.valores:
+            return out
+        ok = (ids >= 0) & (ids < self.n_estaciones) & ~fechas.isna() & np.isfinite(x)
+        g = _grupos(ids[ok], fechas[ok].month)
+        inicio = self.inicio[var]
+        n = inicio[g + 1] - inicio[g]
+        # Misma precisión que lo guardado, para que los empates se detecten
+        consulta = g * _ESCALA + (x[ok].astype("float32").astype("float64") + _DESPLAZAMIENTO)
+        clave = self._clave(var)
+        izq = np.searchsorted(clave, consulta, side="left") - inicio[g]
+        der = np.searchsorted(clave, consulta, side="right") - inicio[g]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p = 100.0 * (izq + der) / (2.0 * n)
+        p[n < MIN_MUESTRA] = np.nan
+        out[ok] = p
+        return out
+
+
+def percentil_de(var: str, ids, fechas, valores) -> np.ndarray:
+    """Atajo para los paneles: NaN en todo si aún no hay distribuciones."""
+    dist = Distribuciones.cargar()
+    if dist is None:
+        return np.full(len(ids), np.nan)
+    return dist.percentil(var, ids, fechas, valores)
+
+
+def categoria_por_percentil(percentil, labels: list[str], index=None) -> pd.Series:
+    return pd.cut(pd.Series(percentil, index=index), bins=CORTES_PERCENTIL, labels=labels, include_lowest=True)
+
+
+def main():
+    if not RUTA_HISTORICO.exists():
+        print(f"AVISO: no hay histórico diario en {RUTA_HISTORICO}; no se calculan distribuciones.")
+        return
+    diarios = pd.read_pickle(RUTA_HISTORICO)
+    dist = Distribuciones.construir(diarios, n_estaciones=len(registro()))
+    dist.guardar()
+    for var, inicio in dist.inicio.items():
+        n = np.diff(inicio)
+        print(f"  · {var}: {len(dist.valores[var])} valores · "
+              f"{int((n >= MIN_MUESTRA).sum())}/{len(n)} grupos estación-mes con muestra suficiente")
+    print("Guardado:", RUTA_DISTRIBUCIONES)
+
+
+if __name__ == "__main__":
+    main()
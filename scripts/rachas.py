@@ -0,0 +1,74 @@
+# rachas.py
+# Codificación run-length vectorizada: localiza tramos consecutivos de True a lo largo del eje 0
+# de una matriz (tiempo × series) sin bucles Python por serie ni por paso de tiempo.
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def rachas(mascara: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Tramos de True por columna de ``mascara`` (T, N).
+
+    Devuelve (serie, inicio, fin) con ``fin`` exclusivo, ordenados por serie y tiempo.
+    """
+    m = np.asarray(mascara, dtype=bool)
+    if m.ndim == 1:
+        m = m[:, None]
+    borde = np.zeros((1, m.shape[1]), dtype=np.int8)
+    d = np.diff(np.vstack([borde, m.astype(np.int8), borde]), axis=0).T  # (N, T+1)
+    serie, inicio = np.nonzero(d == 1)
+    _, fin = np.nonzero(d == -1)
+    return serie, inicio, fin
+
+
+def reducir_rachas(valores: np.ndarray, serie, inicio, fin, ufunc=np.add) -> np.ndarray:
+    # Aplica ufunc.reduceat sobre cada tramo [inicio, fin) de su serie en una sola llamada
+    v = np.asarray(valores)
+    if v.ndim == 1:
+        v = v[:, None]
+    if len(serie) == 0:
+        return np.empty(0, dtype=v.dtype)
+    t = v.shape[0]
+    plano = np.append(np.ascontiguousarray(v.T).ravel(), v.dtype.type(0))
+    base = np.asarray(serie, dtype=np.int64) * t
+    idx = np.empty(2 * len(serie), dtype=np.int64)
+    idx[0::2] = base + inicio
+    idx[1::2] = base + fin
+    return ufunc.reduceat(plano, idx)[0::2]
+
+
+def racha_actual(mascara: np.ndarray) -> np.ndarray:
+    # Longitud del tramo de True que termina en el último paso de tiempo, por serie
+    m = np.asarray(mascara, dtype=bool)
+    if m.ndim == 1:
+        m = m[:, None]
+    t = m.shape[0]
+    pos = np.where(~m, np.arange(t)[:, None], -1)
+    ultimo_false = np.maximum.accumulate(pos, axis=0)[-1]
+    return (t - 1 - ultimo_false).astype(np.int64)
+
+
+def recortar_rachas(mascara: np.ndarray, serie, inicio, fin):
+    """Recorta cada tramo [inicio, fin) para que empiece y acabe en un paso True de ``mascara``
+    (p. ej. tramos unidos a través de huecos sin dato). Los tramos sin ningún True se descartan.
+
+    Cada tramo de ``mascara`` cae entero dentro de un tramo de entrada, así que basta buscar
+    (searchsorted) el primero que empieza y el último que acaba dentro de él.
+    """
+    m = np.asarray(mascara, dtype=bool)
+    if m.ndim == 1:
+        m = m[:, None]
+    paso = m.shape[0] + 1
+    s_serie, s_inicio, s_fin = rachas(m)
+    serie, inicio, fin = (np.asarray(a, dtype=np.int64) for a in (serie, inicio, fin))
+    if len(s_serie) == 0 or len(serie) == 0:
+        vacio = np.empty(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    clave_ini = s_serie * paso + s_inicio
+    clave_fin = s_serie * paso + s_fin
+    i = np.searchsorted(clave_ini, serie * paso + inicio, side="left")
+    j = np.searchsorted(clave_fin, serie * paso + fin, side="right") - 1
+    i_ok = np.minimum(i, len(s_serie) - 1)
+    ok = (i < len(s_serie)) & (s_serie[i_ok] == serie) & (s_inicio[i_ok] < fin)
+    return serie[ok], s_inicio[i[ok]], s_fin[j[ok]]
@@ -0,0 +1,159 @@
+# sheets.py
+# Helpers de subida a Google Sheets compartidos por los pasos nuevos del pipeline.
+
+import re, time, math
+from datetime import datetime as _dt
+from pathlib import Path
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_datetime64tz_dtype
+
+from importlib.util import find_spec
+
+def _instalado(modulo: str) -> bool:
+    # find_spec de un submódulo importa el paquete padre y lanza si falta
+    try:
+        return find_spec(modulo) is not None
+    except ModuleNotFoundError:
+        return False
+
+# Google Sheets se comprueba sin importarlo: las librerías se cargan al construir el servicio
+_GSHEETS_DISPONIBLE = all(_instalado(m) for m in ("httplib2", "googleapiclient", "google_auth_httplib2", "google.oauth2"))
+
+ID_HOJA_CALCULO   = "1o0DICxbYpq_OqgwTqU9-8GaQzjYj14cdureHGN-uLQA"
+RUTA_CREDENCIALES = "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/credenciales_google_sheet.json"
+ALCANCES_SHEETS   = ["https://www.googleapis.com/auth/spreadsheets"]
+
+def hora() -> str:
+    return _dt.now().strftime("[%Y-%m-%d %H:%M:%S] ")
+
+def _parse_a1(celda: str):
+    m = re.match(r"^([A-Za-z]+)(\d+)?$", celda)
+    if not m:
+        return "A", 1
+    col, fila = m.group(1).upper(), int(m.group(2) or 1)
+    return col, fila
+
+def _exec_reintentado(req, intentos=5, espera_base=1.5):
+    from googleapiclient.errors import HttpError
+    for i in range(intentos):
+        try:
+            return req.execute(num_retries=5)
+        except Exception as e:
+            transitorio = isinstance(e, TimeoutError) or isinstance(e, HttpError)
+            if (i == intentos - 1) or not transitorio:
+                raise
+            time.sleep(espera_base * (2 ** i))
+
+def _construir_servicio_sheets(ruta_credenciales: str, alcances: list[str]):
+    if not _GSHEETS_DISPONIBLE:
+        raise RuntimeError(
+            "Faltan dependencias de Google Sheets. Instala: "
+            "google-api-python-client google-auth-httplib2 google-auth httplib2"
+        )
+    import httplib2
+    from google.oauth2.service_account import Credentials
+    from googleapiclient.discovery import build
+    from google_auth_httplib2 import AuthorizedHttp
+    cred = Credentials.from_service_account_file(ruta_credenciales, scopes=alcances)
+    _http = httplib2.Http(timeout=500)
+    _authed_http = AuthorizedHttp(cred, http=_http)
+    return build("sheets", "v4", http=_authed_http, cache_discovery=False)
+
+def subir_df_a_sheet(
+    df: pd.DataFrame,
+    spreadsheet_id: str,
+    rango_inicial: str,
+    pestana: str,
+    ruta_credenciales: str,
+    alcances: list[str] = ALCANCES_SHEETS,
+    filas_bloque: int = 2000,
+):
+    servicio = _construir_servicio_sheets(ruta_credenciales=ruta_credenciales, alcances=alcances)
+
+    df = df.copy()
+
+    # Asegurar que lat/lon como texto si existiesen con estos nombres habituales
+    for c in ["LATITUD", "LONGITUD", "LATITUDE", "LONGITUDE", "latitud", "longitud"]:
+        if c in df.columns:
+            df[c] = df[c].astype(str)
+
+    # Formatear columnas de fecha/hora
+    for col in df.columns:
+        if is_datetime64_any_dtype(df[col]) or is_datetime64tz_dtype(df[col]):
+            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _a_texto(x):
+        if isinstance(x, (pd.Timestamp, _dt)):
+            return x.strftime("%Y-%m-%d %H:%M:%S")
+        return x
+
+    df = df.applymap(_a_texto).where(pd.notnull(df), None)
+
+    print(f"{hora()}Limpiando hoja '{pestana}' …")
+    _exec_reintentado(
+        servicio.spreadsheets().values().clear(
+            spreadsheetId=spreadsheet_id, range=f"{pestana}!A1:ZZ"
+        )
+    )
+
+    cabecera = list(map(str, df.columns.tolist()))
+    filas = [[("" if v is None else str(v)) for v in fila] for fila in df.to_numpy().tolist()]
+
+    celda_a1 = rango_inicial.replace(f"{pestana}!", "")
+    col_inicio, fila_inicio = _parse_a1(celda_a1)
+
+    rango_cabecera = f"{pestana}!{col_inicio}{fila_inicio}"
+    _exec_reintentado(
+        servicio.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id,
+            range=rango_cabecera,
+            valueInputOption="RAW",
+            body={"values": [cabecera]},
+        )
+    )
+
+    if not filas:
+        print(f"{hora()}No hay filas para subir en '{pestana}'.")
+        return
+
+    fila_datos_inicio = fila_inicio + 1
+    total = len(filas)
+    bloques = math.ceil(total / filas_bloque)
+    print(f"{hora()}Subiendo datos a '{pestana}' en {bloques} bloque(s) de hasta {filas_bloque} fila(s)…")
+
+    for i in range(bloques):
+        i0, i1 = i * filas_bloque, min((i + 1) * filas_bloque, total)
+        bloque = filas[i0:i1]
+        rango_escritura = f"{pestana}!{col_inicio}{fila_datos_inicio + i0}"
+        _exec_reintentado(
+            servicio.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id,
+                range=rango_escritura,
+                valueInputOption="RAW",
+                body={"values": bloque},
+            )
+        )
+        print(f"{hora()}  · Bloque {i+1}/{bloques} ({i1 - i0} filas) OK")
+
+def subir_si_procede(df: pd.DataFrame, pestana: str, activo: bool = True):
+    # Mismas comprobaciones previas que el resto de scripts; nunca aborta el paso
+    if not activo:
+        return
+    if not _GSHEETS_DISPONIBLE:
+        print("AVISO: faltan dependencias de Google Sheets (pip install google-api-python-client google-auth-httplib2 google-auth httplib2)")
+    elif not Path(RUTA_CREDENCIALES).exists():
+        print(f"AVISO: no se encontró el fichero de credenciales en {RUTA_CREDENCIALES}.")
+    else:
+        try:
+            subir_df_a_sheet(
+                df=df,
+                spreadsheet_id=ID_HOJA_CALCULO,
+                rango_inicial=f"{pestana}!A1",
+                pestana=pestana,
+                ruta_credenciales=RUTA_CREDENCIALES,
+                alcances=ALCANCES_SHEETS,
+            )
+            print(f"{hora()}Subida completada en la hoja '{pestana}'.")
+        except Exception as e:
+            print(f"{hora()}ERROR subiendo a Google Sheets: {e}")
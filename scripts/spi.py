@@ -0,0 +1,242 @@
+# spi.py
+# Índice de Precipitación Estandarizado (SPI, McKee et al., 1993) a 1, 3, 6 y 12 meses por
+# estación, a partir de la precipitación diaria del histórico local.
+#
+#  - Estado incremental (spi_estado.npz): sumas y días con dato por estación y mes. En cada
+#    ejecución solo se recalculan los meses que tocan los días nuevos.
+#  - Acumulados de k meses con sumas acumuladas sobre el eje de meses (todas las estaciones).
+#  - Ajuste gamma por estación, mes de calendario y escala con la aproximación de Thom
+#    (máxima verosimilitud), con probabilidad de cero aparte; todo vectorizado.
+#
+# Uso:  python spi.py
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammainc, ndtri
+
+from estaciones import RUTA_BASE, registro
+from normales import RUTA_HISTORICO
+from sheets import subir_si_procede
+
+# =========================
+# Parámetros
+# =========================
+ESCALAS = (1, 3, 6, 12)
+MIN_ANIOS_AJUSTE = 10        # años con acumulado válido exigidos para ajustar la gamma
+MAX_DIAS_FALTANTES = 3       # un mes con más huecos no se considera completo
+REPASO_DIAS = 40             # días hacia atrás que se reincorporan (datos que llegan tarde)
+RUTA_ESTADO = Path(RUTA_BASE) / "complementarios_aemet" / "spi_estado.npz"
+SALIDA_XLSX = Path(RUTA_BASE) / "SPI_LLUVIAS.xlsx"
+SUBIR_A_SHEETS = True
+NOMBRE_PESTANA = "spi"
+
+CORTES_SPI = [-np.inf, -2, -1.5, -1, 1, 1.5, 2, np.inf]
+CLASES_SPI = ["Sequía extrema", "Sequía severa", "Sequía moderada", "Normal",
+              "Moderadamente húmedo", "Muy húmedo", "Extremadamente húmedo"]
+
+
+# =========================
+# Estado: sumas mensuales
+# =========================
+class SumasMensuales:
+    def __init__(self, anio0: int, sumas: np.ndarray, dias: np.ndarray, ultimo_dia: np.datetime64 | None,
+                 fecha_min: np.datetime64 | None = None, filas_previas: int = -1):
+        self.anio0 = anio0
+        self.sumas = sumas          # (estaciones, meses) float64
+        self.dias = dias            # (estaciones, meses) int16 días con dato
+        self.ultimo_dia = ultimo_dia
+        # Huella del histórico ya incorporado: primer día y filas anteriores al repaso siguiente
+        self.fecha_min = fecha_min
+        self.filas_previas = filas_previas
+
+    @property
+    def n_meses(self) -> int:
+        return self.sumas.shape[1]
+
+    def indice_mes(self, fechas: pd.DatetimeIndex) -> np.ndarray:
+        return (fechas.year.to_numpy() - self.anio0) * 12 + fechas.month.to_numpy() - 1
+
+    def _ampliar(self, n_estaciones: int, n_meses: int):
+        e, m = self.sumas.shape
+        if n_estaciones > e or n_meses > m:
+            sumas = np.zeros((max(e, n_estaciones), max(m, n_meses)))
+            dias = np.zeros(sumas.shape, dtype="int16")
+            sumas[:e, :m], dias[:e, :m] = self.sumas, self.dias
+            self.sumas, self.dias = sumas, dias
+
+    def incorporar(self, diarios: pd.DataFrame, n_estaciones: int):
+        """Recalcula por completo los meses en los que caen los días recibidos."""
+        fechas = pd.DatetimeIndex(pd.to_datetime(diarios["fecha"], errors="coerce"))
+        prec = pd.to_numeric(diarios["prec"], errors="coerce").to_numpy(dtype="float64")
+        ids = diarios["id_estacion"].to_numpy(dtype="int64")
+        ok = ~fechas.isna() & (ids >= 0)
+        if not ok.any():
+            return
+        fechas, prec, ids = fechas[ok], prec[ok], ids[ok]
+        mes = self.indice_mes(fechas)
+        self._ampliar(max(n_estaciones, int(ids.max()) + 1), int(mes.max()) + 1)
+        tocados = np.unique(mes)
+        plano = ids * self.n_meses + mes
+        con_dato = np.isfinite(prec)
+        sumas = np.bincount(plano[con_dato], weights=prec[con_dato], minlength=self.sumas.size)
+        dias = np.bincount(plano[con_dato], minlength=self.sumas.size)
+        self.sumas[:, tocados] = sumas.reshape(self.sumas.shape)[:, tocados]
+        self.dias[:, tocados] = dias.reshape(self.dias.shape)[:, tocados]
+        ultimo = fechas.max().to_datetime64()
+        self.ultimo_dia = ultimo if self.ultimo_dia is None or pd.isna(self.ultimo_dia) else max(self.ultimo_dia, ultimo)
+
+    def guardar(self, ruta: Path = RUTA_ESTADO):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(ruta, anio0=np.int64(self.anio0), sumas=self.sumas, dias=self.dias,
+                            ultimo_dia=np.array(self.ultimo_dia, dtype="datetime64[D]"),
+                            fecha_min=np.array(self.fecha_min, dtype="datetime64[D]"),
+                            filas_previas=np.int64(self.filas_previas))
+
+    @classmethod
+    def cargar(cls, ruta: Path = RUTA_ESTADO) -> "SumasMensuales | None":
+        if not ruta.exists():
+            return None
+        with np.load(ruta) as z:
+            if "fecha_min" not in z.files:      # estado anterior sin huella: se reconstruye
+                return None
+            return cls(int(z["anio0"]), z["sumas"], z["dias"], np.datetime64(z["ultimo_dia"][()], "ns"),
+                       np.datetime64(z["fecha_min"][()], "ns"), int(z["filas_previas"]))
+
+
+def _inicio_repaso(ultimo_dia) -> pd.Timestamp:
+    return (pd.Timestamp(ultimo_dia) - pd.Timedelta(days=REPASO_DIAS)).replace(day=1)
+
+
+def actualizar_estado(diarios: pd.DataFrame, n_estaciones: int) -> SumasMensuales:
+    fechas = pd.to_datetime(diarios["fecha"], errors="coerce")
+    fecha_min = fechas.min().to_datetime64()
+    estado = SumasMensuales.cargar()
+    if estado is not None:
+        # Solo los meses con días posteriores al último incorporado (menos un margen de repaso);
+        # esos meses se reconstruyen enteros con todos sus días del histórico
+        desde = _inicio_repaso(estado.ultimo_dia)
+        # Si el histórico ganó días antiguos (p. ej. normales.py --rellenar), se rehace todo
+        if fecha_min < estado.fecha_min or int((fechas < desde).sum()) != estado.filas_previas:
+            print("El histórico cambió antes del repaso: se reconstruye el estado del SPI.")
+            estado = None
+    if estado is None:
+        anio0 = int(fechas.dt.year.min())
+        estado = SumasMensuales(anio0, np.zeros((n_estaciones, 0)), np.zeros((n_estaciones, 0), dtype="int16"), None)
+        nuevos = diarios
+    else:
+        nuevos = diarios[(fechas >= desde).to_numpy()]
+    estado.incorporar(nuevos, n_estaciones)
+    estado.fecha_min = fecha_min
+    estado.filas_previas = int((fechas < _inicio_repaso(estado.ultimo_dia)).sum())
+    estado.guardar()
+    return estado
+
+
+# =========================
+# Cálculo del SPI
+# =========================
+def meses_completos(estado: SumasMensuales) -> np.ndarray:
+    """Sumas mensuales con NaN en los meses incompletos."""
+    primer_dia = pd.date_range(f"{estado.anio0}-01-01", periods=estado.n_meses, freq="MS")
+    dias_mes = primer_dia.days_in_month.to_numpy()
+    completos = estado.dias >= (dias_mes - MAX_DIAS_FALTANTES)[None, :]
+    return np.where(completos, estado.sumas, np.nan)
+
+
+def acumulado(mensual: np.ndarray, k: int) -> np.ndarray:
+    # Suma móvil de k meses; NaN si falta cualquiera de ellos
+    validos = np.isfinite(mensual)
+    cs = np.pad(np.cumsum(np.where(validos, mensual, 0.0), axis=1), ((0, 0), (1, 0)))
+    cv = np.pad(np.cumsum(validos, axis=1), ((0, 0), (1, 0)))
+    out = np.full(mensual.shape, np.nan)
+    out[:, k - 1:] = cs[:, k:] - cs[:, :-k]
+    out[:, k - 1:][(cv[:, k:] - cv[:, :-k]) < k] = np.nan
+    return out
+
+
+def ajustar_gamma(acum: np.ndarray):
+    """Parámetros por (estación, mes de calendario): prob. de cero, alfa y beta (Thom)."""
+    e, m = acum.shape
+    anios = -(-m // 12)
+    x = np.full((e, anios * 12), np.nan)
+    x[:, :m] = acum
+    x = x.reshape(e, anios, 12)
+    validos = np.isfinite(x)
+    n = validos.sum(axis=1)
+    positivos = validos & (x > 0)
+    n_pos = positivos.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q = (n - n_pos) / n
+        media = np.where(positivos, x, 0.0).sum(axis=1) / n_pos
+        media_log = np.where(positivos, np.log(np.where(positivos, x, 1.0)), 0.0).sum(axis=1) / n_pos
+        a = np.log(media) - media_log
+        alfa = (1 + np.sqrt(1 + 4 * a / 3)) / (4 * a)
+        beta = media / alfa
+    insuficiente = (n < MIN_ANIOS_AJUSTE) | (n_pos < 3) | ~np.isfinite(alfa)
+    for arr in (q, alfa, beta):
+        arr[insuficiente] = np.nan
+    return q, alfa, beta
+
+
+def spi(acum: np.ndarray, q: np.ndarray, alfa: np.ndarray, beta: np.ndarray) -> np.ndarray:
+    # El eje de meses empieza en enero: el mes de calendario es el índice módulo 12
+    cal = np.arange(acum.shape[1]) % 12
+    qa, aa, ba = q[:, cal], alfa[:, cal], beta[:, cal]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = qa + (1 - qa) * gammainc(aa, np.where(acum > 0, acum, 0.0) / ba)
+    p = np.where(acum == 0, qa, p)
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.where(np.isfinite(acum) & np.isfinite(aa), ndtri(p), np.nan)
+
+
+def tabla_spi(estado: SumasMensuales, escalas=ESCALAS) -> tuple[pd.DataFrame, pd.Timestamp | None]:
+    mensual = meses_completos(estado)
+    # Último mes con datos completos en alguna estación
+    con_dato = np.isfinite(mensual).any(axis=0)
+    if not con_dato.any():
+        print("AVISO: aún no hay ningún mes completo en el histórico; no se calcula el SPI.")
+        return pd.DataFrame(), None
+    ultimo = int(np.flatnonzero(con_dato).max())
+    mes_ref = pd.Timestamp(f"{estado.anio0}-01-01") + pd.DateOffset(months=ultimo)
+
+    reg = registro().a_dataframe()
+    df = reg.iloc[: mensual.shape[0]].copy()
+    for k in escalas:
+        acum = acumulado(mensual, k)
+        q, alfa, beta = ajustar_gamma(acum)
+        valores = spi(acum, q, alfa, beta)[:, ultimo]
+        df[f"spi_{k}"] = np.round(valores, 2)
+        df[f"acumulado_{k}m"] = np.round(acum[:, ultimo], 1)
+        df[f"clase_spi_{k}"] = pd.cut(valores, bins=CORTES_SPI, labels=CLASES_SPI).astype(object)
+    df = df[df[[f"spi_{k}" for k in escalas]].notna().any(axis=1)]
+    df.insert(1, "mes", mes_ref.strftime("%Y-%m"))
+    return df.reset_index(drop=True), mes_ref
+
+
+def main():
+    if not RUTA_HISTORICO.exists():
+        print(f"AVISO: no hay histórico diario en {RUTA_HISTORICO}; no se calcula el SPI.")
+        return
+    diarios = pd.read_pickle(RUTA_HISTORICO)[["id_estacion", "fecha", "prec"]]
+    estado = actualizar_estado(diarios, n_estaciones=len(registro()))
+    df, mes_ref = tabla_spi(estado)
+    if mes_ref is None:
+        return
+    print(f"SPI de {mes_ref:%Y-%m}: {len(df)} estaciones")
+    for k in ESCALAS:
+        print(f"  · SPI-{k}: " + ", ".join(f"{c} {n}" for c, n in df[f"clase_spi_{k}"].value_counts().items()))
+
+    df["fecha_actualizado"] = datetime.now().strftime("%d/%m/%Y")
+    df.to_excel(SALIDA_XLSX, index=False)
+    print("Exportado:", SALIDA_XLSX)
+    subir_si_procede(df, NOMBRE_PESTANA, activo=SUBIR_A_SHEETS)
+
+
+if __name__ == "__main__":
+    t0 = datetime.now()
+    main()
+    print(f"Tiempo: {(datetime.now() - t0).total_seconds():.1f}s")
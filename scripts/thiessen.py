@@ -0,0 +1,149 @@
+# thiessen.py
+# Pesos de área por estación (polígonos de Thiessen / Voronoi) para los agregados nacionales y
+# por comunidad autónoma. La partición se hace una vez por conjunto de estaciones: celdas de
+# Voronoi en una proyección de áreas iguales (EPSG:3035), recortadas a tierra con las zonas de
+# avisos y troceadas por comunidad. Cada trozo guarda su estación, su comunidad y su área.
+#
+# Cada día solo se recalcula lo que cubrían las estaciones sin dato: sus trozos se reparten
+# entre las estaciones con dato más cercanas con un Voronoi local de esas pocas estaciones.
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from estaciones import RUTA_BASE
+from zonas import cargar_zonas, firma_zonas
+
+# =========================
+# Configuración
+# =========================
+CRS_AREAS = 3035
+DIR_CACHE = Path(RUTA_BASE) / "complementarios_aemet" / "cache_thiessen"
+VECINOS_REPARTO = 8      # estaciones con dato entre las que se reparte cada estación sin dato
+
+
+def _celdas_voronoi(x: np.ndarray, y: np.ndarray, limite):
+    """Celda de Voronoi (sin recortar) de cada punto, en el orden de los puntos."""
+    import shapely
+    puntos = shapely.points(x, y)
+    celdas = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(puntos), extend_to=limite))
+    # El orden de salida de GEOS no es el de entrada: cada celda contiene exactamente un punto
+    celda, punto = shapely.STRtree(puntos).query(celdas, predicate="contains")
+    out = np.full(len(puntos), None, dtype=object)
+    out[punto] = celdas[celda]
+    return out
+
+
+def _trocear(ids: np.ndarray, celdas: np.ndarray, comunidades) -> pd.DataFrame:
+    # Intersección celda × comunidad solo para los pares que se tocan (STRtree)
+    import shapely
+    validas = np.array([c is not None for c in celdas], dtype=bool)
+    ids, celdas = ids[validas], celdas[validas].astype(object)
+    i_celda, i_ccaa = shapely.STRtree(comunidades.geometry.to_numpy()).query(celdas, predicate="intersects")
+    trozos = shapely.intersection(celdas[i_celda], comunidades.geometry.to_numpy()[i_ccaa])
+    area = shapely.area(trozos) / 1e6
+    ok = area > 0
+    return pd.DataFrame({
+        "id_estacion": ids[i_celda[ok]].astype("int32"),
+        "cod_ccaa": comunidades["cod_ccaa"].to_numpy()[i_ccaa[ok]],
+        "ccaa": comunidades["ccaa"].to_numpy()[i_ccaa[ok]],
+        "area_km2": area[ok],
+        "geometry": trozos[ok],
+    })
+
+
+class TeselasThiessen:
+    def __init__(self, trozos: pd.DataFrame, ids: np.ndarray, x: np.ndarray, y: np.ndarray):
+        self.trozos = trozos       # id_estacion, cod_ccaa, ccaa, area_km2, geometry (EPSG:3035)
+        self.ids = ids             # estaciones de la partición y sus coordenadas proyectadas
+        self.x = x
+        self.y = y
+
+    @staticmethod
+    def clave(ids: np.ndarray, lon: np.ndarray, lat: np.ndarray) -> str:
+        h = hashlib.sha1(f"{CRS_AREAS}|{firma_zonas()}".encode())
+        for arr in (np.asarray(ids, dtype="int32"), np.asarray(lon, dtype="float32"), np.asarray(lat, dtype="float32")):
+            h.update(arr.tobytes())
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def construir(cls, ids, lon, lat) -> "TeselasThiessen":
+        import geopandas as gpd
+        import shapely
+        ids = np.asarray(ids, dtype="int32")
+        pts = gpd.GeoSeries(gpd.points_from_xy(lon, lat), crs=4326).to_crs(CRS_AREAS)
+        x, y = pts.x.to_numpy(), pts.y.to_numpy()
+        comunidades = cargar_zonas().to_crs(CRS_AREAS).dissolve(by=["cod_ccaa", "ccaa"], as_index=False)
+        # Estaciones con las mismas coordenadas: la celda es de la primera
+        _, unicas = np.unique(np.round(np.column_stack([x, y]), 0), axis=0, return_index=True)
+        unicas = np.sort(unicas)
+        celdas = np.full(len(ids), None, dtype=object)
+        celdas[unicas] = _celdas_voronoi(x[unicas], y[unicas], shapely.box(*comunidades.total_bounds).buffer(1e5))
+        return cls(_trocear(ids, celdas, comunidades), ids, x, y)
+
+    # ---------- persistencia ----------
+    @classmethod
+    def para(cls, ids, lon, lat, dir_cache: Path = DIR_CACHE) -> "TeselasThiessen":
+        """Partición de ese conjunto de estaciones, desde la caché si ya se calculó."""
+        ruta = Path(dir_cache) / f"thiessen_{cls.clave(ids, lon, lat)}.pkl"
+        if ruta.exists():
+            return pd.read_pickle(ruta)
+        teselas = cls.construir(ids, lon, lat)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle(teselas, ruta)
+        return teselas
+
+    # ---------- pesos del día ----------
+    def pesos(self, ids_con_dato) -> pd.DataFrame:
+        """Área (km²) por estación con dato y comunidad. Los trozos de las estaciones sin dato se
+        reparten con un Voronoi local entre sus VECINOS_REPARTO estaciones con dato más cercanas."""
+        con_dato = np.isin(self.ids, np.asarray(ids_con_dato, dtype="int64"))
+        presentes = self.trozos["id_estacion"].isin(self.ids[con_dato]).to_numpy()
+        base = self.trozos.loc[presentes, ["id_estacion", "cod_ccaa", "ccaa", "area_km2"]]
+        huecos = self.trozos.loc[~presentes]
+        if huecos.empty or not con_dato.any():
+            return base.groupby(["id_estacion", "cod_ccaa", "ccaa"], as_index=False, observed=True)["area_km2"].sum()
+
+        import shapely
+        ausentes = np.flatnonzero(np.isin(self.ids, huecos["id_estacion"].unique()))
+        candidatas = np.flatnonzero(con_dato)
+        k = min(VECINOS_REPARTO, len(candidatas))
+        _, vecinas = cKDTree(np.column_stack([self.x[candidatas], self.y[candidatas]])).query(
+            np.column_stack([self.x[ausentes], self.y[ausentes]]), k=k)
+        locales = candidatas[np.unique(np.asarray(vecinas).ravel())]
+        geoms = huecos["geometry"].to_numpy()
+        limite = shapely.box(*shapely.total_bounds(geoms)).buffer(1e5)
+        if len(locales) == 1:
+            celdas = np.array([limite], dtype=object)
+        else:
+            celdas = _celdas_voronoi(self.x[locales], self.y[locales], limite)
+        i_hueco, i_celda = shapely.STRtree(celdas).query(geoms, predicate="intersects")
+        area = shapely.area(shapely.intersection(geoms[i_hueco], celdas[i_celda])) / 1e6
+        reparto = pd.DataFrame({
+            "id_estacion": self.ids[locales][i_celda].astype("int32"),
+            "cod_ccaa": huecos["cod_ccaa"].to_numpy()[i_hueco],
+            "ccaa": huecos["ccaa"].to_numpy()[i_hueco],
+            "area_km2": area,
+        })
+        return pd.concat([base, reparto], ignore_index=True) \
+            .groupby(["id_estacion", "cod_ccaa", "ccaa"], as_index=False, observed=True)["area_km2"].sum()
+
+    def media(self, ids, valores, por_ccaa: bool = False):
+        """Media de ``valores`` (uno por estación de ``ids``) ponderada por el área que cubre cada
+        estación con dato: un número para España o una tabla (cod_ccaa, ccaa, valor, area_km2)."""
+        ids = np.asarray(ids, dtype="int64")
+        valores = np.asarray(valores, dtype="float64")
+        ok = np.isfinite(valores)
+        p = self.pesos(ids[ok])
+        p = p.assign(valor=pd.Series(valores[ok], index=ids[ok]).reindex(p["id_estacion"].to_numpy()).to_numpy())
+        p = p[np.isfinite(p["valor"])]
+        if not por_ccaa:
+            return float(np.average(p["valor"], weights=p["area_km2"])) if len(p) else np.nan
+        p = p.assign(ponderado=p["valor"] * p["area_km2"])
+        g = p.groupby(["cod_ccaa", "ccaa"], as_index=False)[["ponderado", "area_km2"]].sum()
+        g["valor"] = g["ponderado"] / g["area_km2"]
+        return g[["cod_ccaa", "ccaa", "valor", "area_km2"]]
@@ -0,0 +1,106 @@
+# zonas.py
+# Zonas de avisos AEMET (meteoalerta) en tierra: geometrías en EPSG:4326 con su provincia y
+# comunidad autónoma. Es la delimitación de España que usan las capas espaciales de los paneles.
+#
+# Asignación estación → zona de aviso (y zona costera cercana) con consultas STRtree de punto
+# en polígono para toda la red de una vez, cacheada por versión del registro de estaciones.
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RUTA_ZONAS = Path(
+    "/Users/miguel.ros/Desktop/PANEL_LLUVIAS/delimitacion_zonas/zonas/"
+    "AEMET-meteoalerta-v6-zonas-32630.shp"
+)
+DIR_CACHE = Path("/Users/miguel.ros/Desktop/PANEL_LLUVIAS/complementarios_aemet/cache_zonas/")
+TOLERANCIA_GRADOS = 0.02       # estaciones en la línea de costa que caen justo fuera del polígono
+DISTANCIA_COSTA_GRADOS = 0.05  # estaciones a menos de ~5 km de una zona costera la reciben
+SIN_ZONA = -1
+
+_ZONAS = None
+
+
+def cargar_zonas(ruta: Path = RUTA_ZONAS):
+    global _ZONAS
+    if _ZONAS is None:
+        import geopandas as gpd
+        zonas = gpd.read_file(ruta)
+        zonas = zonas[~zonas.geometry.isna()].to_crs(4326).reset_index(drop=True)
+        zonas = zonas.rename(columns={"COD_Z": "cod_zona", "NOM_Z": "zona", "COD_PROV": "cod_provincia",
+                                      "NOM_PROV": "provincia", "COD_CCAA": "cod_ccaa", "NOM_CCAA": "ccaa"})
+        _ZONAS = zonas[["cod_zona", "zona", "cod_provincia", "provincia", "cod_ccaa", "ccaa", "geometry"]]
+    return _ZONAS
+
+
+def firma_zonas(ruta: Path = RUTA_ZONAS) -> str:
+    # Cambia si se sustituye la delimitación (invalida las cachés que dependen de ella)
+    st = Path(ruta).stat()
+    return f"{st.st_size}|{int(st.st_mtime)}"
+
+
+def asignar_puntos(lon, lat, geometrias, tolerancia: float = 0.0) -> np.ndarray:
+    """Índice de la geometría que contiene cada punto (SIN_ZONA si ninguna). Con ``tolerancia``,
+    los puntos que no caen en ninguna toman la más cercana a esa distancia (en grados)."""
+    import shapely
+    lon, lat = np.asarray(lon, dtype="float64"), np.asarray(lat, dtype="float64")
+    out = np.full(len(lon), SIN_ZONA, dtype="int32")
+    validos = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    puntos = shapely.points(lon[validos], lat[validos])
+    arbol = shapely.STRtree(np.asarray(geometrias))
+    i_punto, i_geom = arbol.query(puntos, predicate="within")
+    out[validos[i_punto]] = i_geom
+    resto = np.flatnonzero(out[validos] == SIN_ZONA)
+    if tolerancia > 0 and len(resto):
+        i_punto, i_geom = arbol.query_nearest(puntos[resto], max_distance=tolerancia, all_matches=False)
+        out[validos[resto[i_punto]]] = i_geom
+    return out
+
+
+def zonas_de_estaciones(reg=None, dir_cache: Path = DIR_CACHE) -> pd.DataFrame:
+    """Zona de aviso, provincia y comunidad de cada estación del registro (una fila por
+    id_estacion), más la zona costera más próxima si está cerca del mar."""
+    from estaciones import registro
+    from mar_zonas import RUTA_ZONAS_COSTERAS, cargar_zonas_costeras
+    reg = reg or registro()
+    zonas = cargar_zonas()
+    costeras = cargar_zonas_costeras()
+    firma = hashlib.sha1(f"{firma_zonas()}|{firma_zonas(RUTA_ZONAS_COSTERAS)}".encode()).hexdigest()[:8]
+    cache = Path(dir_cache) / f"estaciones_{reg.version}_{firma}.npz"
+    if cache.exists():
+        with np.load(cache) as z:
+            zona, costera = z["zona"], z["costera"]
+    else:
+        zona = asignar_puntos(reg.lon, reg.lat, zonas.geometry.to_numpy(), TOLERANCIA_GRADOS)
+        costera = asignar_puntos(reg.lon, reg.lat, costeras.geometry.to_numpy(), DISTANCIA_COSTA_GRADOS)
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(cache, zona=zona, costera=costera)
+
+    def _tomar(tabla, idx, columnas):
+        t = tabla[columnas].reset_index(drop=True)
+        t = t.reindex(np.where(idx >= 0, idx, len(t))).reset_index(drop=True)
+        return t
+
+    out = _tomar(zonas, zona, ["cod_zona", "zona", "provincia", "ccaa"])
+    out.columns = ["cod_zona", "zona", "provincia_zona", "ccaa"]
+    cost = _tomar(costeras, costera, ["cod_zona", "zona"])
+    out["cod_zona_costera"], out["zona_costera"] = cost["cod_zona"].to_numpy(), cost["zona"].to_numpy()
+    out.insert(0, "id_estacion", np.arange(len(reg), dtype="int32"))
+    return out
+
+
+def anadir_zonas(df: pd.DataFrame, columnas=("cod_zona", "zona", "ccaa")) -> pd.DataFrame:
+    """Añade a una tabla con 'id_estacion' su zona de aviso y comunidad autónoma."""
+    if "id_estacion" not in df.columns or df.empty:
+        return df
+    tabla = zonas_de_estaciones().set_index("id_estacion")[list(columnas)]
+    ids = df["id_estacion"].to_numpy(dtype="int64")
+    valores = tabla.reindex(ids)
+    df = df.drop(columns=[c for c in columnas if c in df.columns])
+    for c in columnas:
+        df[c] = valores[c].to_numpy()
+    return df